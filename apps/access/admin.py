@@ -5,7 +5,7 @@ Access admin
 from django.contrib import admin
 from django import forms
 from django.contrib import messages
-from .models import NFCCard, PINCode, GuestAccess
+from .models import NFCCard, PINCode, GuestAccess, SigningKey, DigitalKey
 
 
 @admin.register(NFCCard)
@@ -308,4 +308,46 @@ class GuestAccessAdmin(admin.ModelAdmin):
             messages.warning(
                 request,
                 f'⚠️ MUHIM: PIN "{pin}" faqat hozir ko\'rsatiladi. Keyinchalik ko\'ra olmaysiz!'
-            )
\ No newline at end of file
+            )
+
+
+@admin.register(SigningKey)
+class SigningKeyAdmin(admin.ModelAdmin):
+    """
+    Digital key signing key admin (private key never shown)
+    """
+    list_display = ['key_id', 'is_active', 'retired_at', 'created_at']
+    list_filter = ['is_active']
+    search_fields = ['key_id']
+    exclude = ['private_key']
+    readonly_fields = ['id', 'key_id', 'public_key', 'endorsement', 'is_active', 'retired_at', 'created_at', 'updated_at']
+
+    def has_add_permission(self, request):
+        # Created by rotation only (manage.py rotate_signing_key)
+        return False
+
+
+@admin.register(DigitalKey)
+class DigitalKeyAdmin(admin.ModelAdmin):
+    """
+    Offline digital key admin
+    """
+    list_display = [
+        'device',
+        'user',
+        'permissions',
+        'valid_until',
+        'revoked_at',
+        'is_valid',
+        'created_at',
+    ]
+    list_filter = ['revoked_at', 'created_at']
+    search_fields = ['device__name', 'user__email']
+    readonly_fields = [
+        'id', 'device', 'user', 'signing_key', 'permissions', 'holder_public_key',
+        'valid_from', 'valid_until', 'revoked_at', 'revoked_reason', 'created_at', 'updated_at'
+    ]
+
+    def has_add_permission(self, request):
+        # Issued through the API only (the token is returned once)
+        return False
@@ -0,0 +1,294 @@
+"""
+Credential sync to locks
+Locks keep a compact, signed copy of their active PIN / NFC credentials so
+most verifications are decided on the lock; uses are reported afterwards
+through event batch uploads (see ingest).
+
+Bundles are versioned per device. A lock acknowledges the version it
+applied on device/{device_id}/credentials/ack (also on boot, with the
+version it holds or 0), and the backend answers with a delta from that
+version, or the full set when it no longer has the acknowledged version.
+
+Entries are keyed digests, never PIN hashes or raw NFC UIDs:
+
+    digest = HMAC-SHA256(device_secret, "pin:" + sha256_hex(pin))[:8 bytes]
+    digest = HMAC-SHA256(device_secret, "nfc:" + UID)[:8 bytes]
+
+(UID uppercase without spaces.) Each entry is a list:
+[digest, credential id, valid_from, valid_until, uses_left], timestamps as
+Unix seconds and 0 / -1 meaning unbounded.
+
+Messages are JWTs signed with the digital key signing key (typ "cred"):
+{
+    "aud": "<device id>",
+    "ver": 12,
+    "base": 10,                 # only in deltas
+    "sv": 3,                    # device secret version of the digests
+    "entries": [...],           # full set
+    "upsert": [...], "remove": ["<digest>", ...]    # delta
+}
+"""
+
+import hashlib
+import hmac
+import json
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from apps.devices.models import Device
+from mqtt.client import mqtt_publish
+from mqtt.topics import MQTTTopics
+from .digital_keys import get_active_signing_key, sign_token
+from .models import CredentialBundle, NFCCard, PINCode
+from .revocation import record_enforcement_latency
+from .snapshot import normalize_nfc_uid
+
+logger = logging.getLogger(__name__)
+
+DIGEST_BYTES = 8
+
+
+def credential_digest(device_secret, kind, value):
+    """
+    Keyed digest of a credential as stored on the lock
+
+    Args:
+        device_secret: Device secret (HMAC key)
+        kind: 'pin' or 'nfc'
+        value: PIN hash (sha256 hex) or normalized NFC UID
+    """
+    mac = hmac.new(device_secret.encode(), f"{kind}:{value}".encode(), hashlib.sha256)
+    return mac.hexdigest()[:DIGEST_BYTES * 2]
+
+
+def _timestamp(value, default):
+    return int(value.timestamp()) if value is not None else default
+
+
+def _entry(digest, credential):
+    uses_left = -1
+    if credential['max_usage']:
+        uses_left = max(0, credential['max_usage'] - credential['usage_count'])
+    return [
+        digest,
+        credential['id'].hex,
+        _timestamp(credential['valid_from'], 0),
+        _timestamp(credential['valid_until'], 0),
+        uses_left,
+    ]
+
+
+def build_credential_entries(device):
+    """
+    Bundle entries for the active credentials of a device, sorted by digest
+
+    Args:
+        device: Device loaded with device_secret
+    """
+    now = timezone.now()
+    fields = ('id', 'valid_from', 'valid_until', 'usage_count', 'max_usage')
+    entries = []
+
+    pins = PINCode.objects.filter(device=device, is_active=True).values(*fields, 'pin_hash')
+    for pin in pins:
+        if pin['valid_until'] is None or pin['valid_until'] > now:
+            entries.append(_entry(credential_digest(device.device_secret, 'pin', pin['pin_hash']), pin))
+
+    cards = NFCCard.objects.filter(device=device, is_active=True).values(*fields, 'uid')
+    for card in cards:
+        if card['valid_until'] is None or card['valid_until'] > now:
+            digest = credential_digest(device.device_secret, 'nfc', normalize_nfc_uid(card['uid']))
+            entries.append(_entry(digest, card))
+
+    entries.sort()
+    return entries
+
+
+def diff_entries(base_entries, entries):
+    """
+    Delta turning base_entries into entries
+
+    Returns:
+        tuple: (entries to add or replace, digests to remove)
+    """
+    base = {entry[0]: entry for entry in base_entries}
+    current = {entry[0]: entry for entry in entries}
+    upsert = [entry for digest, entry in current.items() if base.get(digest) != entry]
+    remove = sorted(digest for digest in base if digest not in current)
+    return sorted(upsert), remove
+
+
+def update_credential_bundle(device):
+    """
+    Store a new bundle version if the device's credentials changed
+
+    Returns:
+        CredentialBundle: Latest bundle (new or unchanged)
+    """
+    entries = build_credential_entries(device)
+
+    with transaction.atomic():
+        # Serializes version numbers per device
+        Device.objects.select_for_update().only('id').get(pk=device.pk)
+
+        latest = CredentialBundle.objects.filter(device=device).first()
+        if (latest is not None and latest.entries == entries
+                and latest.secret_version == device.secret_version):
+            return latest
+
+        return CredentialBundle.objects.create(
+            device=device,
+            version=latest.version + 1 if latest is not None else 1,
+            secret_version=device.secret_version,
+            entries=entries
+        )
+
+
+def build_sync_message(device, bundle, base=None):
+    """
+    Signed sync message for a bundle: a delta against base when possible,
+    the full set otherwise (or when the delta would not be smaller)
+    """
+    claims = {
+        'typ': 'cred',
+        'aud': str(device.pk),
+        'ver': bundle.version,
+        'sv': bundle.secret_version,
+    }
+
+    if base is not None and base.secret_version == bundle.secret_version:
+        upsert, remove = diff_entries(base.entries, bundle.entries)
+        if len(upsert) + len(remove) < len(bundle.entries):
+            claims.update({'base': base.version, 'upsert': upsert, 'remove': remove})
+            return sign_token(get_active_signing_key(), claims)
+
+    claims['entries'] = bundle.entries
+    return sign_token(get_active_signing_key(), claims)
+
+
+def send_credential_sync(device, bundle, base_version=None):
+    """
+    Publish a bundle to a device, as a delta from base_version when the
+    backend still has that version
+
+    Returns:
+        bool: True if published
+    """
+    base = None
+    if base_version:
+        base = CredentialBundle.objects.filter(device=device, version=base_version).first()
+
+    topic = MQTTTopics.get_credentials_topic(device.device_id)
+    published = mqtt_publish(topic, json.dumps({'bundle': build_sync_message(device, bundle, base)}))
+
+    logger.info(
+        f"Credential bundle v{bundle.version} sent to {device.device_id}"
+        + (f" (delta from v{base.version})" if base is not None else ' (full)')
+    )
+    return published
+
+
+def sync_credentials(device, revoked_at=None):
+    """
+    Store a new bundle version if needed and send it to the lock, as a
+    delta from the version it acknowledged
+
+    Args:
+        device: Device loaded with Device.VERIFY_FIELDS
+        revoked_at: Time of the earliest revocation being pushed (optional)
+
+    Returns:
+        dict: success, version
+    """
+    acked_version = CredentialBundle.objects.filter(
+        device=device,
+        acked_at__isnull=False
+    ).values_list('version', flat=True).first()
+
+    bundle = update_credential_bundle(device)
+    if bundle.version == acked_version:
+        return {'success': True, 'version': bundle.version}
+
+    if revoked_at is not None and bundle.revoked_at is None:
+        CredentialBundle.objects.filter(pk=bundle.pk, revoked_at__isnull=True).update(revoked_at=revoked_at)
+
+    published = send_credential_sync(device, bundle, base_version=acked_version)
+    return {'success': published, 'version': bundle.version}
+
+
+def get_sync_pending_key(device_pk):
+    return f"credential_sync_pending:{device_pk}"
+
+
+def schedule_credential_sync(device_pk):
+    """
+    Sync the device's credentials after a short batching window
+    Changes made before the sync runs go out in the same version.
+    """
+    window = getattr(settings, 'CREDENTIAL_SYNC_BATCH_SECONDS', 5)
+    try:
+        # Cleared by the sync task; the TTL only covers a lost task
+        first = cache.add(get_sync_pending_key(device_pk), 1, window + 60)
+    except Exception as e:
+        logger.warning(f"Credential sync batching unavailable, syncing now: {str(e)}")
+        first, window = True, 0
+
+    if first:
+        transaction.on_commit(lambda: _queue_credential_sync(device_pk, window))
+
+
+def _queue_credential_sync(device_pk, countdown):
+    from .tasks import sync_device_credentials
+    try:
+        sync_device_credentials.apply_async(args=[str(device_pk)], countdown=countdown)
+    except Exception as e:
+        # The change is committed; the lock catches up on its next ack
+        logger.error(f"Failed to queue credential sync for device {device_pk}: {str(e)}")
+        try:
+            cache.delete(get_sync_pending_key(device_pk))
+        except Exception:
+            pass
+
+
+def acknowledge_credential_bundle(device, version):
+    """
+    Record the bundle version a lock has applied and send it what is newer
+
+    Args:
+        device: Authenticated Device
+        version: Version held by the lock (0 when it holds none)
+
+    Returns:
+        CredentialBundle or None: Latest bundle, if one was sent
+    """
+    if version:
+        now = timezone.now()
+        revocations = list(CredentialBundle.objects.filter(
+            device=device,
+            version__lte=version,
+            acked_at__isnull=True,
+            revoked_at__isnull=False
+        ).values_list('revoked_at', flat=True))
+
+        acked = CredentialBundle.objects.filter(
+            device=device,
+            version=version,
+            acked_at__isnull=True
+        ).update(acked_at=now)
+        if acked:
+            for revoked_at in revocations:
+                record_enforcement_latency(device, (now - revoked_at).total_seconds() * 1000)
+
+            # Deltas are only built from the acknowledged version onwards
+            CredentialBundle.objects.filter(device=device, version__lt=version).delete()
+
+    latest = update_credential_bundle(device)
+    if latest.version == version:
+        return None
+
+    send_credential_sync(device, latest, base_version=version)
+    return latest
@@ -0,0 +1,471 @@
+"""
+Degraded-mode verification infrastructure
+Keeps door verification answering within a deadline when Postgres stalls:
+
+- verify DB work runs on a small thread pool and is abandoned at the
+  deadline instead of blocking the request up to connect_timeout
+- a circuit breaker stops sending verify traffic to a failing database
+- decisions made from credential snapshots are spooled to local disk and
+  replayed through batch ingestion once the database recovers
+"""
+
+import fcntl
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as DeadlineExceeded
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection, close_old_connections, transaction, InterfaceError, OperationalError
+
+from apps.core.utils.circuit_breaker import CircuitBreaker
+from apps.devices.models import Device
+from .failures import record_verify_failure
+from .ingest import ingest_event_batch, get_max_batch_events
+from .snapshot import refresh_credential_snapshot
+
+logger = logging.getLogger(__name__)
+
+# Errors that mean "the database is not answering" (not bad input)
+DB_UNAVAILABLE_ERRORS = (OperationalError, InterfaceError, DeadlineExceeded)
+
+# Look for leftover spool files at most this often (seconds)
+SPOOL_CHECK_INTERVAL = 60
+
+# Spool file names: <name>.jsonl waiting, <name>.jsonl.<token>.replaying
+# claimed by a replayer, retry-<attempts>-<token>.jsonl failed before,
+# <name>.jsonl.quarantined given up on (kept for inspection)
+SPOOL_SUFFIX = '.jsonl'
+CLAIMED_SUFFIX = '.replaying'
+QUARANTINE_SUFFIX = '.quarantined'
+
+_lock = threading.Lock()
+_breaker = None
+_executor = None
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+# Credential uses decided in degraded mode and not yet replayed:
+# (device id, credential id) -> count
+_degraded_usage = Counter()
+
+_spool_lock = threading.Lock()
+_replay_lock = threading.Lock()
+_last_spool_check = 0.0
+
+
+def get_degraded_config():
+    """
+    Degraded-mode settings with defaults
+    """
+    config = {
+        'FAILURE_THRESHOLD': 3,
+        'RECOVERY_TIMEOUT': 10,
+        'DB_DEADLINE': 1.5,
+        'DB_THREADS': 4,
+        'SPOOL_DIR': os.path.join(settings.BASE_DIR, 'spool'),
+        'REPLAY_GRACE': 600,        # seconds before a claimed file is considered abandoned
+        'REPLAY_ATTEMPTS': 5,       # failed replays of a file before it is quarantined
+    }
+    config.update(getattr(settings, 'VERIFY_DEGRADED_MODE', {}))
+    return config
+
+
+def get_verify_breaker():
+    """
+    Get the per-process circuit breaker around the verify DB path
+    """
+    global _breaker
+    if _breaker is None:
+        with _lock:
+            if _breaker is None:
+                config = get_degraded_config()
+                _breaker = CircuitBreaker(
+                    'verify_db',
+                    failure_threshold=config['FAILURE_THRESHOLD'],
+                    recovery_timeout=config['RECOVERY_TIMEOUT'],
+                    on_close=schedule_spool_replay
+                )
+    return _breaker
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=get_degraded_config()['DB_THREADS'],
+                    thread_name_prefix='verify-db'
+                )
+    return _executor
+
+
+def get_db_deadline():
+    """
+    Absolute (monotonic) deadline for the DB work of one verification
+    """
+    return time.monotonic() + get_degraded_config()['DB_DEADLINE']
+
+
+def incr_stat(name, count=1):
+    with _stats_lock:
+        _stats[name] += count
+
+
+def _run_db_call(func, args, deadline):
+    # Queued behind stalled calls for longer than the caller waited
+    if time.monotonic() >= deadline:
+        raise DeadlineExceeded()
+
+    close_old_connections()
+    return func(*args)
+
+
+def run_with_deadline(func, *args, deadline):
+    """
+    Run DB work on the verify thread pool, waiting at most until deadline
+
+    The call keeps running in its thread if the deadline passes, so any
+    writes it makes must check for abandonment before committing
+    (see verify_transaction).
+
+    Raises:
+        DeadlineExceeded: The deadline passed first
+    """
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        incr_stat('db_timeouts')
+        raise DeadlineExceeded()
+
+    future = _get_executor().submit(_run_db_call, func, args, deadline)
+    try:
+        return future.result(timeout=remaining)
+    except DeadlineExceeded:
+        incr_stat('db_timeouts')
+        raise
+    except (OperationalError, InterfaceError):
+        incr_stat('db_errors')
+        raise
+
+
+def _run_background(func, args):
+    close_old_connections()
+    try:
+        func(*args)
+    except Exception as e:
+        logger.error(f"Background verify task {func.__name__} failed: {str(e)}")
+
+
+def submit_background(func, *args):
+    """
+    Run non-urgent DB work on the verify thread pool without waiting
+    """
+    _get_executor().submit(_run_background, func, args)
+
+
+@contextmanager
+def verify_transaction(deadline, abandoned=None):
+    """
+    Transaction for verify DB work
+
+    Queries are cancelled by Postgres once the deadline has passed, and the
+    transaction is rolled back if the caller gave up waiting (abandoned is
+    set), so a late commit cannot duplicate the degraded-mode decision.
+    """
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            timeout_ms = max(1, int((deadline - time.monotonic()) * 1000))
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL statement_timeout = %s', [timeout_ms])
+        yield
+        if abandoned is not None and abandoned.is_set():
+            transaction.set_rollback(True)
+
+
+def get_degraded_usage(device_id, credential_id):
+    """Uses of a credential decided in degraded mode, not yet replayed"""
+    return _degraded_usage[(str(device_id), str(credential_id))]
+
+
+def record_degraded_decision(device, event, sample=None):
+    """
+    Count a degraded-mode decision and spool its side effects
+
+    Denials are not spooled: they go to the failure aggregation like
+    denials decided from the database.
+
+    Args:
+        device: Authenticated Device
+        event: Event dict in the batch ingestion format (see ingest._parse_event)
+        sample: Forensic details kept if the attempt failed (optional)
+    """
+    if not event['success']:
+        incr_stat('degraded_denied')
+        record_verify_failure(device, event['method'], event['reason'], {**(sample or {}), 'degraded': True})
+        return
+
+    incr_stat('degraded_granted')
+    if event['credential_id']:
+        with _stats_lock:
+            _degraded_usage[(str(device.pk), event['credential_id'])] += 1
+
+    try:
+        spool_event(device, event)
+    except OSError as e:
+        incr_stat('spool_errors')
+        logger.error(f"Failed to spool degraded decision for device {device.device_id}: {str(e)}")
+
+
+def get_spool_dir():
+    return get_degraded_config()['SPOOL_DIR']
+
+
+def spool_event(device, event):
+    """
+    Append an event to this process's spool file
+    """
+    spool_dir = get_spool_dir()
+    path = os.path.join(spool_dir, f"verify-{socket.gethostname()}-{os.getpid()}.jsonl")
+    line = json.dumps({
+        'device_pk': str(device.pk),
+        'device_id': device.device_id,
+        'event': event,
+    }, separators=(',', ':')) + '\n'
+
+    with _spool_lock:
+        os.makedirs(spool_dir, exist_ok=True)
+        while True:
+            with open(path, 'a') as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    if os.fstat(f.fileno()).st_ino != os.stat(path).st_ino:
+                        continue
+                except FileNotFoundError:
+                    # Claimed by a replayer between open and lock
+                    continue
+                f.write(line)
+                break
+
+    incr_stat('spooled')
+
+
+def _replay_lines(lines):
+    """
+    Ingest spooled events, grouped per device
+
+    Returns:
+        tuple: (events replayed, device pks touched)
+    """
+    events = defaultdict(list)
+    device_ids = {}
+    for line in lines:
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        events[record['device_pk']].append(record['event'])
+        device_ids[record['device_pk']] = record['device_id']
+
+    chunk_size = get_max_batch_events()
+    replayed = 0
+    for device_pk, device_events in events.items():
+        device = Device(pk=uuid.UUID(device_pk), device_id=device_ids[device_pk])
+        try:
+            for i in range(0, len(device_events), chunk_size):
+                ingest_event_batch(device, device_events[i:i + chunk_size], source='degraded')
+        except Device.DoesNotExist:
+            logger.warning(f"Dropping spooled events of deleted device {device.device_id}")
+            continue
+        replayed += len(device_events)
+
+    return replayed, list(events)
+
+
+def _replayable(spool_dir, name, now, grace):
+    """
+    Whether a spool file should be replayed: waiting, or claimed by a
+    replayer that did not finish within the grace period (it died)
+    """
+    if name.endswith(SPOOL_SUFFIX):
+        return True
+    if not name.endswith(CLAIMED_SUFFIX):
+        return False
+    try:
+        return now - os.stat(os.path.join(spool_dir, name)).st_mtime > grace
+    except FileNotFoundError:
+        return False
+
+
+def _spool_attempts(name):
+    """Failed replays recorded in a spool file name"""
+    if name.startswith('retry-'):
+        attempts = name.split('-')[1]
+        return int(attempts) if attempts.isdigit() else 1
+    return 0
+
+
+def _base_name(name):
+    """Waiting name of a spool file (without the claim suffix)"""
+    return name[:name.index(SPOOL_SUFFIX) + len(SPOOL_SUFFIX)]
+
+
+def _release_failed(spool_dir, claimed, name, attempts):
+    """
+    Put a file whose replay failed back in the queue (under a new name: a
+    worker may be appending to a new file under the original one), or
+    quarantine it once it has failed REPLAY_ATTEMPTS times
+    """
+    if attempts >= get_degraded_config()['REPLAY_ATTEMPTS']:
+        incr_stat('spool_quarantined')
+        logger.error(f"Spool file {name} failed {attempts} replays, quarantined")
+        os.rename(claimed, os.path.join(spool_dir, f"{_base_name(name)}{QUARANTINE_SUFFIX}"))
+    else:
+        os.rename(claimed, os.path.join(spool_dir, f"retry-{attempts}-{uuid.uuid4().hex}{SPOOL_SUFFIX}"))
+
+
+def replay_spool():
+    """
+    Replay every spool file in the spool directory into the database
+
+    Files are claimed by renaming, so several processes can replay at once;
+    ingestion skips events already stored, so a retried file is harmless.
+    Claimed files left by a replayer that died are claimed again after
+    REPLAY_GRACE. A file that keeps failing is quarantined after
+    REPLAY_ATTEMPTS replays instead of holding up the others; replay stops
+    at the first file that fails because the database is unavailable.
+
+    Returns:
+        int: Number of events replayed
+    """
+    spool_dir = get_spool_dir()
+    try:
+        names = sorted(os.listdir(spool_dir))
+    except FileNotFoundError:
+        return 0
+
+    grace = get_degraded_config()['REPLAY_GRACE']
+    now = time.time()
+    total = 0
+    for name in names:
+        if not _replayable(spool_dir, name, now, grace):
+            continue
+
+        attempts = _spool_attempts(name)
+        if name.endswith(CLAIMED_SUFFIX):
+            # Abandoned mid-replay: count it as a failed attempt
+            attempts += 1
+            logger.warning(f"Claiming abandoned spool file {name}")
+
+        claimed = os.path.join(spool_dir, f"{_base_name(name)}.{uuid.uuid4().hex}{CLAIMED_SUFFIX}")
+        try:
+            os.rename(os.path.join(spool_dir, name), claimed)
+            # Renaming keeps the old mtime, the grace period starts now
+            os.utime(claimed)
+            with open(claimed) as f:
+                # Wait for an append that started before the rename
+                fcntl.flock(f, fcntl.LOCK_EX)
+                lines = f.readlines()
+        except FileNotFoundError:
+            continue
+
+        if attempts >= get_degraded_config()['REPLAY_ATTEMPTS']:
+            _release_failed(spool_dir, claimed, name, attempts)
+            continue
+
+        try:
+            replayed, device_pks = _replay_lines(lines)
+        except DB_UNAVAILABLE_ERRORS as e:
+            incr_stat('replay_failures')
+            logger.error(f"Spool replay of {name} stopped, database unavailable: {str(e)}")
+            # Not the file's fault: back in the queue without an attempt
+            _release_failed(spool_dir, claimed, name, _spool_attempts(name))
+            break
+        except Exception as e:
+            incr_stat('replay_failures')
+            logger.error(f"Spool replay failed for {name}, will retry: {str(e)}")
+            _release_failed(spool_dir, claimed, name, attempts + 1)
+            continue
+
+        os.remove(claimed)
+        total += replayed
+        incr_stat('replayed', replayed)
+
+        for device_pk in device_pks:
+            refresh_credential_snapshot(device_pk)
+            with _stats_lock:
+                for key in [key for key in _degraded_usage if key[0] == device_pk]:
+                    del _degraded_usage[key]
+
+    return total
+
+
+def _replay_worker():
+    try:
+        replayed = replay_spool()
+        if replayed:
+            logger.info(f"Replayed {replayed} spooled verify events")
+    except Exception as e:
+        logger.error(f"Spool replay error: {str(e)}")
+    finally:
+        connection.close()
+        _replay_lock.release()
+
+
+def schedule_spool_replay():
+    """
+    Replay spooled events in a background thread (one at a time per process)
+    """
+    if not _replay_lock.acquire(blocking=False):
+        return
+    threading.Thread(target=_replay_worker, name='verify-spool-replay', daemon=True).start()
+
+
+def maybe_replay_spool():
+    """
+    Pick up spool files left behind (e.g. by a restarted worker)
+    Called on the healthy path, checks the spool directory once a minute
+    """
+    global _last_spool_check
+    now = time.monotonic()
+    if now - _last_spool_check < SPOOL_CHECK_INTERVAL:
+        return
+    _last_spool_check = now
+
+    spool_dir = get_spool_dir()
+    grace = get_degraded_config()['REPLAY_GRACE']
+    try:
+        pending = any(_replayable(spool_dir, name, time.time(), grace) for name in os.listdir(spool_dir))
+    except FileNotFoundError:
+        return
+    if pending:
+        schedule_spool_replay()
+
+
+def get_verify_stats():
+    """
+    Circuit state and degraded-mode counters for this worker process
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+    return {
+        'circuit': get_verify_breaker().snapshot(),
+        'degraded_decisions': {
+            'granted': stats.get('degraded_granted', 0),
+            'denied': stats.get('degraded_denied', 0),
+            'unavailable': stats.get('degraded_unavailable', 0),
+        },
+        'db_timeouts': stats.get('db_timeouts', 0),
+        'db_errors': stats.get('db_errors', 0),
+        'spooled': stats.get('spooled', 0),
+        'spool_errors': stats.get('spool_errors', 0),
+        'replayed': stats.get('replayed', 0),
+        'replay_failures': stats.get('replay_failures', 0),
+    }
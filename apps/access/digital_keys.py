@@ -0,0 +1,365 @@
+"""
+Offline digital keys
+Short-lived Ed25519-signed tokens (JWT, alg EdDSA) that locks verify
+locally against pinned public keys, so app openings do not need the
+backend, Celery or the MQTT broker to be reachable.
+
+Token claims:
+{
+    "iss": "smartlock",
+    "typ": "dk",
+    "jti": "<digital key id hex>",
+    "sub": "<user id>",
+    "aud": "<device id>",
+    "perm": ["unlock", "lock"],
+    "iat": 1234567890, "nbf": 1234567890, "exp": 1234571490,
+    "cnf": "<phone public key>"     # optional proof of possession
+}
+"""
+
+import hashlib
+import logging
+import threading
+import time
+from datetime import timedelta
+
+import jwt
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework import status
+
+from apps.devices.models import DeviceSharing
+from apps.core.utils.encryption import b64url_decode, generate_signing_keypair, load_signing_key
+from .models import DigitalKey, SigningKey
+
+logger = logging.getLogger(__name__)
+
+TOKEN_ISSUER = 'smartlock'
+TOKEN_ALGORITHM = 'EdDSA'
+
+# Loaded private keys by key id (PEM decryption is slow on purpose)
+_private_keys = {}
+_private_keys_lock = threading.Lock()
+
+
+class DigitalKeyError(Exception):
+    """
+    Raised when a digital key cannot be issued
+    """
+    def __init__(self, message, status_code=status.HTTP_400_BAD_REQUEST):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+def get_default_lifetime():
+    """Default digital key lifetime"""
+    return timedelta(minutes=getattr(settings, 'DIGITAL_KEY_DEFAULT_LIFETIME_MINUTES', 60))
+
+
+def get_max_lifetime():
+    """Max digital key lifetime (also how long retired signing keys stay trusted)"""
+    return timedelta(minutes=getattr(settings, 'DIGITAL_KEY_MAX_LIFETIME_MINUTES', 24 * 60))
+
+
+def compute_key_id(public_key):
+    """Key ID (kid) of a base64url raw public key"""
+    return hashlib.sha256(b64url_decode(public_key)).hexdigest()[:16]
+
+
+def _get_private_key(signing_key):
+    private_key = _private_keys.get(signing_key.key_id)
+    if private_key is None:
+        private_key = load_signing_key(signing_key.private_key)
+        with _private_keys_lock:
+            _private_keys[signing_key.key_id] = private_key
+    return private_key
+
+
+def sign_token(signing_key, claims):
+    """
+    Sign claims with a signing key
+
+    Returns:
+        str: Compact JWT with the key ID in its header
+    """
+    return jwt.encode(
+        {'iss': TOKEN_ISSUER, **claims},
+        _get_private_key(signing_key),
+        algorithm=TOKEN_ALGORITHM,
+        headers={'kid': signing_key.key_id}
+    )
+
+
+def rotate_signing_key():
+    """
+    Create a new active signing key
+
+    The new public key is endorsed (signed) by the current active key so
+    locks can extend their pinned trust to it without a new provisioning.
+    The current key is retired but stays trusted until tokens it signed
+    have expired (see get_trusted_keys).
+
+    Returns:
+        SigningKey: The new active key
+    """
+    private_pem, public_key = generate_signing_keypair()
+    key_id = compute_key_id(public_key)
+    now = timezone.now()
+
+    with transaction.atomic():
+        current = SigningKey.objects.select_for_update().filter(is_active=True).first()
+
+        endorsement = ''
+        if current is not None:
+            endorsement = sign_token(current, {
+                'typ': 'key',
+                'kid': key_id,
+                'pub': public_key,
+                'iat': int(now.timestamp()),
+            })
+            current.is_active = False
+            current.retired_at = now
+            current.save(update_fields=['is_active', 'retired_at', 'updated_at'])
+
+        signing_key = SigningKey.objects.create(
+            key_id=key_id,
+            public_key=public_key,
+            private_key=private_pem,
+            endorsement=endorsement
+        )
+
+        transaction.on_commit(_queue_trusted_keys_push)
+
+    logger.info(f"Signing key rotated: {key_id}" + (f" (retired {current.key_id})" if current else ''))
+    return signing_key
+
+
+def _queue_trusted_keys_push():
+    from .tasks import publish_trusted_keys
+    try:
+        publish_trusted_keys.delay()
+    except Exception as e:
+        logger.error(f"Failed to queue trusted keys push: {str(e)}")
+
+
+def get_active_signing_key():
+    """
+    Get the active signing key, creating the first one if none exists
+    """
+    signing_key = SigningKey.objects.filter(is_active=True).first()
+    if signing_key is not None:
+        return signing_key
+
+    try:
+        return rotate_signing_key()
+    except IntegrityError:
+        # Created concurrently by another worker
+        return SigningKey.objects.get(is_active=True)
+
+
+def get_trusted_keys():
+    """
+    Signing keys locks must accept: the active key plus retired keys
+    whose tokens may not have expired yet
+    """
+    cutoff = timezone.now() - get_max_lifetime()
+    return SigningKey.objects.filter(
+        Q(is_active=True) | Q(retired_at__gte=cutoff)
+    ).order_by('created_at')
+
+
+def build_trusted_keys():
+    """
+    Public key set for locks: [{kid, pub, endorsement}, ...]
+    A lock adds a key only if its endorsement verifies with a key it
+    already trusts.
+    """
+    return [
+        {
+            'kid': key.key_id,
+            'pub': key.public_key,
+            'endorsement': key.endorsement,
+        }
+        for key in get_trusted_keys().only('key_id', 'public_key', 'endorsement')
+    ]
+
+
+def get_key_permissions(device, user):
+    """
+    Actions a user may perform with a digital key
+
+    Owners get every action; shared users get what their DeviceSharing allows.
+
+    Returns:
+        tuple: (permissions list, sharing expiry or None)
+    """
+    if device.owner_id == user.pk:
+        return ['unlock', 'lock'], None
+
+    sharing = DeviceSharing.objects.filter(
+        device=device,
+        shared_with=user,
+        is_active=True
+    ).only('can_unlock', 'can_lock', 'expires_at').first()
+
+    if sharing is None or (sharing.expires_at and sharing.expires_at <= timezone.now()):
+        return [], None
+
+    permissions = [
+        action for action, allowed in (('unlock', sharing.can_unlock), ('lock', sharing.can_lock))
+        if allowed
+    ]
+    return permissions, sharing.expires_at
+
+
+def issue_digital_key(device, user, lifetime=None, holder_public_key=''):
+    """
+    Issue a signed digital key
+
+    Args:
+        device: Device the key opens
+        user: Key holder
+        lifetime: timedelta (default DIGITAL_KEY_DEFAULT_LIFETIME_MINUTES,
+            capped at DIGITAL_KEY_MAX_LIFETIME_MINUTES and sharing expiry)
+        holder_public_key: Phone Ed25519 public key (base64url, optional)
+
+    Returns:
+        tuple: (DigitalKey, token)
+
+    Raises:
+        DigitalKeyError: User may not open the device
+    """
+    permissions, sharing_expires_at = get_key_permissions(device, user)
+    if 'unlock' not in permissions:
+        raise DigitalKeyError('You do not have permission to unlock this device', status.HTTP_403_FORBIDDEN)
+
+    now = timezone.now().replace(microsecond=0)
+    valid_until = now + min(lifetime or get_default_lifetime(), get_max_lifetime())
+    if sharing_expires_at is not None:
+        valid_until = min(valid_until, sharing_expires_at)
+
+    signing_key = get_active_signing_key()
+
+    digital_key = DigitalKey.objects.create(
+        device=device,
+        user=user,
+        signing_key=signing_key,
+        permissions=permissions,
+        holder_public_key=holder_public_key,
+        valid_from=now,
+        valid_until=valid_until
+    )
+
+    claims = {
+        'typ': 'dk',
+        'jti': digital_key.id.hex,
+        'sub': str(user.pk),
+        'aud': str(device.pk),
+        'perm': permissions,
+        'iat': int(now.timestamp()),
+        'nbf': int(now.timestamp()),
+        'exp': int(valid_until.timestamp()),
+    }
+    if holder_public_key:
+        claims['cnf'] = holder_public_key
+
+    logger.info(f"Digital key issued for device {device.device_id} to {user.email} until {valid_until}")
+
+    return digital_key, sign_token(signing_key, claims)
+
+
+def get_revocation_pending_key(device_pk):
+    return f"digital_key_revocations_pending:{device_pk}"
+
+
+def schedule_revocation_push(device_pk):
+    """
+    Push the device's revocation list after a short batching window
+
+    The first revocation in a window schedules one push; revocations made
+    before it runs are carried by the same list.
+    """
+    window = getattr(settings, 'DIGITAL_KEY_REVOCATION_BATCH_SECONDS', 5)
+    try:
+        # Cleared by the push task; the TTL only covers a lost task
+        first = cache.add(get_revocation_pending_key(device_pk), 1, window + 60)
+    except Exception as e:
+        logger.warning(f"Revocation batching unavailable, pushing now: {str(e)}")
+        first, window = True, 0
+
+    if first:
+        transaction.on_commit(lambda: _queue_key_state_push(device_pk, window))
+
+
+def _queue_key_state_push(device_pk, countdown):
+    from .tasks import publish_key_state
+    try:
+        publish_key_state.apply_async(args=[str(device_pk)], countdown=countdown)
+    except Exception as e:
+        # The revocation is committed; the next push carries it
+        logger.error(f"Failed to queue key state push for device {device_pk}: {str(e)}")
+        try:
+            cache.delete(get_revocation_pending_key(device_pk))
+        except Exception:
+            pass
+
+
+def revoke_digital_keys(keys, reason):
+    """
+    Revoke digital keys that have not expired yet
+
+    Args:
+        keys: DigitalKey queryset
+        reason: Short revocation reason
+
+    Returns:
+        int: Number of keys revoked
+    """
+    live = keys.filter(revoked_at__isnull=True, valid_until__gt=timezone.now())
+    device_pks = set(live.values_list('device_id', flat=True))
+    count = live.update(revoked_at=timezone.now(), revoked_reason=reason[:100])
+
+    for device_pk in device_pks:
+        schedule_revocation_push(device_pk)
+
+    if count:
+        logger.info(f"Revoked {count} digital key(s): {reason}")
+    return count
+
+
+def build_revocation_list(device, signing_key=None):
+    """
+    Signed list of revoked, unexpired digital keys of a device
+
+    Expired keys drop out, so the list stays as short as key lifetimes.
+    Locks keep the list with the highest seq.
+    """
+    now = timezone.now()
+    revoked = DigitalKey.objects.filter(
+        device=device,
+        revoked_at__isnull=False,
+        valid_until__gt=now
+    ).values_list('id', flat=True)
+
+    return sign_token(signing_key or get_active_signing_key(), {
+        'typ': 'crl',
+        'aud': str(device.pk),
+        'iat': int(now.timestamp()),
+        'seq': int(time.time() * 1000),
+        'revoked': sorted(key_id.hex for key_id in revoked),
+    })
+
+
+def build_key_state(device, signing_key=None, trusted_keys=None):
+    """
+    Everything a lock needs to verify digital keys offline
+    Published as a retained MQTT message on the device keys topic
+    """
+    return {
+        'trusted_keys': trusted_keys if trusted_keys is not None else build_trusted_keys(),
+        'revocation_list': build_revocation_list(device, signing_key),
+    }
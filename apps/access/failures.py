@@ -0,0 +1,283 @@
+"""
+Failed verification aggregation
+A brute-force run against a lock must not turn into one DeviceLog row per
+guess. Failures are counted in memory per (device, credential type,
+reason) and written as one summary row per window, with a few sampled
+attempts kept for forensics. A BRUTE_FORCE SecurityEvent is raised once
+per escalation window when a device's failures cross the threshold
+(counted in Redis, so across all workers).
+"""
+
+import atexit
+import logging
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.db import InterfaceError, OperationalError, close_old_connections, transaction
+from django.utils import timezone
+
+from apps.core.utils.redis_client import get_redis, redis_key
+from apps.devices.messages import LogMessage
+from apps.devices.models import Device, DeviceLog
+from apps.devices.recent import push_recent_events
+from apps.devices.rollups import record_access_rollups
+
+logger = logging.getLogger(__name__)
+
+# Reasons that mean "unknown credential" (guessing), as opposed to a
+# known credential that is expired / used up
+GUESS_REASONS = {'Invalid PIN code', 'Invalid NFC UID'}
+
+EVENT_TYPES = {'pin': 'UNLOCK_PIN', 'nfc': 'UNLOCK_NFC'}
+LABELS = {'pin': 'PIN', 'nfc': 'NFC'}
+
+# Flushes an aggregate is kept for while the database is unavailable
+MAX_FLUSH_RETRIES = 5
+
+_lock = threading.Lock()
+_flusher = None
+
+# (device pk, device id, method, reason) -> aggregate dict
+_pending = {}
+
+# Local escalation counters when Redis is unavailable: key -> (window start, count)
+_local_counts = {}
+
+
+def get_failure_config():
+    """
+    Failure aggregation settings with defaults
+    """
+    config = {
+        'WINDOW': 60,                   # seconds per summary row
+        'SAMPLES': 5,                   # sampled attempts kept per row
+        'BRUTE_FORCE_THRESHOLD': 20,    # guesses per device per escalation window
+        'BRUTE_FORCE_WINDOW': 300,      # seconds
+    }
+    config.update(getattr(settings, 'VERIFY_FAILURE_AGGREGATION', {}))
+    return config
+
+
+def record_verify_failure(device, method, reason, sample=None):
+    """
+    Count a failed verification (no database write)
+
+    Args:
+        device: Device (pk and device_id are used)
+        method: 'pin' or 'nfc'
+        reason: Failure reason (error_message of the summary row)
+        sample: Forensic details of this attempt (dict, never the PIN)
+    """
+    config = get_failure_config()
+    now = timezone.now()
+    key = (str(device.pk), device.device_id, method, reason)
+    sample = {'at': now.isoformat(), **(sample or {})}
+
+    with _lock:
+        aggregate = _pending.get(key)
+        if aggregate is None:
+            aggregate = _pending[key] = {'count': 0, 'first_at': now, 'last_at': now, 'samples': []}
+        aggregate['count'] += 1
+        aggregate['last_at'] = now
+        _keep_sample(aggregate['samples'], aggregate['count'], sample, config['SAMPLES'])
+
+    _ensure_flusher()
+
+    if reason in GUESS_REASONS:
+        count = _count_guess(device.pk, method, config['BRUTE_FORCE_WINDOW'])
+        if count == config['BRUTE_FORCE_THRESHOLD']:
+            from .degraded import submit_background
+            submit_background(raise_brute_force_event, str(device.pk), device.device_id, method, count, sample)
+
+
+def _keep_sample(samples, seen, sample, limit):
+    """
+    Reservoir sampling: the seen-th attempt replaces a random kept sample
+    with probability limit / seen, so every attempt of the window is
+    equally likely to be kept
+    """
+    if len(samples) < limit:
+        samples.append(sample)
+    elif random.random() * seen < limit:
+        samples[random.randrange(limit)] = sample
+
+
+def _count_guess(device_pk, method, window):
+    """Guesses of a device in the current escalation window"""
+    key = redis_key('verify_guesses', device_pk, method)
+    try:
+        client = get_redis()
+        if client is not None:
+            pipe = client.pipeline()
+            pipe.set(key, 0, ex=window, nx=True)
+            pipe.incr(key)
+            return pipe.execute()[1]
+    except Exception as e:
+        logger.warning(f"Failure counter unavailable, counting locally: {str(e)}")
+
+    now = time.monotonic()
+    with _lock:
+        started, count = _local_counts.get(key, (now, 0))
+        if now - started >= window:
+            started, count = now, 0
+        _local_counts[key] = (started, count + 1)
+        return count + 1
+
+
+def raise_brute_force_event(device_pk, device_id, method, count, sample):
+    """
+    Record a BRUTE_FORCE security event for a device
+    """
+    from apps.security.models import SecurityEvent
+
+    config = get_failure_config()
+    SecurityEvent.objects.create(
+        event_type='BRUTE_FORCE',
+        severity='HIGH',
+        device_id=device_pk,
+        ip_address=sample.get('ip') or '0.0.0.0',
+        description=(
+            f"{count} invalid {LABELS[method]} attempts on device {device_id} "
+            f"within {config['BRUTE_FORCE_WINDOW']}s"
+        ),
+        metadata={'method': method, 'count': count, 'sample': sample}
+    )
+    logger.critical(f"Brute force suspected on device {device_id}: {count} invalid {LABELS[method]} attempts")
+
+
+def flush_verify_failures():
+    """
+    Write pending failure aggregates as DeviceLog summary rows
+
+    Returns:
+        int: Number of rows written
+    """
+    with _lock:
+        pending = dict(_pending)
+        _pending.clear()
+
+    if not pending:
+        return 0
+
+    # Devices deleted since (their rows would fail the whole insert)
+    try:
+        existing = {str(pk) for pk in Device.objects.filter(
+            pk__in={key[0] for key in pending}
+        ).values_list('pk', flat=True)}
+    except (OperationalError, InterfaceError) as e:
+        logger.error(f"Failed to flush verify failures, will retry: {str(e)}")
+        _requeue(pending)
+        return 0
+
+    window = get_failure_config()['WINDOW']
+    rows = {}
+    for key, aggregate in pending.items():
+        device_pk, device_id, method, reason = key
+        if str(device_pk) not in existing:
+            continue
+        count = aggregate['count']
+        if count == 1:
+            message, params = LogMessage.FAILED_ATTEMPT, {'method': method, 'reason': reason}
+        else:
+            message = LogMessage.FAILED_ATTEMPTS
+            params = {'method': method, 'reason': reason, 'count': count, 'window': window}
+        rows[key] = DeviceLog(
+            device_id=device_pk,
+            event_type=EVENT_TYPES[method],
+            message=message,
+            message_params=params,
+            success=False,
+            error_message=reason,
+            attempt_count=count,
+            details={
+                'first_at': aggregate['first_at'].isoformat(),
+                'last_at': aggregate['last_at'].isoformat(),
+                'samples': aggregate['samples'],
+            },
+            created_at=aggregate['first_at']
+        )
+
+    if not rows:
+        return 0
+
+    try:
+        _write_rows(list(rows.values()))
+    except (OperationalError, InterfaceError) as e:
+        # Keep the counts for the next flush (database unavailable)
+        logger.error(f"Failed to flush verify failures, will retry: {str(e)}")
+        _requeue({key: pending[key] for key in rows})
+        return 0
+    except Exception as e:
+        # A bad row must not hold back the others
+        logger.error(f"Failed to flush verify failures, writing rows one by one: {str(e)}")
+        written = 0
+        for (_, device_id, method, reason), row in rows.items():
+            try:
+                _write_rows([row])
+                written += 1
+            except Exception as row_error:
+                logger.error(f"Dropping failure summary for device {device_id} ({method}: {reason}): {str(row_error)}")
+        return written
+
+    return len(rows)
+
+
+def _write_rows(rows):
+    with transaction.atomic():
+        DeviceLog.objects.bulk_create(rows)
+        record_access_rollups(rows)
+        transaction.on_commit(lambda: push_recent_events(rows))
+
+
+def _requeue(pending):
+    """Put unwritten aggregates back, up to MAX_FLUSH_RETRIES flushes"""
+    limit = get_failure_config()['SAMPLES']
+    with _lock:
+        for key, aggregate in pending.items():
+            aggregate['retries'] = aggregate.get('retries', 0) + 1
+            if aggregate['retries'] > MAX_FLUSH_RETRIES:
+                logger.error(
+                    f"Dropping {aggregate['count']} failed attempts of device {key[1]} "
+                    f"after {MAX_FLUSH_RETRIES} retries"
+                )
+                continue
+            current = _pending.get(key)
+            if current is not None:
+                # Each sample of the newer aggregate stands for count / samples attempts
+                seen = aggregate['count']
+                weight = current['count'] / max(1, len(current['samples']))
+                for sample in current['samples']:
+                    seen += weight
+                    _keep_sample(aggregate['samples'], seen, sample, limit)
+                aggregate['count'] += current['count']
+                aggregate['last_at'] = current['last_at']
+            _pending[key] = aggregate
+
+
+def _flush_worker():
+    while True:
+        time.sleep(get_failure_config()['WINDOW'])
+        close_old_connections()
+        try:
+            flush_verify_failures()
+        except Exception as e:
+            logger.error(f"Verify failure flush error: {str(e)}")
+
+
+def _ensure_flusher():
+    global _flusher
+    if _flusher is not None:
+        return
+    with _lock:
+        if _flusher is None:
+            _flusher = threading.Thread(target=_flush_worker, name='verify-failure-flush', daemon=True)
+            _flusher.start()
+            atexit.register(flush_verify_failures)
+
+
+def get_pending_failures():
+    """Failures counted in this process and not yet written"""
+    with _lock:
+        return sum(aggregate['count'] for aggregate in _pending.values())
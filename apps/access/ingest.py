@@ -0,0 +1,300 @@
+"""
+Batch ingestion of access events recorded by devices
+Locks that verify credentials locally (e.g. while offline) upload their
+buffered events in signed, gzip-compressed batches
+"""
+
+import base64
+import binascii
+import gzip
+import io
+import json
+import logging
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta, timezone as dt_timezone
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from apps.devices.messages import LogMessage
+from apps.devices.models import Device, DeviceLog
+from apps.devices.recent import push_recent_events
+from apps.devices.rollups import record_access_rollups
+from .models import NFCCard, PINCode
+from .snapshot import record_credential_use
+
+logger = logging.getLogger(__name__)
+
+# Device-side unlock method -> DeviceLog event type
+METHOD_EVENT_TYPES = {
+    'app': 'UNLOCK_APP',
+    'nfc': 'UNLOCK_NFC',
+    'pin': 'UNLOCK_PIN',
+    'physical': 'UNLOCK_PHYSICAL',
+    'lock': 'LOCK',
+}
+
+# Methods whose successful events count as a credential use
+CREDENTIAL_MODELS = {
+    'nfc': NFCCard,
+    'pin': PINCode,
+}
+
+
+class EventBatchError(Exception):
+    """
+    Raised when an uploaded event batch cannot be decoded
+    """
+
+
+def get_max_batch_events():
+    """Max number of events accepted in one batch"""
+    return getattr(settings, 'DEVICE_EVENT_BATCH_MAX', 1000)
+
+
+def encode_event_batch(events):
+    """
+    Encode events the way devices upload them: base64(gzip(json))
+    """
+    raw = json.dumps(events, separators=(',', ':')).encode()
+    return base64.b64encode(gzip.compress(raw)).decode()
+
+
+def decode_event_batch(encoded):
+    """
+    Decode a base64(gzip(json)) event batch
+
+    Returns:
+        list of event dicts
+
+    Raises:
+        EventBatchError: Payload is not a valid encoded batch
+    """
+    if not isinstance(encoded, str) or not encoded:
+        raise EventBatchError('Events must be a base64-encoded gzip JSON array')
+
+    max_events = get_max_batch_events()
+
+    try:
+        compressed = base64.b64decode(encoded, validate=True)
+        # Bound decompressed size to guard against gzip bombs (~1 KB per event)
+        with gzip.GzipFile(fileobj=io.BytesIO(compressed)) as f:
+            raw = f.read(max_events * 1024 + 1)
+        if len(raw) > max_events * 1024:
+            raise EventBatchError('Event batch too large')
+        events = json.loads(raw)
+    except EventBatchError:
+        raise
+    except (binascii.Error, OSError, EOFError, ValueError):
+        raise EventBatchError('Events must be a base64-encoded gzip JSON array')
+
+    if not isinstance(events, list):
+        raise EventBatchError('Events must be a JSON array')
+
+    if len(events) > max_events:
+        raise EventBatchError(f'Too many events in batch (max {max_events})')
+
+    return events
+
+
+def _parse_event(event, now):
+    """
+    Validate one uploaded event
+
+    Expected event:
+    {
+        "event_id": "a1b2c3...",      # unique per device, max 64 chars
+        "method": "nfc/pin/app/physical/lock",
+        "credential_id": "<uuid>",    # NFC card / PIN code ID (optional)
+        "success": true,              # JSON boolean (default true)
+        "timestamp": 1234567890,      # when the event happened on the lock
+        "reason": "expired"           # failure reason (optional)
+    }
+
+    Returns:
+        Normalized event dict, or None if the event is invalid
+    """
+    if not isinstance(event, dict):
+        return None
+
+    event_id = event.get('event_id')
+    method = event.get('method')
+    if not isinstance(event_id, str) or not event_id or len(event_id) > 64:
+        return None
+    if method not in METHOD_EVENT_TYPES:
+        return None
+
+    # A JSON boolean only: "false" / "0" must not count as a successful unlock
+    success = event.get('success', True)
+    if not isinstance(success, bool):
+        return None
+
+    try:
+        occurred_at = datetime.fromtimestamp(int(event.get('timestamp')), tz=dt_timezone.utc)
+    except (TypeError, ValueError, OverflowError, OSError):
+        return None
+
+    max_age = timedelta(days=getattr(settings, 'DEVICE_EVENT_MAX_AGE_DAYS', 30))
+    if occurred_at > now + timedelta(minutes=5) or occurred_at < now - max_age:
+        return None
+
+    credential_id = event.get('credential_id')
+    if credential_id is not None:
+        try:
+            credential_id = str(uuid.UUID(str(credential_id)))
+        except ValueError:
+            credential_id = None
+
+    return {
+        'event_id': event_id,
+        'method': method,
+        'credential_id': credential_id,
+        'success': success,
+        'occurred_at': occurred_at,
+        'reason': str(event.get('reason') or '')[:200],
+    }
+
+
+def _load_credentials(device, parsed):
+    """
+    Load the NFC cards / PIN codes referenced by a batch (one query per type)
+    """
+    credentials = {}
+    for method, model in CREDENTIAL_MODELS.items():
+        ids = {e['credential_id'] for e in parsed if e['method'] == method and e['credential_id']}
+        if not ids:
+            continue
+        rows = model.objects.filter(device=device, pk__in=ids).only('id', 'name', 'user_id', 'usage_count', 'max_usage')
+        credentials.update({(method, str(row.pk)): row for row in rows})
+    return credentials
+
+
+def _message(event, credential, source):
+    """
+    Log message of an uploaded event
+
+    Returns:
+        tuple: (LogMessage, parameters)
+    """
+    params = {'method': event['method'], 'source': source}
+    if credential is not None:
+        params['name'] = credential.name
+
+    if event['method'] == 'lock':
+        return LogMessage.OFFLINE_LOCKED, {'source': source}
+    if event['success']:
+        code = LogMessage.OFFLINE_UNLOCKED_WITH if credential is not None else LogMessage.OFFLINE_UNLOCKED
+        return code, params
+    params['reason'] = event['reason'] or 'denied'
+    code = LogMessage.OFFLINE_REJECTED_WITH if credential is not None else LogMessage.OFFLINE_REJECTED
+    return code, params
+
+
+def ingest_event_batch(device, events, ip_address=None, source='offline'):
+    """
+    Store a batch of device events
+
+    All rows are bulk-inserted in one transaction together with the usage
+    count increments of the credentials used. Events already stored for
+    this device (same event_id) are skipped, so a retried upload is a no-op.
+
+    Args:
+        device: Authenticated Device
+        events: List of raw event dicts (see _parse_event)
+        ip_address: Uploader IP address (optional)
+        source: Where the events were decided, shown in log descriptions
+
+    Returns:
+        dict: accepted / duplicates / rejected counts
+    """
+    now = timezone.now()
+
+    # Validate and de-duplicate within the batch
+    parsed = {}
+    rejected = 0
+    for event in events:
+        event = _parse_event(event, now)
+        if event is None:
+            rejected += 1
+            continue
+        parsed.setdefault(event['event_id'], event)
+
+    duplicates = len(events) - rejected - len(parsed)
+
+    if not parsed:
+        return {'accepted': 0, 'duplicates': duplicates, 'rejected': rejected}
+
+    with transaction.atomic():
+        # Serialize batches per device so concurrent retries cannot double count
+        Device.objects.select_for_update().only('id').get(pk=device.pk)
+
+        existing = set(DeviceLog.objects.filter(
+            device=device,
+            event_id__in=list(parsed)
+        ).values_list('event_id', flat=True))
+
+        new_events = [e for event_id, e in parsed.items() if event_id not in existing]
+        duplicates += len(existing)
+
+        credentials = _load_credentials(device, new_events)
+
+        logs = []
+        usage = Counter()
+        last_unlock = None
+
+        for event in new_events:
+            credential = credentials.get((event['method'], event['credential_id'])) if event['credential_id'] else None
+            message, params = _message(event, credential, source)
+
+            logs.append(DeviceLog(
+                device=device,
+                user_id=credential.user_id if credential is not None else None,
+                event_type=METHOD_EVENT_TYPES[event['method']],
+                message=message,
+                message_params=params,
+                ip_address=ip_address,
+                success=event['success'],
+                error_message='' if event['success'] else (event['reason'] or 'denied'),
+                event_id=event['event_id'],
+                created_at=event['occurred_at'],
+            ))
+
+            if event['success'] and event['method'] != 'lock':
+                if credential is not None:
+                    usage[(event['method'], credential.pk)] += 1
+                if last_unlock is None or event['occurred_at'] > last_unlock:
+                    last_unlock = event['occurred_at']
+
+        DeviceLog.objects.bulk_create(logs, batch_size=500)
+        record_access_rollups(logs)
+        transaction.on_commit(lambda: push_recent_events(logs))
+
+        for (method, credential_pk), count in usage.items():
+            CREDENTIAL_MODELS[method].objects.filter(pk=credential_pk).update(
+                usage_count=F('usage_count') + count,
+                updated_at=now
+            )
+
+        # Degraded uses were counted when they were decided
+        if source != 'degraded':
+            for (method, _), credential in credentials.items():
+                count = usage[(method, credential.pk)]
+                if credential.max_usage and count:
+                    transaction.on_commit(partial(record_credential_use, credential.pk, credential.usage_count, count))
+
+        if last_unlock is not None:
+            Device.objects.filter(
+                Q(last_unlock__isnull=True) | Q(last_unlock__lt=last_unlock),
+                pk=device.pk
+            ).update(last_unlock=last_unlock)
+
+    logger.info(
+        f"Event batch ingested for device {device.device_id}: "
+        f"{len(logs)} accepted, {duplicates} duplicates, {rejected} rejected"
+    )
+
+    return {'accepted': len(logs), 'duplicates': duplicates, 'rejected': rejected}
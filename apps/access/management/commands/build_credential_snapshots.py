@@ -0,0 +1,25 @@
+"""
+Django management command to build credential snapshots
+"""
+
+from django.core.management.base import BaseCommand
+
+from apps.devices.models import Device
+from apps.access.snapshot import refresh_credential_snapshot
+
+
+class Command(BaseCommand):
+    """
+    Build the degraded-mode credential snapshot of every device
+    Snapshots are kept current by signals; run this after deploying or
+    flushing Redis so degraded mode has data before the first verification.
+    """
+    help = 'Build credential snapshots for all devices'
+
+    def handle(self, *args, **options):
+        count = 0
+        for device_pk in Device.objects.values_list('pk', flat=True).iterator():
+            refresh_credential_snapshot(device_pk)
+            count += 1
+
+        self.stdout.write(self.style.SUCCESS(f'✅ Built snapshots for {count} devices'))
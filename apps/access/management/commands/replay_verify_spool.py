@@ -0,0 +1,21 @@
+"""
+Django management command to replay degraded-mode verify decisions
+"""
+
+from django.core.management.base import BaseCommand
+
+from apps.access.degraded import get_spool_dir, replay_spool
+
+
+class Command(BaseCommand):
+    """
+    Ingest verify decisions spooled while the database was unavailable
+    Workers replay their own spool automatically; this picks up files left
+    behind by workers that were stopped before the database recovered.
+    """
+    help = 'Replay spooled degraded-mode verify decisions into the database'
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'Replaying spool files in {get_spool_dir()}...')
+        replayed = replay_spool()
+        self.stdout.write(self.style.SUCCESS(f'✅ Replayed {replayed} events'))
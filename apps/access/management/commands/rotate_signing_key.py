@@ -0,0 +1,20 @@
+"""
+Django management command to rotate the digital key signing key
+"""
+
+from django.core.management.base import BaseCommand
+
+from apps.access.digital_keys import rotate_signing_key
+
+
+class Command(BaseCommand):
+    """
+    Create a new active Ed25519 signing key for digital keys
+    The retired key stays trusted until the tokens it signed expire; the
+    new key is endorsed by it and pushed to every lock.
+    """
+    help = 'Rotate the digital key signing key'
+
+    def handle(self, *args, **options):
+        signing_key = rotate_signing_key()
+        self.stdout.write(self.style.SUCCESS(f'✅ New signing key: {signing_key.key_id}'))
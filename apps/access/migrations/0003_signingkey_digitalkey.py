@@ -0,0 +1,85 @@
+# Generated by Django 4.2.16 on 2026-10-19 01:30
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devices', '0004_devicelog_event_id'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('access', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DigitalKey',
+            fields=[
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('permissions', models.JSONField(default=list, help_text='Granted actions: ["unlock","lock"]')),
+                ('holder_public_key', models.CharField(blank=True, help_text='Phone Ed25519 public key for proof of possession (optional)', max_length=64)),
+                ('valid_from', models.DateTimeField()),
+                ('valid_until', models.DateTimeField()),
+                ('revoked_at', models.DateTimeField(blank=True, null=True)),
+                ('revoked_reason', models.CharField(blank=True, max_length=100)),
+            ],
+            options={
+                'verbose_name': 'Digital Key',
+                'verbose_name_plural': 'Digital Keys',
+                'db_table': 'digital_keys',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='SigningKey',
+            fields=[
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('key_id', models.CharField(help_text='Key ID (kid) sent in token headers', max_length=16, unique=True)),
+                ('public_key', models.CharField(help_text='Raw public key (base64url)', max_length=64)),
+                ('private_key', models.TextField(help_text='Encrypted PKCS8 PEM')),
+                ('endorsement', models.TextField(blank=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('retired_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Signing Key',
+                'verbose_name_plural': 'Signing Keys',
+                'db_table': 'signing_keys',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='signingkey',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_active', True)), fields=('is_active',), name='signing_keys_single_active'),
+        ),
+        migrations.AddField(
+            model_name='digitalkey',
+            name='device',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='digital_keys', to='devices.device'),
+        ),
+        migrations.AddField(
+            model_name='digitalkey',
+            name='signing_key',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='digital_keys', to='access.signingkey'),
+        ),
+        migrations.AddField(
+            model_name='digitalkey',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='digital_keys', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='digitalkey',
+            index=models.Index(fields=['device', 'valid_until'], name='digital_key_device__0cfe1c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='digitalkey',
+            index=models.Index(fields=['user', 'device'], name='digital_key_user_id_34638a_idx'),
+        ),
+    ]
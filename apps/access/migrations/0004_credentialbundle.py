@@ -0,0 +1,39 @@
+# Generated by Django 4.2.16 on 2026-10-19 01:31
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devices', '0004_devicelog_event_id'),
+        ('access', '0003_signingkey_digitalkey'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CredentialBundle',
+            fields=[
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('version', models.PositiveIntegerField()),
+                ('secret_version', models.PositiveIntegerField()),
+                ('entries', models.JSONField(default=list)),
+                ('acked_at', models.DateTimeField(blank=True, null=True)),
+                ('device', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='credential_bundles', to='devices.device')),
+            ],
+            options={
+                'verbose_name': 'Credential Bundle',
+                'verbose_name_plural': 'Credential Bundles',
+                'db_table': 'credential_bundles',
+                'ordering': ['-version'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='credentialbundle',
+            constraint=models.UniqueConstraint(fields=('device', 'version'), name='credential_bundles_device_version'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.16 on 2026-10-19 01:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('access', '0004_credentialbundle'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='credentialbundle',
+            name='revoked_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
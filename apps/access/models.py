@@ -271,4 +271,134 @@ class GuestAccess(TimeStampedModel, UUIDModel):
         return (
             self.is_active and
             self.valid_from <= now <= self.valid_until
-        )
\ No newline at end of file
+        )
+
+
+class SigningKey(TimeStampedModel, UUIDModel):
+    """
+    Ed25519 key used to sign offline digital keys and revocation lists
+
+    Exactly one key is active (signs new tokens). Retired keys stay trusted
+    by locks until every token they signed has expired.
+    """
+    key_id = models.CharField(max_length=16, unique=True, help_text='Key ID (kid) sent in token headers')
+    public_key = models.CharField(max_length=64, help_text='Raw public key (base64url)')
+    private_key = models.TextField(help_text='Encrypted PKCS8 PEM')
+
+    # Signature of the previous active key over this key (chain of trust for locks)
+    endorsement = models.TextField(blank=True)
+
+    is_active = models.BooleanField(default=True)
+    retired_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'signing_keys'
+        verbose_name = 'Signing Key'
+        verbose_name_plural = 'Signing Keys'
+        ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['is_active'],
+                condition=models.Q(is_active=True),
+                name='signing_keys_single_active'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.key_id} ({'active' if self.is_active else 'retired'})"
+
+
+class DigitalKey(TimeStampedModel, UUIDModel):
+    """
+    Short-lived signed key that a lock verifies locally (offline unlock)
+    The token itself is not stored: the ID is its jti, used for revocation.
+    """
+    PERMISSION_CHOICES = [
+        ('unlock', 'Unlock'),
+        ('lock', 'Lock'),
+    ]
+
+    device = models.ForeignKey(
+        'devices.Device',
+        on_delete=models.CASCADE,
+        related_name='digital_keys'
+    )
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='digital_keys'
+    )
+    signing_key = models.ForeignKey(
+        SigningKey,
+        on_delete=models.PROTECT,
+        related_name='digital_keys'
+    )
+
+    permissions = models.JSONField(default=list, help_text='Granted actions: ["unlock","lock"]')
+    holder_public_key = models.CharField(
+        max_length=64,
+        blank=True,
+        help_text='Phone Ed25519 public key for proof of possession (optional)'
+    )
+
+    # Validity
+    valid_from = models.DateTimeField()
+    valid_until = models.DateTimeField()
+
+    # Revocation
+    revoked_at = models.DateTimeField(null=True, blank=True)
+    revoked_reason = models.CharField(max_length=100, blank=True)
+
+    class Meta:
+        db_table = 'digital_keys'
+        verbose_name = 'Digital Key'
+        verbose_name_plural = 'Digital Keys'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['device', 'valid_until']),
+            models.Index(fields=['user', 'device']),
+        ]
+
+    def __str__(self):
+        return f"Digital key for {self.device_id} ({self.user_id})"
+
+    @property
+    def is_valid(self):
+        """Check if digital key is currently valid"""
+        now = timezone.now()
+        return self.revoked_at is None and self.valid_from <= now <= self.valid_until
+
+
+class CredentialBundle(TimeStampedModel, UUIDModel):
+    """
+    Version of the credential set synced to a lock (offline PIN / NFC checks)
+    Entries are kept so later versions can be sent as deltas against the
+    version the lock acknowledged.
+    """
+    device = models.ForeignKey(
+        'devices.Device',
+        on_delete=models.CASCADE,
+        related_name='credential_bundles'
+    )
+    version = models.PositiveIntegerField()
+
+    # Device secret version the digests were keyed with
+    secret_version = models.PositiveIntegerField()
+    entries = models.JSONField(default=list)
+
+    # Earliest credential revocation this version carries (for the
+    # revocation-to-enforcement latency measured at the ack)
+    revoked_at = models.DateTimeField(null=True, blank=True)
+    acked_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'credential_bundles'
+        verbose_name = 'Credential Bundle'
+        verbose_name_plural = 'Credential Bundles'
+        ordering = ['-version']
+        constraints = [
+            models.UniqueConstraint(fields=['device', 'version'], name='credential_bundles_device_version'),
+        ]
+
+    def __str__(self):
+        return f"Credential bundle v{self.version} for {self.device_id}"
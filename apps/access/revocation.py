@@ -0,0 +1,219 @@
+"""
+Credential revocation fan-out
+Deleting or changing a PIN / NFC credential publishes a revocation on a
+Redis channel once the change is committed. Every process listening on it
+reacts within milliseconds:
+
+- web / bridge workers reload their per-process snapshot copy of the
+  device (used for degraded-mode decisions when Redis is unreachable)
+- the MQTT bridge pushes the device's credential bundle to the lock,
+  coalescing revocations per device within a short window
+
+Locks acknowledge the bundle that removed the credential; the time from
+revocation to that ack is the revocation-to-enforcement latency.
+"""
+
+import json
+import logging
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from apps.core.utils.redis_client import get_redis, get_verify_cache_alias, redis_key
+
+logger = logging.getLogger(__name__)
+
+REVOCATION_CHANNEL = redis_key('credential_revocations')
+LATENCY_KEY = redis_key('revocation_enforcement_ms')
+LATENCY_SAMPLES = 1000
+
+_listener_lock = threading.Lock()
+_listener = None
+_push_to_locks = False
+
+# Device pk -> earliest revocation time (ms) waiting for a push to the lock
+_pending_pushes = {}
+_pending_lock = threading.Lock()
+_pending_event = threading.Event()
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+
+def _incr_stat(name, count=1):
+    with _stats_lock:
+        _stats[name] += count
+
+
+def get_push_window():
+    """Seconds revocations of one device are coalesced before the push"""
+    return getattr(settings, 'CREDENTIAL_REVOCATION_PUSH_WINDOW', 0.1)
+
+
+def schedule_revocation(device_pk):
+    """
+    Publish a revocation for the device once the change is committed
+    (after the shared snapshot has been refreshed)
+    """
+    transaction.on_commit(lambda: publish_revocation(device_pk, _now_ms()))
+
+
+def publish_revocation(device_pk, revoked_at_ms):
+    """
+    Publish a revocation to every listening process
+
+    Without Redis (e.g. local memory cache) the revocation is only
+    applied in this process.
+    """
+    message = {'device': str(device_pk), 'ts': revoked_at_ms}
+    try:
+        client = get_redis()
+        if client is not None:
+            client.publish(REVOCATION_CHANNEL, json.dumps(message))
+            return
+    except Exception as e:
+        logger.error(f"Failed to publish revocation for device {device_pk}: {str(e)}")
+    handle_revocation(message)
+
+
+def handle_revocation(message):
+    """
+    Apply a revocation in this process
+    """
+    from .snapshot import reload_local_snapshot
+
+    device_pk = message['device']
+    revoked_at_ms = message['ts']
+
+    if reload_local_snapshot(device_pk):
+        _incr_stat('local_reloads')
+
+    if _push_to_locks:
+        with _pending_lock:
+            _pending_pushes[device_pk] = min(_pending_pushes.get(device_pk, revoked_at_ms), revoked_at_ms)
+        _pending_event.set()
+
+
+def _push_pending():
+    from apps.devices.models import Device
+    from .credential_sync import sync_credentials
+
+    # Let revocations of the same devices arrive within the window
+    time.sleep(get_push_window())
+
+    with _pending_lock:
+        pending = dict(_pending_pushes)
+        _pending_pushes.clear()
+        _pending_event.clear()
+
+    close_old_connections()
+    for device_pk, revoked_at_ms in pending.items():
+        try:
+            device = Device.objects.only(*Device.VERIFY_FIELDS).get(pk=device_pk)
+            sync_credentials(
+                device,
+                revoked_at=datetime.fromtimestamp(revoked_at_ms / 1000, tz=dt_timezone.utc)
+            )
+            _incr_stat('lock_pushes')
+            _incr_stat('push_ms_total', _now_ms() - revoked_at_ms)
+        except Device.DoesNotExist:
+            continue
+        except Exception as e:
+            _incr_stat('push_errors')
+            logger.error(f"Revocation push failed for device {device_pk}: {str(e)}")
+
+
+def _push_worker():
+    while True:
+        _pending_event.wait()
+        _push_pending()
+
+
+def _listen():
+    while True:
+        try:
+            pubsub = get_redis().pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(REVOCATION_CHANNEL)
+            while True:
+                message = pubsub.get_message(timeout=1.0)
+                if message is not None:
+                    handle_revocation(json.loads(message['data']))
+        except Exception as e:
+            logger.error(f"Revocation listener error, reconnecting: {str(e)}")
+            time.sleep(1)
+
+
+def start_revocation_listener(push_to_locks=False):
+    """
+    Start listening for revocations in this process (idempotent)
+
+    Args:
+        push_to_locks: Also push credential bundles to locks (MQTT bridge)
+    """
+    global _listener, _push_to_locks
+    with _listener_lock:
+        if push_to_locks and not _push_to_locks:
+            _push_to_locks = True
+            threading.Thread(target=_push_worker, name='revocation-push', daemon=True).start()
+
+        if _listener is not None or get_redis() is None:
+            return
+        _listener = threading.Thread(target=_listen, name='revocation-listener', daemon=True)
+        _listener.start()
+
+
+def record_enforcement_latency(device, latency_ms):
+    """
+    Record the time from a revocation to the lock acknowledging it
+    """
+    latency_ms = max(0, int(latency_ms))
+    logger.info(f"Revocation enforced on {device.device_id} after {latency_ms} ms")
+    try:
+        client = get_redis()
+        if client is not None:
+            pipe = client.pipeline()
+            pipe.lpush(LATENCY_KEY, latency_ms)
+            pipe.ltrim(LATENCY_KEY, 0, LATENCY_SAMPLES - 1)
+            pipe.execute()
+    except Exception as e:
+        logger.warning(f"Failed to record revocation latency: {str(e)}")
+
+
+def get_revocation_stats():
+    """
+    Revocation-to-enforcement latency over the last acknowledged
+    revocations, plus this process's counters
+    """
+    with _stats_lock:
+        counters = dict(_stats)
+    stats = {
+        'local_reloads': counters.get('local_reloads', 0),
+        'lock_pushes': counters.get('lock_pushes', 0),
+        'push_errors': counters.get('push_errors', 0),
+    }
+    if stats['lock_pushes']:
+        stats['avg_push_ms'] = counters['push_ms_total'] // stats['lock_pushes']
+
+    try:
+        client = get_redis(get_verify_cache_alias())
+        samples = sorted(int(value) for value in client.lrange(LATENCY_KEY, 0, -1)) if client else []
+    except Exception:
+        samples = []
+
+    if samples:
+        stats['enforcement_ms'] = {
+            'samples': len(samples),
+            'p50': samples[len(samples) // 2],
+            'p95': samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+            'max': samples[-1],
+            'over_1s': sum(1 for value in samples if value > 1000),
+        }
+    return stats
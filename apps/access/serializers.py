@@ -4,8 +4,8 @@ Access serializers
 
 from rest_framework import serializers
 from django.utils import timezone
-from .models import NFCCard, PINCode, GuestAccess
-from apps.core.utils.encryption import hash_pin_code, verify_pin_code
+from .models import NFCCard, PINCode, GuestAccess, DigitalKey
+from apps.core.utils.encryption import hash_pin_code, verify_pin_code, b64url_decode
 
 
 class NFCCardSerializer(serializers.ModelSerializer):
@@ -189,4 +189,47 @@ class GuestAccessCreateSerializer(serializers.Serializer):
         if attrs['valid_from'] >= attrs['valid_until']:
             raise serializers.ValidationError('valid_until must be after valid_from')
 
-        return attrs
\ No newline at end of file
+        return attrs
+
+
+class DigitalKeySerializer(serializers.ModelSerializer):
+    """
+    Digital key serializer (the signed token is only returned on issue)
+    """
+    is_valid = serializers.BooleanField(read_only=True)
+    key_id = serializers.CharField(source='signing_key.key_id', read_only=True)
+
+    class Meta:
+        model = DigitalKey
+        fields = [
+            'id',
+            'device',
+            'user',
+            'key_id',
+            'permissions',
+            'valid_from',
+            'valid_until',
+            'revoked_at',
+            'is_valid',
+            'created_at',
+        ]
+        read_only_fields = fields
+
+
+class DigitalKeyIssueSerializer(serializers.Serializer):
+    """
+    Issue a digital key
+    """
+    lifetime_minutes = serializers.IntegerField(required=False, min_value=1)
+    holder_public_key = serializers.CharField(required=False, allow_blank=True, max_length=64)
+
+    def validate_holder_public_key(self, value):
+        """Must be a raw Ed25519 public key (32 bytes, base64url)"""
+        if not value:
+            return ''
+        try:
+            if len(b64url_decode(value)) != 32:
+                raise ValueError
+        except (ValueError, TypeError):
+            raise serializers.ValidationError('Must be a base64url-encoded 32-byte Ed25519 public key')
+        return value
@@ -2,13 +2,41 @@
 Access signals
 """
 
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from .models import NFCCard, PINCode
+from apps.devices.models import Device, DeviceSharing
+from .models import NFCCard, PINCode, GuestAccess, DigitalKey
+from .snapshot import refresh_credential_snapshot, delete_credential_snapshot, record_credential_use
+from .digital_keys import revoke_digital_keys
+from .credential_sync import schedule_credential_sync
+from .revocation import schedule_revocation
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Saves that only record a use do not change what a snapshot decides
+USAGE_FIELDS = {'usage_count', 'updated_at'}
+
+
+def schedule_usage_count(instance):
+    """
+    Count a use of a limited credential in the shared usage counter once
+    committed (degraded mode decides from it, not the snapshot's count)
+    """
+    if instance.max_usage:
+        credential_id, usage_count = instance.pk, instance.usage_count
+        transaction.on_commit(lambda: record_credential_use(credential_id, usage_count - 1))
+
+
+def schedule_snapshot_refresh(device_pk):
+    """
+    Refresh the device's credential snapshot once the change is committed,
+    and sync the change to the lock
+    """
+    transaction.on_commit(lambda: refresh_credential_snapshot(device_pk))
+    schedule_credential_sync(device_pk)
+
 
 @receiver(post_save, sender=NFCCard)
 def nfc_card_post_save(sender, instance, created, **kwargs):
@@ -18,6 +46,14 @@ def nfc_card_post_save(sender, instance, created, **kwargs):
     if created:
         logger.info(f"NFC card created: {instance.uid} for device {instance.device.device_id}")
 
+    update_fields = kwargs.get('update_fields')
+    if update_fields is None or not USAGE_FIELDS.issuperset(update_fields):
+        schedule_snapshot_refresh(instance.device_id)
+        if not created:
+            schedule_revocation(instance.device_id)
+    else:
+        schedule_usage_count(instance)
+
 
 @receiver(post_save, sender=PINCode)
 def pin_code_post_save(sender, instance, created, **kwargs):
@@ -25,4 +61,82 @@ def pin_code_post_save(sender, instance, created, **kwargs):
     Post-save signal for PIN Code
     """
     if created:
-        logger.info(f"PIN code created for device {instance.device.device_id}")
\ No newline at end of file
+        logger.info(f"PIN code created for device {instance.device.device_id}")
+
+    update_fields = kwargs.get('update_fields')
+    if update_fields is None or not USAGE_FIELDS.issuperset(update_fields):
+        schedule_snapshot_refresh(instance.device_id)
+        if not created:
+            schedule_revocation(instance.device_id)
+    else:
+        schedule_usage_count(instance)
+
+
+@receiver(post_delete, sender=NFCCard)
+@receiver(post_delete, sender=PINCode)
+def credential_post_delete(sender, instance, **kwargs):
+    """
+    Drop deleted credentials from the device's snapshot and revoke them
+    everywhere else
+    """
+    schedule_snapshot_refresh(instance.device_id)
+    schedule_revocation(instance.device_id)
+
+
+@receiver(post_save, sender=GuestAccess)
+@receiver(post_delete, sender=GuestAccess)
+def guest_access_changed(sender, instance, **kwargs):
+    """
+    Sync guest access changes to the lock
+    """
+    schedule_credential_sync(instance.device_id)
+
+
+@receiver(post_save, sender=Device)
+def device_snapshot_post_save(sender, instance, created, **kwargs):
+    """
+    Keep the snapshot and the lock's credential digests current after a
+    secret rotation
+    """
+    update_fields = kwargs.get('update_fields')
+    if not created and (update_fields is None or 'device_secret' in update_fields):
+        schedule_snapshot_refresh(instance.pk)
+
+
+@receiver(post_delete, sender=Device)
+def device_snapshot_post_delete(sender, instance, **kwargs):
+    """
+    Forget the snapshot of a deleted device
+    """
+    transaction.on_commit(lambda: delete_credential_snapshot(instance.pk))
+
+
+@receiver(post_save, sender=DeviceSharing)
+def sharing_digital_keys_post_save(sender, instance, created, **kwargs):
+    """
+    Revoke a shared user's digital keys when their sharing is narrowed
+    Keys issued afterwards carry the new permissions.
+    """
+    if created:
+        return
+
+    keys = DigitalKey.objects.filter(device_id=instance.device_id, user_id=instance.shared_with_id)
+
+    if not instance.is_active or not instance.can_unlock:
+        revoke_digital_keys(keys, 'Sharing revoked')
+    elif not instance.can_lock:
+        live = keys.filter(revoked_at__isnull=True).values_list('pk', 'permissions')
+        lock_keys = [pk for pk, permissions in live if 'lock' in permissions]
+        if lock_keys:
+            revoke_digital_keys(keys.filter(pk__in=lock_keys), 'Sharing permissions changed')
+
+
+@receiver(post_delete, sender=DeviceSharing)
+def sharing_digital_keys_post_delete(sender, instance, **kwargs):
+    """
+    Revoke a shared user's digital keys when the sharing is deleted
+    """
+    revoke_digital_keys(
+        DigitalKey.objects.filter(device_id=instance.device_id, user_id=instance.shared_with_id),
+        'Sharing deleted'
+    )
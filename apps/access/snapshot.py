@@ -0,0 +1,281 @@
+"""
+Last-known credential snapshots used for degraded-mode verification
+
+A snapshot holds everything needed to authenticate a device and decide a
+PIN / NFC verification without Postgres: the device's verify fields and
+its active credentials. Snapshots are stored encrypted in Redis (shared by
+all workers) and mirrored in a bounded per-process map that is used when
+Redis cannot be reached either.
+
+Uses of credentials with a max_usage are also counted in a shared Redis
+counter per credential, bumped on every use (database, offline upload and
+degraded decisions), since the snapshot's usage_count is only as recent
+as the snapshot.
+"""
+
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.dateparse import parse_datetime
+
+from apps.devices.models import Device
+from apps.core.utils.encryption import encrypt_data, decrypt_data
+from .models import NFCCard, PINCode
+
+logger = logging.getLogger(__name__)
+
+CREDENTIAL_FIELDS = ('id', 'name', 'user_id', 'valid_from', 'valid_until', 'usage_count', 'max_usage')
+DATETIME_FIELDS = ('valid_from', 'valid_until')
+
+# Re-check that the shared copy still exists at most this often (seconds)
+SNAPSHOT_RECHECK_INTERVAL = 3600
+
+# Per-process copies: device id -> (snapshot, last checked against Redis)
+_local_snapshots = OrderedDict()
+_local_snapshots_lock = threading.Lock()
+
+
+def get_snapshot_cache():
+    """
+    Cache used for snapshots (short socket timeouts when configured)
+    """
+    alias = getattr(settings, 'CREDENTIAL_SNAPSHOT_CACHE', 'default')
+    return caches[alias if alias in settings.CACHES else 'default']
+
+
+def get_snapshot_key(device_id):
+    return f"credential_snapshot:{device_id}"
+
+
+def get_usage_key(credential_id):
+    return f"credential_usage:{credential_id}"
+
+
+def record_credential_use(credential_id, usage_count, count=1):
+    """
+    Count uses of a limited credential in the shared usage counter
+
+    Args:
+        credential_id: NFCCard / PINCode pk
+        usage_count: Uses known before these ones (starts a missing counter)
+        count: Uses to add
+
+    Returns:
+        int: Uses counted so far, or None if Redis cannot be reached
+    """
+    cache = get_snapshot_cache()
+    key = get_usage_key(credential_id)
+    ttl = getattr(settings, 'CREDENTIAL_SNAPSHOT_TTL', 30 * 86400)
+    try:
+        cache.add(key, usage_count, ttl)
+        return cache.incr(key, count)
+    except Exception as e:
+        logger.warning(f"Credential usage counter unavailable for {credential_id}: {str(e)}")
+        return None
+
+
+def normalize_nfc_uid(uid):
+    """Normalize an NFC UID for comparison (uppercase, no spaces)"""
+    return uid.upper().replace(' ', '')
+
+
+def build_credential_snapshot(device_pk):
+    """
+    Build the snapshot of a device from the database
+
+    Args:
+        device_pk: Device primary key
+
+    Returns:
+        dict, or None if the device does not exist
+    """
+    device = Device.objects.filter(pk=device_pk).values(*Device.VERIFY_FIELDS).first()
+    if device is None:
+        return None
+
+    pins = list(PINCode.objects.filter(
+        device_id=device_pk,
+        is_active=True
+    ).values(*CREDENTIAL_FIELDS, 'pin_hash'))
+
+    nfc_cards = list(NFCCard.objects.filter(
+        device_id=device_pk,
+        is_active=True
+    ).values(*CREDENTIAL_FIELDS, 'uid'))
+
+    for card in nfc_cards:
+        card['uid'] = normalize_nfc_uid(card['uid'])
+
+    return {
+        'device': device,
+        'pins': pins,
+        'nfc_cards': nfc_cards,
+    }
+
+
+def _parse_snapshot(snapshot):
+    """Turn JSON-decoded values back into datetimes / strings"""
+    snapshot['device']['id'] = str(snapshot['device']['id'])
+    for credential in snapshot['pins'] + snapshot['nfc_cards']:
+        for field in DATETIME_FIELDS:
+            if credential[field] is not None:
+                credential[field] = parse_datetime(credential[field])
+    return snapshot
+
+
+def _remember_locally(device_id, snapshot):
+    if not _local_snapshots:
+        # Keep local copies current when credentials are revoked elsewhere
+        from .revocation import start_revocation_listener
+        start_revocation_listener()
+
+    max_size = getattr(settings, 'CREDENTIAL_SNAPSHOT_LOCAL_SIZE', 4096)
+    with _local_snapshots_lock:
+        _local_snapshots[device_id] = (snapshot, time.monotonic())
+        _local_snapshots.move_to_end(device_id)
+        while len(_local_snapshots) > max_size:
+            _local_snapshots.popitem(last=False)
+
+
+def store_credential_snapshot(snapshot):
+    """
+    Store a snapshot in Redis and in this process
+    """
+    device_id = str(snapshot['device']['id'])
+    payload = json.dumps(snapshot, cls=DjangoJSONEncoder, separators=(',', ':')).encode()
+    ttl = getattr(settings, 'CREDENTIAL_SNAPSHOT_TTL', 30 * 86400)
+
+    get_snapshot_cache().set(get_snapshot_key(device_id), encrypt_data(payload), ttl)
+    _remember_locally(device_id, _parse_snapshot(json.loads(payload)))
+
+
+def refresh_credential_snapshot(device_pk):
+    """
+    Rebuild and store the snapshot of a device (after credential changes)
+    Errors are logged, never raised: a stale snapshot must not break writes
+    """
+    try:
+        snapshot = build_credential_snapshot(device_pk)
+        if snapshot is None:
+            delete_credential_snapshot(device_pk)
+        else:
+            store_credential_snapshot(snapshot)
+    except Exception as e:
+        logger.error(f"Failed to refresh credential snapshot for device {device_pk}: {str(e)}")
+
+
+def delete_credential_snapshot(device_pk):
+    """
+    Forget the snapshot of a deleted device
+    """
+    device_id = str(device_pk)
+    with _local_snapshots_lock:
+        _local_snapshots.pop(device_id, None)
+    try:
+        get_snapshot_cache().delete(get_snapshot_key(device_id))
+    except Exception as e:
+        logger.error(f"Failed to delete credential snapshot for device {device_id}: {str(e)}")
+
+
+def reload_local_snapshot(device_pk):
+    """
+    Reload this process's copy of a device snapshot from Redis (after a
+    revocation); the copy is dropped if Redis does not have it
+
+    Returns:
+        bool: True if this process held a copy
+    """
+    device_id = str(device_pk)
+    if device_id not in _local_snapshots:
+        return False
+
+    try:
+        token = get_snapshot_cache().get(get_snapshot_key(device_id))
+    except Exception as e:
+        token = None
+        logger.warning(f"Credential snapshot cache unavailable on revocation: {str(e)}")
+
+    payload = decrypt_data(token) if token is not None else None
+    if payload is None:
+        # A stale copy could still accept the revoked credential
+        with _local_snapshots_lock:
+            _local_snapshots.pop(device_id, None)
+    else:
+        _remember_locally(device_id, _parse_snapshot(json.loads(payload)))
+    return True
+
+
+def snapshot_needs_check(device_pk):
+    """
+    Whether this process should check the shared snapshot of a device
+    (unknown locally, or last checked over SNAPSHOT_RECHECK_INTERVAL ago)
+    """
+    entry = _local_snapshots.get(str(device_pk))
+    return entry is None or time.monotonic() - entry[1] >= SNAPSHOT_RECHECK_INTERVAL
+
+
+def ensure_credential_snapshot(device_pk):
+    """
+    Make sure a shared snapshot exists for a device that is being verified
+    """
+    device_id = str(device_pk)
+    if not snapshot_needs_check(device_pk):
+        return
+    entry = _local_snapshots.get(device_id)
+
+    ttl = getattr(settings, 'CREDENTIAL_SNAPSHOT_TTL', 30 * 86400)
+    try:
+        exists = get_snapshot_cache().touch(get_snapshot_key(device_id), ttl)
+    except Exception as e:
+        logger.warning(f"Credential snapshot cache unavailable: {str(e)}")
+        return
+
+    if not exists:
+        refresh_credential_snapshot(device_pk)
+    elif entry is not None:
+        _remember_locally(device_id, entry[0])
+    else:
+        get_credential_snapshot(device_id)
+
+
+def get_credential_snapshot(device_id):
+    """
+    Get the last-known snapshot of a device
+
+    Redis is preferred, since it is updated by every worker on credential
+    changes; the per-process copy is used when Redis is unavailable.
+
+    Args:
+        device_id: Device UUID (as sent by the device)
+
+    Returns:
+        dict, or None if no snapshot is known
+    """
+    device_id = str(device_id)
+    try:
+        token = get_snapshot_cache().get(get_snapshot_key(device_id))
+    except Exception as e:
+        logger.warning(f"Credential snapshot cache unavailable, using local copy: {str(e)}")
+    else:
+        payload = decrypt_data(token) if token is not None else None
+        if payload is not None:
+            snapshot = _parse_snapshot(json.loads(payload))
+            _remember_locally(device_id, snapshot)
+            return snapshot
+
+    entry = _local_snapshots.get(device_id)
+    return entry[0] if entry is not None else None
+
+
+def snapshot_device(snapshot):
+    """
+    Unsaved Device carrying the snapshot's verify fields
+    """
+    return Device(**{**snapshot['device'], 'id': uuid.UUID(snapshot['device']['id'])})
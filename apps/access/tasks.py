@@ -0,0 +1,90 @@
+"""
+Access Celery tasks
+"""
+
+import json
+import logging
+from datetime import timedelta
+
+from celery import shared_task
+from django.core.cache import cache
+from django.utils import timezone
+
+from apps.devices.models import Device
+from mqtt.client import mqtt_publish
+from mqtt.topics import MQTTTopics
+from .models import DigitalKey
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def publish_key_state(device_id):
+    """
+    Publish a device's trusted keys and revocation list (retained)
+    """
+    from .digital_keys import build_key_state, get_revocation_pending_key
+
+    # Revocations from now on schedule a new push
+    cache.delete(get_revocation_pending_key(device_id))
+
+    try:
+        device = Device.objects.only('id', 'device_id').get(id=device_id)
+    except Device.DoesNotExist:
+        return {'success': False, 'error': 'Device not found'}
+
+    topic = MQTTTopics.get_keys_topic(device.device_id)
+    published = mqtt_publish(topic, json.dumps(build_key_state(device)), retain=True)
+
+    logger.info(f"Digital key state published to {device.device_id}")
+    return {'success': published}
+
+
+@shared_task
+def publish_trusted_keys():
+    """
+    Publish key state to every device after a signing key rotation
+    """
+    from .digital_keys import build_key_state, build_trusted_keys, get_active_signing_key
+
+    signing_key = get_active_signing_key()
+    trusted_keys = build_trusted_keys()
+    count = 0
+    for device in Device.objects.only('id', 'device_id').iterator(chunk_size=500):
+        topic = MQTTTopics.get_keys_topic(device.device_id)
+        mqtt_publish(topic, json.dumps(build_key_state(device, signing_key, trusted_keys)), retain=True)
+        count += 1
+
+    logger.info(f"Trusted signing keys published to {count} devices")
+    return {'success': True, 'devices': count}
+
+
+@shared_task
+def purge_expired_digital_keys(days=7):
+    """
+    Delete digital keys expired for more than `days` days
+    """
+    cutoff = timezone.now() - timedelta(days=days)
+    deleted, _ = DigitalKey.objects.filter(valid_until__lt=cutoff).delete()
+
+    logger.info(f"Purged {deleted} expired digital keys")
+    return {'success': True, 'deleted': deleted}
+
+
+@shared_task
+def sync_device_credentials(device_id):
+    """
+    Store a new credential bundle version for a device and send it
+    (as a delta from the version the lock acknowledged)
+    """
+    from .credential_sync import get_sync_pending_key, sync_credentials
+
+    # Changes from now on schedule a new sync
+    cache.delete(get_sync_pending_key(device_id))
+
+    try:
+        device = Device.objects.only(*Device.VERIFY_FIELDS).get(id=device_id)
+    except Device.DoesNotExist:
+        return {'success': False, 'error': 'Device not found'}
+
+    return sync_credentials(device)
@@ -19,7 +19,15 @@ urlpatterns = [
     # Guest Access
     path('devices/<uuid:device_id>/guest/', views.GuestAccessListCreateView.as_view(), name='guest-list-create'),
 
+    # Offline Digital Keys
+    path('devices/<uuid:device_id>/digital-keys/', views.DigitalKeyListCreateView.as_view(), name='digital-key-list-create'),
+    path('digital-keys/<uuid:pk>/', views.DigitalKeyRevokeView.as_view(), name='digital-key-revoke'),
+    path('digital-keys/public-keys/', views.DigitalKeyPublicKeysView.as_view(), name='digital-key-public-keys'),
+
     # Verification Endpoints (Public - no auth required)
     path('verify-pin/', views.VerifyPINView.as_view(), name='verify-pin'),
     path('verify-nfc/', views.VerifyNFCView.as_view(), name='verify-nfc'),
+
+    # Device Event Upload (Public - device HMAC signature)
+    path('events/batch/', views.DeviceEventBatchView.as_view(), name='event-batch'),
 ]
\ No newline at end of file
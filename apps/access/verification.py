@@ -0,0 +1,489 @@
+"""
+Signed device request verification
+Shared by the verify endpoints, batch event upload and MQTT handlers
+"""
+
+import hashlib
+import logging
+import math
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.utils import timezone
+from rest_framework import status
+
+from apps.devices.log_writer import emit_device_log
+from apps.devices.messages import LogMessage
+from apps.devices.models import Device
+from apps.core.utils.encryption import verify_device_hmac, verify_pin_code
+from apps.core.utils.replay import replay_guard
+from apps.core.throttling import DeviceRateThrottle, CredentialRateThrottle
+from .models import NFCCard, PINCode
+from .degraded import (
+    DB_UNAVAILABLE_ERRORS,
+    get_verify_breaker,
+    get_db_deadline,
+    get_degraded_config,
+    get_degraded_usage,
+    incr_stat,
+    maybe_replay_spool,
+    record_degraded_decision,
+    run_with_deadline,
+    submit_background,
+    verify_transaction,
+)
+from .failures import record_verify_failure
+from .snapshot import (
+    ensure_credential_snapshot,
+    get_credential_snapshot,
+    normalize_nfc_uid,
+    record_credential_use,
+    snapshot_device,
+    snapshot_needs_check,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class DeviceAuthError(Exception):
+    """
+    Raised when a signed device request cannot be authenticated
+    """
+    def __init__(self, message, status_code=status.HTTP_401_UNAUTHORIZED, retry_after=None):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+    @property
+    def headers(self):
+        """Extra response headers (Retry-After for throttled requests)"""
+        if self.retry_after is None:
+            return None
+        return {'Retry-After': str(max(1, math.ceil(self.retry_after)))}
+
+
+def get_signature_max_skew():
+    """
+    Max allowed clock skew (seconds) between device timestamp and server
+    """
+    return getattr(settings, 'DEVICE_SIGNATURE_MAX_SKEW', 300)
+
+
+def get_verify_device(device_id):
+    """
+    Load a device with the fields needed to authenticate its requests
+
+    Raises:
+        DeviceAuthError: 404 if the device does not exist
+    """
+    try:
+        return Device.objects.only(*Device.VERIFY_FIELDS).get(id=device_id)
+    except (Device.DoesNotExist, ValidationError, ValueError):
+        raise DeviceAuthError('Device not found', status.HTTP_404_NOT_FOUND)
+
+
+def authenticate_device_request(device_id, timestamp, signature, signed_value, device=None):
+    """
+    Authenticate a signed device request
+
+    Signature = HMAC-SHA256(device_secret, "device_id:timestamp:signed_value")
+
+    Args:
+        device_id: Device UUID (as sent by the device)
+        timestamp: Unix timestamp (int or str)
+        signature: HMAC signature sent by the device
+        signed_value: Value covered by the signature (PIN, NFC UID, payload)
+        device: Already loaded Device (optional, skips the lookup)
+
+    Returns:
+        Device loaded with Device.VERIFY_FIELDS
+
+    Raises:
+        DeviceAuthError: Device not found, bad signature, expired timestamp
+            or replayed request
+    """
+    # Get device
+    if device is None:
+        device = get_verify_device(device_id)
+
+    # Verify HMAC signature to prevent WiFi hijacking
+    if not verify_device_hmac(device_id, timestamp, signed_value, signature, device.device_secret,
+                              device_pk=device.pk, secret_version=device.secret_version):
+        logger.warning(f"Invalid HMAC signature for device {device.device_id}")
+        raise DeviceAuthError('Invalid signature - authentication failed')
+
+    # Check timestamp to prevent replay attacks
+    try:
+        request_time = int(timestamp)
+    except (TypeError, ValueError):
+        raise DeviceAuthError('Invalid timestamp', status.HTTP_400_BAD_REQUEST)
+
+    time_diff = abs(int(time.time()) - request_time)
+
+    if time_diff > get_signature_max_skew():
+        logger.warning(f"Timestamp too old for device {device.device_id}: {time_diff}s")
+        raise DeviceAuthError('Request expired - timestamp too old')
+
+    # Reject replays of a captured request within its validity window
+    if not replay_guard.check_and_remember(device.pk, signature, request_time):
+        logger.warning(f"Replayed request rejected for device {device.device_id}")
+        raise DeviceAuthError('Replay detected - request already used')
+
+    return device
+
+
+def throttle_device_request(device, credential=None, scope=None):
+    """
+    Apply the per-device (and optionally per-credential) token buckets
+
+    Must be called after the signature is verified, so the buckets are
+    keyed on an authenticated device identity rather than the client IP.
+
+    Args:
+        device: Authenticated Device
+        credential: Presented PIN / NFC UID (optional)
+        scope: Device bucket rate scope (default: verify_device)
+
+    Raises:
+        DeviceAuthError: 429 when a bucket is empty
+    """
+    device_throttle = DeviceRateThrottle(scope)
+    if not device_throttle.allow(device.pk):
+        logger.warning(f"Device rate limit exceeded for {device.device_id}")
+        raise DeviceAuthError(
+            'Too many requests from this device',
+            status.HTTP_429_TOO_MANY_REQUESTS,
+            retry_after=device_throttle.wait()
+        )
+
+    if credential is not None:
+        digest = hashlib.sha256(f"{device.pk}:{credential}".encode()).hexdigest()[:32]
+        credential_throttle = CredentialRateThrottle()
+        if not credential_throttle.allow(digest):
+            logger.warning(f"Credential rate limit exceeded for device {device.device_id}")
+            raise DeviceAuthError(
+                'Too many attempts with this credential',
+                status.HTTP_429_TOO_MANY_REQUESTS,
+                retry_after=credential_throttle.wait()
+            )
+
+
+# Credential type -> (label, model, snapshot key, DeviceLog event type)
+CREDENTIAL_TYPES = {
+    'pin': ('PIN', PINCode, 'pins', 'UNLOCK_PIN'),
+    'nfc': ('NFC', NFCCard, 'nfc_cards', 'UNLOCK_NFC'),
+}
+
+
+def get_invalid_reason(valid_from, valid_until, usage_count, max_usage, now):
+    """
+    Why a matching active credential cannot be used right now
+
+    Returns:
+        str reason, or None if the credential is valid
+    """
+    if max_usage and usage_count >= max_usage:
+        return 'max usage reached'
+    if valid_from and now < valid_from:
+        return 'not yet valid'
+    if valid_until and now > valid_until:
+        return 'expired'
+    return None
+
+
+def _decision(access_granted, message, status_code, info=None, degraded=False):
+    return {
+        'access_granted': access_granted,
+        'message': message,
+        'status_code': status_code,
+        'info': info,
+        'degraded': degraded,
+    }
+
+
+def _credential_info(name, valid_until, usage_count, max_usage):
+    return {
+        'name': name,
+        'valid_until': valid_until,
+        'usage_count': usage_count,
+        'max_usage': max_usage,
+    }
+
+
+def _failure_sample(method, presented, event_id, ip_address):
+    """Forensic details of a failed attempt (the UID of unknown cards, never a PIN)"""
+    sample = {'event_id': event_id, 'ip': ip_address}
+    if method == 'nfc':
+        sample['uid'] = presented
+    return sample
+
+
+def _matches(method, credential, presented):
+    """Check a presented PIN / NFC UID against a stored credential"""
+    if method == 'pin':
+        return verify_pin_code(presented, credential['pin_hash'])
+    return credential['uid'] == presented
+
+
+def verify_credential_with_db(method, device, presented, battery_level, event_id, deadline, abandoned,
+                              ip_address=None):
+    """
+    Decide a verification from the database and record its side effects
+    Runs on the verify thread pool (see run_with_deadline)
+
+    Args:
+        method: 'pin' or 'nfc'
+        device: Authenticated Device
+        presented: PIN code or normalized NFC UID
+        battery_level: Battery level reported with the request (NFC only)
+        event_id: Event id stored on the DeviceLog row
+        deadline: Monotonic deadline of the request
+        abandoned: threading.Event set when the request stopped waiting
+        ip_address: Client IP (kept in sampled failure details)
+
+    Returns:
+        dict: Verification decision
+    """
+    label, model, _, event_type = CREDENTIAL_TYPES[method]
+
+    with verify_transaction(deadline, abandoned):
+        now = timezone.now()
+
+        if method == 'nfc':
+            # Update device status
+            device.is_online = True
+            device.last_seen = now
+            update_fields = ['is_online', 'last_seen']
+            if battery_level is not None:
+                device.battery_level = battery_level
+                update_fields.append('battery_level')
+            device.save(update_fields=update_fields)
+
+        # Find all active credentials of this type for the device
+        for obj in model.objects.filter(device=device, is_active=True):
+            if method == 'pin':
+                if not verify_pin_code(presented, obj.pin_hash):
+                    continue
+            elif normalize_nfc_uid(obj.uid) != presented:
+                continue
+
+            # Credential matches! Now check validity
+            reason = get_invalid_reason(obj.valid_from, obj.valid_until, obj.usage_count, obj.max_usage, now)
+
+            if reason is None:
+                obj.increment_usage()
+
+                # Update device last_unlock
+                device.last_unlock = now
+                device.save(update_fields=['last_unlock'])
+
+                emit_device_log(
+                    device=device,
+                    user_id=obj.user_id,
+                    event_type=event_type,
+                    message=LogMessage.UNLOCKED_WITH,
+                    message_params={'method': method, 'name': obj.name},
+                    success=True,
+                    event_id=event_id
+                )
+
+                logger.info(f"{label} verified successfully for device {device.device_id}")
+
+                return _decision(
+                    True, f'{label} verified successfully', status.HTTP_200_OK,
+                    info=_credential_info(obj.name, obj.valid_until, obj.usage_count, obj.max_usage)
+                )
+
+            # Credential correct but expired/invalid
+            if not abandoned.is_set():
+                record_verify_failure(device, method, reason, {
+                    'event_id': event_id,
+                    'credential': obj.name,
+                    'ip': ip_address,
+                })
+
+            logger.warning(f"{label} correct but invalid for device {device.device_id}: {reason}")
+
+            return _decision(False, f'{label} is {reason}', status.HTTP_403_FORBIDDEN)
+
+        # No matching credential found (aggregated, not one row per guess)
+        if not abandoned.is_set():
+            record_verify_failure(
+                device, method,
+                'Invalid PIN code' if method == 'pin' else 'Invalid NFC UID',
+                _failure_sample(method, presented, event_id, ip_address)
+            )
+
+        logger.warning(f"Invalid {label} attempt for device {device.device_id}")
+
+        return _decision(
+            False, 'Invalid PIN code' if method == 'pin' else 'Invalid NFC card',
+            status.HTTP_401_UNAUTHORIZED
+        )
+
+
+def verify_credential_from_snapshot(method, device, snapshot, presented, event_id, ip_address=None):
+    """
+    Decide a verification from the last-known credential snapshot
+    Side effects are spooled and replayed once the database is back
+
+    Returns:
+        dict: Verification decision (degraded=True)
+    """
+    label, _, snapshot_key, _ = CREDENTIAL_TYPES[method]
+    now = timezone.now()
+
+    match = next((c for c in snapshot[snapshot_key] if _matches(method, c, presented)), None)
+
+    event = {
+        'event_id': event_id,
+        'method': method,
+        'credential_id': match['id'] if match is not None else None,
+        'success': False,
+        'timestamp': int(time.time()),
+        'reason': '',
+    }
+
+    if match is None:
+        event['reason'] = 'Invalid PIN code' if method == 'pin' else 'Invalid NFC UID'
+        decision = _decision(
+            False, 'Invalid PIN code' if method == 'pin' else 'Invalid NFC card',
+            status.HTTP_401_UNAUTHORIZED, degraded=True
+        )
+    else:
+        usage_count = match['usage_count'] + get_degraded_usage(device.pk, match['id'])
+        reason = get_invalid_reason(match['valid_from'], match['valid_until'], usage_count, match['max_usage'], now)
+
+        if reason is None and match['max_usage']:
+            # The snapshot's count misses uses since it was built and uses
+            # decided by other workers: reserve this use in the shared
+            # counter, and deny when it cannot be reached
+            counted = record_credential_use(match['id'], match['usage_count'])
+            if counted is None:
+                reason = 'limited and cannot be checked'
+            else:
+                usage_count = counted - 1
+                reason = get_invalid_reason(None, None, usage_count, match['max_usage'], now)
+
+        if reason is None:
+            event['success'] = True
+            decision = _decision(
+                True, f'{label} verified successfully', status.HTTP_200_OK,
+                info=_credential_info(match['name'], match['valid_until'], usage_count + 1, match['max_usage']),
+                degraded=True
+            )
+        else:
+            event['reason'] = reason
+            decision = _decision(False, f'{label} is {reason}', status.HTTP_403_FORBIDDEN, degraded=True)
+
+    record_degraded_decision(device, event, sample=_failure_sample(method, presented, event_id, ip_address))
+    logger.warning(
+        f"Degraded {label} decision for device {device.device_id}: "
+        f"{'granted' if event['success'] else 'denied'}"
+    )
+
+    return decision
+
+
+def _degraded_unavailable():
+    incr_stat('degraded_unavailable')
+    return DeviceAuthError(
+        'Verification temporarily unavailable',
+        status.HTTP_503_SERVICE_UNAVAILABLE,
+        retry_after=get_degraded_config()['RECOVERY_TIMEOUT']
+    )
+
+
+def verify_credential(method, device_id, presented, timestamp, signature, battery_level=None,
+                      expected_device_id=None, ip_address=None):
+    """
+    Verify a PIN / NFC credential presented at a device
+
+    The database path runs behind the verify circuit breaker and within a
+    deadline. When the circuit is open, or the database fails or does not
+    answer in time, the decision is made from the credential snapshot.
+
+    Args:
+        method: 'pin' or 'nfc'
+        device_id: Device UUID (as sent by the device)
+        presented: PIN code or NFC UID
+        timestamp: Request unix timestamp
+        signature: Request HMAC signature (covers the presented credential)
+        battery_level: Battery level reported with the request (optional)
+        expected_device_id: Hardware device ID the request must come from
+            (e.g. taken from the MQTT topic), optional
+        ip_address: Client IP (kept in sampled failure details), optional
+
+    Returns:
+        dict: access_granted, message, status_code, info, degraded
+
+    Raises:
+        DeviceAuthError: Authentication failed, throttled, or no decision
+            possible (503)
+    """
+    breaker = get_verify_breaker()
+    deadline = get_db_deadline()
+    use_db = breaker.allow_request()
+    device = None
+    snapshot = None
+
+    if use_db:
+        try:
+            device = run_with_deadline(get_verify_device, device_id, deadline=deadline)
+        except DB_UNAVAILABLE_ERRORS:
+            breaker.record_failure()
+            use_db = False
+        except DeviceAuthError:
+            # Device not found: the database answered
+            breaker.record_success()
+            raise
+        else:
+            breaker.record_success()
+
+    if device is None:
+        snapshot = get_credential_snapshot(device_id)
+        if snapshot is None:
+            raise _degraded_unavailable()
+        device = snapshot_device(snapshot)
+
+    if expected_device_id is not None and device.device_id != expected_device_id:
+        raise DeviceAuthError('Device ID does not match the request topic')
+
+    # Authenticate device (HMAC signature + timestamp)
+    authenticate_device_request(device_id, timestamp, signature, presented, device=device)
+    throttle_device_request(device, credential=presented)
+
+    if method == 'nfc':
+        # Normalize NFC UID (uppercase, remove spaces)
+        presented = normalize_nfc_uid(presented)
+
+    event_id = uuid.uuid4().hex
+
+    if use_db:
+        abandoned = threading.Event()
+        try:
+            decision = run_with_deadline(
+                verify_credential_with_db, method, device, presented, battery_level,
+                event_id, deadline, abandoned, ip_address,
+                deadline=deadline
+            )
+        except DB_UNAVAILABLE_ERRORS as e:
+            abandoned.set()
+            breaker.record_failure()
+            logger.error(f"Verify DB path failed for device {device.device_id}: {type(e).__name__}")
+        else:
+            breaker.record_success()
+            if snapshot_needs_check(device.pk):
+                submit_background(ensure_credential_snapshot, device.pk)
+            maybe_replay_spool()
+            return decision
+
+        snapshot = get_credential_snapshot(device_id)
+        if snapshot is None:
+            raise _degraded_unavailable()
+
+    return verify_credential_from_snapshot(method, device, snapshot, presented, event_id, ip_address)
@@ -2,15 +2,19 @@
 Access views
 """
 
+from datetime import timedelta
+
 from rest_framework import status, generics, permissions
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from django.db import transaction
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
+from django.utils.decorators import method_decorator
 from drf_spectacular.utils import extend_schema, OpenApiResponse
 import logging
 
-from .models import NFCCard, PINCode, GuestAccess
+from .models import NFCCard, PINCode, GuestAccess, DigitalKey
 from .serializers import (
     NFCCardSerializer,
     NFCCardCreateSerializer,
@@ -18,10 +22,20 @@ from .serializers import (
     PINCodeCreateSerializer,
     GuestAccessSerializer,
     GuestAccessCreateSerializer,
+    DigitalKeySerializer,
+    DigitalKeyIssueSerializer,
 )
 from apps.devices.models import Device
-from apps.devices.permissions import IsDeviceOwnerOrShared
-from apps.core.utils.encryption import verify_pin_code, verify_device_hmac
+from apps.devices.permissions import IsDeviceOwnerOrShared, CanUnlockDevice
+from apps.core.throttling import VerifyIPRateThrottle, UnlockRateThrottle
+from .verification import (
+    authenticate_device_request,
+    throttle_device_request,
+    verify_credential,
+    DeviceAuthError,
+)
+from .ingest import decode_event_batch, ingest_event_batch, EventBatchError
+from .digital_keys import issue_digital_key, revoke_digital_keys, build_trusted_keys, DigitalKeyError
 
 logger = logging.getLogger(__name__)
 
@@ -309,12 +323,34 @@ class GuestAccessListCreateView(generics.ListCreateAPIView):
         }, status=status.HTTP_201_CREATED)
 
 
+def verification_response(decision, info_key):
+    """
+    Build the device response for a verification decision
+    """
+    data = {
+        'success': decision['access_granted'],
+        'message': decision['message'],
+        'access_granted': decision['access_granted'],
+        'command': 'UNLOCK' if decision['access_granted'] else 'DENY',
+    }
+    if decision['info'] is not None:
+        data[info_key] = decision['info']
+    if decision['degraded']:
+        data['degraded'] = True
+    return Response(data, status=decision['status_code'])
+
+
+# Verify endpoints manage their own short DB transactions (see
+# verification.verify_credential): ATOMIC_REQUESTS would open the
+# connection before the view could apply its deadline.
+@method_decorator(transaction.non_atomic_requests, name='dispatch')
 class VerifyPINView(APIView):
     """
     Verify PIN code for device access
     Public endpoint - no authentication required
     """
     permission_classes = [permissions.AllowAny]
+    throttle_classes = [VerifyIPRateThrottle]
 
     @extend_schema(
         tags=['Access'],
@@ -338,7 +374,8 @@ class VerifyPINView(APIView):
                     'message': {'type': 'string'},
                     'access_granted': {'type': 'boolean'},
                     'pin_info': {'type': 'object'},
-                    'command': {'type': 'string', 'enum': ['UNLOCK', 'DENY']}
+                    'command': {'type': 'string', 'enum': ['UNLOCK', 'DENY']},
+                    'degraded': {'type': 'boolean', 'description': 'Decided from the last-known credential snapshot'}
                 }
             }
         }
@@ -372,138 +409,23 @@ class VerifyPINView(APIView):
                 'command': 'DENY'
             }, status=status.HTTP_400_BAD_REQUEST)
 
-        # Get device
         try:
-            device = Device.objects.get(id=device_id)
-        except Device.DoesNotExist:
-            return Response({
-                'success': False,
-                'message': 'Device not found',
-                'access_granted': False,
-                'command': 'DENY'
-            }, status=status.HTTP_404_NOT_FOUND)
-
-        # Verify HMAC signature to prevent WiFi hijacking
-        if not verify_device_hmac(device_id, timestamp, pin_code, signature, device.device_secret):
-            logger.warning(f"Invalid HMAC signature for device {device.device_id}")
+            decision = verify_credential(
+                'pin', device_id, pin_code, timestamp, signature,
+                ip_address=request.META.get('REMOTE_ADDR')
+            )
+        except DeviceAuthError as e:
             return Response({
                 'success': False,
-                'message': 'Invalid signature - authentication failed',
+                'message': e.message,
                 'access_granted': False,
                 'command': 'DENY'
-            }, status=status.HTTP_401_UNAUTHORIZED)
+            }, status=e.status_code, headers=e.headers)
 
-        # Check timestamp to prevent replay attacks (within 5 minutes)
-        import time
-        current_time = int(time.time())
-        request_time = int(timestamp)
-        time_diff = abs(current_time - request_time)
-
-        if time_diff > 300:  # 5 minutes
-            logger.warning(f"Timestamp too old for device {device.device_id}: {time_diff}s")
-            return Response({
-                'success': False,
-                'message': 'Request expired - timestamp too old',
-                'access_granted': False,
-                'command': 'DENY'
-            }, status=status.HTTP_401_UNAUTHORIZED)
-
-        # Find all active PIN codes for this device
-        active_pins = PINCode.objects.filter(
-            device=device,
-            is_active=True
-        )
-
-        # Check each PIN
-        now = timezone.now()
-        for pin_obj in active_pins:
-            # Verify PIN hash
-            if verify_pin_code(pin_code, pin_obj.pin_hash):
-                # PIN matches! Now check validity
-                is_valid = pin_obj.is_valid
-
-                if is_valid:
-                    # Increment usage count
-                    pin_obj.increment_usage()
-
-                    # Update device last_unlock
-                    device.last_unlock = now
-                    device.save(update_fields=['last_unlock'])
-
-                    # Log successful access
-                    from apps.devices.models import DeviceLog
-                    DeviceLog.objects.create(
-                        device=device,
-                        user=pin_obj.user,
-                        event_type='UNLOCK_PIN',
-                        description=f'Unlocked with PIN: {pin_obj.name}',
-                        success=True
-                    )
-
-                    logger.info(f"PIN verified successfully for device {device.device_id}")
-
-                    return Response({
-                        'success': True,
-                        'message': 'PIN verified successfully',
-                        'access_granted': True,
-                        'command': 'UNLOCK',
-                        'pin_info': {
-                            'name': pin_obj.name,
-                            'valid_until': pin_obj.valid_until,
-                            'usage_count': pin_obj.usage_count,
-                            'max_usage': pin_obj.max_usage
-                        }
-                    }, status=status.HTTP_200_OK)
-                else:
-                    # PIN correct but expired/invalid
-                    reason = 'expired'
-                    if pin_obj.max_usage and pin_obj.usage_count >= pin_obj.max_usage:
-                        reason = 'max usage reached'
-                    elif now < pin_obj.valid_from:
-                        reason = 'not yet valid'
-                    elif pin_obj.valid_until and now > pin_obj.valid_until:
-                        reason = 'expired'
-
-                    # Log failed attempt
-                    from apps.devices.models import DeviceLog
-                    DeviceLog.objects.create(
-                        device=device,
-                        event_type='UNLOCK_PIN',
-                        description=f'PIN valid but {reason}: {pin_obj.name}',
-                        success=False,
-                        error_message=reason
-                    )
-
-                    logger.warning(f"PIN correct but invalid for device {device.device_id}: {reason}")
-
-                    return Response({
-                        'success': False,
-                        'message': f'PIN is {reason}',
-                        'access_granted': False,
-                        'command': 'DENY'
-                    }, status=status.HTTP_403_FORBIDDEN)
-
-        # No matching PIN found
-        # Log failed attempt
-        from apps.devices.models import DeviceLog
-        DeviceLog.objects.create(
-            device=device,
-            event_type='UNLOCK_PIN',
-            description=f'Invalid PIN attempt',
-            success=False,
-            error_message='Invalid PIN code'
-        )
-
-        logger.warning(f"Invalid PIN attempt for device {device.device_id}")
-
-        return Response({
-            'success': False,
-            'message': 'Invalid PIN code',
-            'access_granted': False,
-            'command': 'DENY'
-        }, status=status.HTTP_401_UNAUTHORIZED)
+        return verification_response(decision, 'pin_info')
 
 
+@method_decorator(transaction.non_atomic_requests, name='dispatch')
 class VerifyNFCView(APIView):
     """
     Verify NFC card for device access
@@ -511,6 +433,7 @@ class VerifyNFCView(APIView):
     Used by IoT device when user taps NFC card
     """
     permission_classes = [permissions.AllowAny]
+    throttle_classes = [VerifyIPRateThrottle]
 
     @extend_schema(
         tags=['Access'],
@@ -535,7 +458,8 @@ class VerifyNFCView(APIView):
                     'message': {'type': 'string'},
                     'access_granted': {'type': 'boolean'},
                     'nfc_info': {'type': 'object'},
-                    'command': {'type': 'string', 'enum': ['UNLOCK', 'DENY']}
+                    'command': {'type': 'string', 'enum': ['UNLOCK', 'DENY']},
+                    'degraded': {'type': 'boolean', 'description': 'Decided from the last-known credential snapshot'}
                 }
             }
         }
@@ -570,145 +494,228 @@ class VerifyNFCView(APIView):
                 'command': 'DENY'
             }, status=status.HTTP_400_BAD_REQUEST)
 
-        # Get device
         try:
-            device = Device.objects.get(id=device_id)
-        except Device.DoesNotExist:
+            decision = verify_credential(
+                'nfc', device_id, nfc_uid, timestamp, signature,
+                battery_level=battery_level, ip_address=request.META.get('REMOTE_ADDR')
+            )
+        except DeviceAuthError as e:
             return Response({
                 'success': False,
-                'message': 'Device not found',
+                'message': e.message,
                 'access_granted': False,
                 'command': 'DENY'
-            }, status=status.HTTP_404_NOT_FOUND)
+            }, status=e.status_code, headers=e.headers)
+
+        return verification_response(decision, 'nfc_info')
+
 
-        # Verify HMAC signature to prevent WiFi hijacking
-        if not verify_device_hmac(device_id, timestamp, nfc_uid, signature, device.device_secret):
-            logger.warning(f"Invalid HMAC signature for device {device.device_id}")
+class DeviceEventBatchView(APIView):
+    """
+    Upload a batch of access events recorded by the device
+    Public endpoint - authenticated by device HMAC signature
+    Used by locks that verified credentials locally (e.g. while offline)
+    """
+    permission_classes = [permissions.AllowAny]
+    throttle_classes = [VerifyIPRateThrottle]
+
+    @extend_schema(
+        tags=['Access'],
+        request={
+            'application/json': {
+                'type': 'object',
+                'properties': {
+                    'device_id': {'type': 'string', 'format': 'uuid'},
+                    'timestamp': {'type': 'integer', 'description': 'Unix timestamp'},
+                    'events': {'type': 'string', 'description': 'base64(gzip(JSON array of events))'},
+                    'signature': {'type': 'string', 'description': 'HMAC-SHA256 signature (device_id:timestamp:events)'}
+                },
+                'required': ['device_id', 'timestamp', 'events', 'signature']
+            }
+        },
+        responses={
+            200: {
+                'type': 'object',
+                'properties': {
+                    'success': {'type': 'boolean'},
+                    'accepted': {'type': 'integer'},
+                    'duplicates': {'type': 'integer'},
+                    'rejected': {'type': 'integer'},
+                }
+            }
+        }
+    )
+    def post(self, request):
+        """
+        Ingest a signed event batch
+
+        The signature covers the encoded events string, so the HMAC is
+        checked once per batch rather than once per event.
+        Signature = HMAC-SHA256(device_secret, "device_id:timestamp:events")
+        """
+        device_id = request.data.get('device_id')
+        timestamp = request.data.get('timestamp')
+        signature = request.data.get('signature')
+        encoded_events = request.data.get('events')
+
+        if not device_id or not encoded_events or not timestamp or not signature:
             return Response({
                 'success': False,
-                'message': 'Invalid signature - authentication failed',
-                'access_granted': False,
-                'command': 'DENY'
-            }, status=status.HTTP_401_UNAUTHORIZED)
+                'message': 'Device ID, events, timestamp and signature are required'
+            }, status=status.HTTP_400_BAD_REQUEST)
 
-        # Check timestamp to prevent replay attacks (within 5 minutes)
-        import time
-        current_time = int(time.time())
-        request_time = int(timestamp)
-        time_diff = abs(current_time - request_time)
+        try:
+            device = authenticate_device_request(device_id, timestamp, signature, encoded_events)
+            throttle_device_request(device, scope='device_upload')
+        except DeviceAuthError as e:
+            return Response({
+                'success': False,
+                'message': e.message
+            }, status=e.status_code, headers=e.headers)
 
-        if time_diff > 300:  # 5 minutes
-            logger.warning(f"Timestamp too old for device {device.device_id}: {time_diff}s")
+        try:
+            events = decode_event_batch(encoded_events)
+        except EventBatchError as e:
             return Response({
                 'success': False,
-                'message': 'Request expired - timestamp too old',
-                'access_granted': False,
-                'command': 'DENY'
-            }, status=status.HTTP_401_UNAUTHORIZED)
+                'message': str(e)
+            }, status=status.HTTP_400_BAD_REQUEST)
 
-        # Update device status
-        device.is_online = True
-        device.last_seen = timezone.now()
-        if battery_level is not None:
-            device.battery_level = battery_level
-        device.save(update_fields=['is_online', 'last_seen', 'battery_level'])
+        result = ingest_event_batch(device, events, ip_address=request.META.get('REMOTE_ADDR'))
 
-        # Normalize NFC UID (uppercase, remove spaces)
-        nfc_uid = nfc_uid.upper().replace(' ', '')
+        return Response({
+            'success': True,
+            **result
+        }, status=status.HTTP_200_OK)
 
-        # Find all active NFC cards for this device
-        active_cards = NFCCard.objects.filter(
-            device=device,
-            is_active=True
-        )
 
-        # Check each NFC card
-        now = timezone.now()
-        for nfc_obj in active_cards:
-            # Normalize stored UID
-            stored_uid = nfc_obj.uid.upper().replace(' ', '')
-
-            if nfc_uid == stored_uid:
-                # NFC matches! Now check validity
-                is_valid = nfc_obj.is_valid
-
-                if is_valid:
-                    # Increment usage count
-                    nfc_obj.increment_usage()
-
-                    # Update device last_unlock
-                    device.last_unlock = now
-                    device.save(update_fields=['last_unlock'])
-
-                    # Log successful access
-                    from apps.devices.models import DeviceLog
-                    DeviceLog.objects.create(
-                        device=device,
-                        user=nfc_obj.user,
-                        event_type='UNLOCK_NFC',
-                        description=f'Unlocked with NFC card: {nfc_obj.name}',
-                        success=True
-                    )
-
-                    logger.info(f"NFC verified successfully for device {device.device_id}")
-
-                    return Response({
-                        'success': True,
-                        'message': 'NFC verified successfully',
-                        'access_granted': True,
-                        'command': 'UNLOCK',
-                        'nfc_info': {
-                            'name': nfc_obj.name,
-                            'valid_until': nfc_obj.valid_until,
-                            'usage_count': nfc_obj.usage_count,
-                            'max_usage': nfc_obj.max_usage
-                        }
-                    }, status=status.HTTP_200_OK)
-                else:
-                    # NFC correct but expired/invalid
-                    reason = 'expired'
-                    if nfc_obj.max_usage and nfc_obj.usage_count >= nfc_obj.max_usage:
-                        reason = 'max usage reached'
-                    elif now < nfc_obj.valid_from:
-                        reason = 'not yet valid'
-                    elif nfc_obj.valid_until and now > nfc_obj.valid_until:
-                        reason = 'expired'
-
-                    # Log failed attempt
-                    from apps.devices.models import DeviceLog
-                    DeviceLog.objects.create(
-                        device=device,
-                        event_type='UNLOCK_NFC',
-                        description=f'NFC valid but {reason}: {nfc_obj.name}',
-                        success=False,
-                        error_message=reason
-                    )
-
-                    logger.warning(f"NFC correct but invalid for device {device.device_id}: {reason}")
-
-                    return Response({
-                        'success': False,
-                        'message': f'NFC is {reason}',
-                        'access_granted': False,
-                        'command': 'DENY'
-                    }, status=status.HTTP_403_FORBIDDEN)
-
-        # No matching NFC found
-        # Log failed attempt
-        from apps.devices.models import DeviceLog
-        DeviceLog.objects.create(
+class DigitalKeyListCreateView(APIView):
+    """
+    List, issue and revoke offline digital keys for a device
+    Issued keys are verified by the lock itself, without the backend
+    """
+    permission_classes = [permissions.IsAuthenticated, CanUnlockDevice]
+
+    def get_throttles(self):
+        if self.request.method == 'POST':
+            return [UnlockRateThrottle()]
+        return super().get_throttles()
+
+    def get_device(self, request, device_id):
+        device = get_object_or_404(Device, pk=device_id)
+        self.check_object_permissions(request, device)
+        return device
+
+    @extend_schema(
+        tags=['Access'],
+        responses={200: DigitalKeySerializer(many=True)}
+    )
+    def get(self, request, device_id):
+        device = self.get_device(request, device_id)
+
+        keys = DigitalKey.objects.filter(
             device=device,
-            event_type='UNLOCK_NFC',
-            description=f'Invalid NFC UID: {nfc_uid}',
-            success=False,
-            error_message='Invalid NFC UID'
-        )
+            user=request.user,
+            revoked_at__isnull=True,
+            valid_until__gt=timezone.now()
+        ).select_related('signing_key')
 
-        logger.warning(f"Invalid NFC attempt for device {device.device_id}")
+        serializer = DigitalKeySerializer(keys, many=True)
+        return Response({
+            'success': True,
+            'count': len(serializer.data),
+            'data': serializer.data
+        })
+
+    @extend_schema(
+        tags=['Access'],
+        request=DigitalKeyIssueSerializer,
+        responses={201: DigitalKeySerializer}
+    )
+    def post(self, request, device_id):
+        device = self.get_device(request, device_id)
+
+        serializer = DigitalKeyIssueSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        lifetime_minutes = serializer.validated_data.get('lifetime_minutes')
+
+        try:
+            digital_key, token = issue_digital_key(
+                device,
+                request.user,
+                lifetime=timedelta(minutes=lifetime_minutes) if lifetime_minutes else None,
+                holder_public_key=serializer.validated_data.get('holder_public_key', '')
+            )
+        except DigitalKeyError as e:
+            return Response({
+                'success': False,
+                'message': e.message
+            }, status=e.status_code)
 
         return Response({
-            'success': False,
-            'message': 'Invalid NFC card',
-            'access_granted': False,
-            'command': 'DENY'
-        }, status=status.HTTP_401_UNAUTHORIZED)
\ No newline at end of file
+            'success': True,
+            'message': 'Digital key issued successfully',
+            'data': {
+                **DigitalKeySerializer(digital_key).data,
+                'token': token,
+            }
+        }, status=status.HTTP_201_CREATED)
+
+    @extend_schema(tags=['Access'])
+    def delete(self, request, device_id):
+        """
+        Revoke live digital keys: all of the device's keys for the owner
+        (e.g. lost phone), the caller's own keys otherwise
+        """
+        device = self.get_device(request, device_id)
+
+        keys = DigitalKey.objects.filter(device=device)
+        if device.owner_id != request.user.pk:
+            keys = keys.filter(user=request.user)
+
+        count = revoke_digital_keys(keys, f'Revoked by {request.user.email}')
+
+        return Response({
+            'success': True,
+            'message': f'{count} digital key(s) revoked'
+        }, status=status.HTTP_200_OK)
+
+
+class DigitalKeyRevokeView(APIView):
+    """
+    Revoke a digital key (key holder or device owner)
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    @extend_schema(tags=['Access'])
+    def delete(self, request, pk):
+        digital_key = get_object_or_404(DigitalKey.objects.select_related('device'), pk=pk)
+
+        if request.user.pk not in (digital_key.user_id, digital_key.device.owner_id):
+            return Response({
+                'success': False,
+                'message': 'You do not have permission to revoke this key'
+            }, status=status.HTTP_403_FORBIDDEN)
+
+        revoke_digital_keys(DigitalKey.objects.filter(pk=digital_key.pk), f'Revoked by {request.user.email}')
+
+        return Response({
+            'success': True,
+            'message': 'Digital key revoked successfully'
+        }, status=status.HTTP_200_OK)
+
+
+class DigitalKeyPublicKeysView(APIView):
+    """
+    Public keys locks use to verify digital keys
+    Public endpoint - used when provisioning a lock
+    """
+    permission_classes = [permissions.AllowAny]
+
+    @extend_schema(tags=['Access'])
+    def get(self, request):
+        return Response({
+            'success': True,
+            'data': build_trusted_keys()
+        })
@@ -0,0 +1,50 @@
+"""
+Django management command to apply the data retention policies
+"""
+
+from django.core.management.base import BaseCommand
+
+from apps.core.retention import apply_retention, get_policies
+
+
+class Command(BaseCommand):
+    """
+    Delete rows past their retention policy in primary-key chunks, archiving
+    them first where the policy asks for it, and report the delete rate.
+    """
+    help = 'Delete rows past their retention policy (chunked, throttled)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('labels', nargs='*', help='Model labels (default: every policy)')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the expired rows')
+
+    def handle(self, *args, **options):
+        policies = get_policies()
+        for label in options['labels']:
+            if label not in policies:
+                self.stderr.write(self.style.ERROR(f'No retention policy for {label}'))
+                return
+
+        results = apply_retention(labels=options['labels'], dry_run=options['dry_run'])
+
+        if options['dry_run']:
+            for label, result in results.items():
+                policy = policies[label]
+                self.stdout.write(f"{label}: {result['expired']} rows past {policy['DAYS']} days ({policy['FIELD']})")
+            self.stdout.write(self.style.SUCCESS(
+                f"✅ Would delete {sum(result['expired'] for result in results.values())} rows"
+            ))
+            return
+
+        for label, result in results.items():
+            if 'error' in result:
+                self.stderr.write(self.style.ERROR(f"{label}: {result['error']}"))
+                continue
+            self.stdout.write(
+                f"{label}: {result['deleted']} rows ({result['archived']} archived) in {result['seconds']}s, "
+                f"{result['rate']} rows/s, {result['lock_timeouts']} lock timeouts"
+                f"{'' if result['complete'] else ' (incomplete, resumed next run)'}"
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Deleted {sum(result.get('deleted', 0) for result in results.values())} rows"
+        ))
@@ -0,0 +1,73 @@
+"""
+Django management command to benchmark primary key locality
+Compares inserting random (v4) and time-ordered (v7) UUID primary keys
+"""
+
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from apps.core.utils.uuid7 import uuid7
+
+GENERATORS = {
+    'uuid4': uuid.uuid4,
+    'uuid7': uuid7,
+}
+
+
+class Command(BaseCommand):
+    help = 'Benchmark insert throughput and primary key index size for uuid4 vs uuid7 keys'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=200000)
+        parser.add_argument('--batch', type=int, default=1000, help='Rows per INSERT batch (one transaction each)')
+        parser.add_argument('--preload', type=int, default=200000,
+                            help='Rows inserted before measuring, so the index does not fit in a few pages')
+
+    def handle(self, *args, **options):
+        quote = connection.ops.quote_name
+        payload = 'x' * 100
+        results = {}
+
+        for name, generate in GENERATORS.items():
+            table = quote(f'bench_pk_{name}')
+            with connection.cursor() as cursor:
+                cursor.execute(f'DROP TABLE IF EXISTS {table}')
+                cursor.execute(f'CREATE TABLE {table} (id uuid PRIMARY KEY, payload text)')
+
+            def insert(count):
+                sql = f'INSERT INTO {table} (id, payload) VALUES (%s, %s)'
+                for start in range(0, count, options['batch']):
+                    rows = [(str(generate()), payload) for _ in range(min(options['batch'], count - start))]
+                    with transaction.atomic(), connection.cursor() as cursor:
+                        cursor.executemany(sql, rows)
+
+            try:
+                insert(options['preload'])
+                started = time.perf_counter()
+                insert(options['rows'])
+                elapsed = time.perf_counter() - started
+
+                index_size = None
+                if connection.vendor == 'postgresql':
+                    with connection.cursor() as cursor:
+                        cursor.execute(
+                            'SELECT pg_relation_size(i.indexrelid) FROM pg_index i '
+                            'WHERE i.indrelid = to_regclass(%s) AND i.indisprimary',
+                            [f'bench_pk_{name}']
+                        )
+                        index_size = cursor.fetchone()[0]
+            finally:
+                with connection.cursor() as cursor:
+                    cursor.execute(f'DROP TABLE IF EXISTS {table}')
+
+            results[name] = options['rows'] / elapsed
+            line = f"{name}: {results[name]:10.0f} rows/s"
+            if index_size is not None:
+                line += f", primary key index {index_size / 1024 / 1024:.1f} MB"
+            self.stdout.write(line)
+
+        speedup = results['uuid7'] / results['uuid4']
+        self.stdout.write(self.style.SUCCESS(f"✅ uuid7 insert throughput: {speedup:.2f}x uuid4"))
@@ -35,6 +35,10 @@ class Command(BaseCommand):
         if start_mqtt_client():
             self.stdout.write(self.style.SUCCESS('✅ MQTT bridge started successfully'))
             
+            # Push credential revocations to locks as they happen
+            from apps.access.revocation import start_revocation_listener
+            start_revocation_listener(push_to_locks=True)
+            
             # Keep the process alive
             try:
                 while not self.should_stop:
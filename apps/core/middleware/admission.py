@@ -0,0 +1,208 @@
+"""
+Admission control middleware
+Keeps door-critical requests fast when dashboards, admin pages or log
+browsing saturate the worker threads
+"""
+
+import logging
+import re
+import threading
+
+from django.conf import settings
+from django.http import JsonResponse
+from django.utils.deprecation import MiddlewareMixin
+
+logger = logging.getLogger('apps')
+
+LANE_CRITICAL = 'critical'
+LANE_INTERACTIVE = 'interactive'
+LANE_BULK = 'bulk'
+
+LANES = (LANE_CRITICAL, LANE_INTERACTIVE, LANE_BULK)
+
+DEFAULT_CRITICAL_PATHS = [
+    r'^/api/v1/access/verify-(pin|nfc)/$',
+    r'^/api/v1/access/events/batch/$',
+    r'^/api/v1/devices/[^/]+/(unlock|lock)/$',
+    r'^/health/$',
+]
+
+DEFAULT_BULK_PATHS = [
+    # Per-device log list, the streamed export and the full-text search
+    # (its facets read a sample of up to FACET_SAMPLE rows)
+    r'^/api/v1/devices/([^/]+/)?logs/',
+    # Cross-device feed: one scan per readable device over a 31-day window
+    r'^/api/v1/devices/activity/',
+    r'^/api/v1/security/',
+    r'^/admin/',
+    r'^/api/(schema|docs|redoc)/',
+]
+
+
+class AdmissionController:
+    """
+    Per-process concurrency limits by request class
+
+    - critical: always admitted (door verification, unlock/lock)
+    - interactive: admitted while fewer than NON_CRITICAL_LIMIT
+      interactive + bulk requests are in flight, may wait briefly
+    - bulk: additionally capped at BULK_LIMIT and shed first
+
+    With NON_CRITICAL_LIMIT below the worker thread count, at least one
+    thread per worker is always free for door-critical requests.
+    """
+    def __init__(self, config=None):
+        config = config or getattr(settings, 'ADMISSION_CONTROL', {})
+        self.non_critical_limit = config.get('NON_CRITICAL_LIMIT', 3)
+        self.bulk_limit = config.get('BULK_LIMIT', 1)
+        self.queue_timeout = {
+            LANE_INTERACTIVE: 0.25,
+            LANE_BULK: 0.0,
+            **config.get('QUEUE_TIMEOUT', {}),
+        }
+        self.critical_paths = [re.compile(p) for p in config.get('CRITICAL_PATHS', DEFAULT_CRITICAL_PATHS)]
+        self.bulk_paths = [re.compile(p) for p in config.get('BULK_PATHS', DEFAULT_BULK_PATHS)]
+
+        self._cond = threading.Condition()
+        self.in_flight = dict.fromkeys(LANES, 0)
+        self.admitted = dict.fromkeys(LANES, 0)
+        self.shed = dict.fromkeys(LANES, 0)
+
+    def classify(self, path):
+        """Get the lane for a request path"""
+        if any(p.match(path) for p in self.critical_paths):
+            return LANE_CRITICAL
+        if any(p.match(path) for p in self.bulk_paths):
+            return LANE_BULK
+        return LANE_INTERACTIVE
+
+    def _has_capacity(self, lane):
+        non_critical = self.in_flight[LANE_INTERACTIVE] + self.in_flight[LANE_BULK]
+        if non_critical >= self.non_critical_limit:
+            return False
+        if lane == LANE_BULK and self.in_flight[LANE_BULK] >= self.bulk_limit:
+            return False
+        return True
+
+    def acquire(self, lane):
+        """
+        Admit a request into a lane
+
+        Returns:
+            bool: False if the request must be shed
+        """
+        with self._cond:
+            if lane != LANE_CRITICAL:
+                timeout = self.queue_timeout.get(lane, 0.0)
+                if not self._cond.wait_for(lambda: self._has_capacity(lane), timeout=timeout):
+                    self.shed[lane] += 1
+                    return False
+            self.in_flight[lane] += 1
+            self.admitted[lane] += 1
+            return True
+
+    def release(self, lane):
+        """Release a lane slot"""
+        with self._cond:
+            self.in_flight[lane] -= 1
+            self._cond.notify_all()
+
+    def snapshot(self):
+        """Current counters for this process"""
+        with self._cond:
+            return {
+                'in_flight': dict(self.in_flight),
+                'admitted': dict(self.admitted),
+                'shed': dict(self.shed),
+                'limits': {
+                    'non_critical': self.non_critical_limit,
+                    'bulk': self.bulk_limit,
+                },
+            }
+
+
+_controller = None
+_controller_lock = threading.Lock()
+
+
+def get_admission_controller():
+    """
+    Get the per-process admission controller
+    """
+    global _controller
+    if _controller is None:
+        with _controller_lock:
+            if _controller is None:
+                _controller = AdmissionController()
+    return _controller
+
+
+def get_admission_stats():
+    """
+    In-flight / admitted / shed counts for this worker process
+    """
+    return get_admission_controller().snapshot()
+
+
+class AdmissionControlMiddleware(MiddlewareMixin):
+    """
+    Classify requests into lanes and enforce per-lane concurrency limits
+    Shed requests get 503 with Retry-After
+    """
+    def process_request(self, request):
+        controller = get_admission_controller()
+        lane = controller.classify(request.path)
+
+        if not controller.acquire(lane):
+            logger.warning(f"Admission control shed {lane} request: {request.method} {request.path}")
+            response = JsonResponse({
+                'success': False,
+                'error': {
+                    'message': 'Server is busy, please retry shortly',
+                    'code': 503,
+                }
+            }, status=503)
+            response['Retry-After'] = '1'
+            return response
+
+        request._admission_lane = lane
+
+    def process_response(self, request, response):
+        lane = getattr(request, '_admission_lane', None)
+        if lane is None:
+            return response
+
+        del request._admission_lane
+        controller = get_admission_controller()
+
+        if response.streaming:
+            # Hold the slot until the streamed body has been sent
+            response.streaming_content = _ReleasingIterator(
+                response.streaming_content,
+                lambda: controller.release(lane)
+            )
+        else:
+            controller.release(lane)
+
+        return response
+
+
+class _ReleasingIterator:
+    """
+    Wrap streaming content and run release exactly once when the WSGI
+    server closes the response (after the body is sent or on disconnect)
+    """
+    def __init__(self, content, release):
+        self._content = content
+        self._release = release
+        self._released = False
+
+    def __iter__(self):
+        return iter(self._content)
+
+    def close(self):
+        if hasattr(self._content, 'close'):
+            self._content.close()
+        if not self._released:
+            self._released = True
+            self._release()
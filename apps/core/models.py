@@ -5,6 +5,8 @@ Abstract base models for all apps
 from django.db import models
 import uuid
 
+from apps.core.utils.uuid7 import uuid7
+
 
 class TimeStampedModel(models.Model):
     """
@@ -25,4 +27,16 @@ class UUIDModel(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
 
     class Meta:
-        abstract = True
\ No newline at end of file
+        abstract = True
+
+
+class TimeOrderedUUIDModel(models.Model):
+    """
+    Abstract base class with a time-ordered UUID (v7) primary key
+    For append-heavy tables: new rows go to the end of the primary key
+    index. Same UUID format as UUIDModel.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid7, editable=False)
+
+    class Meta:
+        abstract = True
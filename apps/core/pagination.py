@@ -2,8 +2,18 @@
 Custom pagination classes
 """
 
-from rest_framework.pagination import PageNumberPagination
+import base64
+import binascii
+import json
+import uuid
+
+from django.db import connection
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 
 class StandardResultsSetPagination(PageNumberPagination):
@@ -32,4 +42,176 @@ class LargeResultsSetPagination(PageNumberPagination):
     """
     page_size = 100
     page_size_query_param = 'page_size'
-    max_page_size = 1000
\ No newline at end of file
+    max_page_size = 1000
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination over (created_at, id), newest first
+
+    Each page is one index range scan starting after the cursor row, with
+    no COUNT(*) and no OFFSET, so deep pages cost the same as the first.
+    Cursors are opaque (base64url JSON of the boundary row and direction).
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+
+        size = self.page_size + 1
+        # Optional second source holding the rows older than the queryset's
+        # (e.g. archived logs): get_archived_rows(boundary, reverse, limit)
+        archived = getattr(view, 'get_archived_rows', None)
+
+        if cursor is None:
+            reverse = False
+            queryset = queryset.order_by('-created_at', '-id')
+        else:
+            created_at, pk, reverse = cursor
+            if reverse:
+                # Rows newer than the cursor, nearest first
+                queryset = queryset.filter(
+                    Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk),
+                    created_at__gte=created_at
+                ).order_by('created_at', 'id')
+            else:
+                queryset = queryset.filter(
+                    Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk),
+                    created_at__lte=created_at
+                ).order_by('-created_at', '-id')
+
+        boundary = cursor[:2] if cursor is not None else None
+        if reverse:
+            page = archived(boundary, True, size) if archived else []
+            if len(page) < size:
+                page += self.fetch(queryset, size - len(page), view)
+        else:
+            page = self.fetch(queryset, size, view)
+            if len(page) < size and archived:
+                page += archived(boundary, False, size - len(page))
+
+        has_more = len(page) > self.page_size
+        page = page[:self.page_size]
+        if reverse:
+            page.reverse()
+
+        # Going back: the rows we came from follow; going forward: rows before the cursor
+        self.has_next = has_more if not reverse else True
+        self.has_previous = cursor is not None if not reverse else has_more
+        self.page = page
+        return page
+
+    def fetch(self, queryset, limit, view=None):
+        """First rows of the filtered, ordered queryset"""
+        return list(queryset[:limit])
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            padded = encoded + '=' * (-len(encoded) % 4)
+            data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            created_at = parse_datetime(data['t'])
+            if created_at is None:
+                raise ValueError(data['t'])
+            return created_at, uuid.UUID(data['id']), bool(data.get('r'))
+        except (TypeError, ValueError, KeyError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, row, reverse):
+        # Model instances or values() dicts
+        if isinstance(row, dict):
+            created_at, pk = row['created_at'], row['id']
+        else:
+            created_at, pk = row.created_at, row.id
+        data = {'t': created_at.isoformat(), 'id': uuid.UUID(str(pk)).hex}
+        if reverse:
+            data['r'] = 1
+        encoded = base64.urlsafe_b64encode(json.dumps(data, separators=(',', ':')).encode())
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, encoded.decode().rstrip('='))
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'page_size': self.page_size,
+            'results': data
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'page_size': {'type': 'integer'},
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Pagination cursor (next / previous link)',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Number of results per page',
+                'schema': {'type': 'integer'},
+            },
+        ]
+
+
+class MergedKeysetPagination(KeysetPagination):
+    """
+    KeysetPagination over many index ranges at once (e.g. the logs of
+    every device a user can read)
+
+    The view's get_merge_ranges() returns (field, values): each value gets
+    its own LIMITed scan of the (field, created_at) index, and the UNION
+    ALL of those is sorted and cut to the page, so no range is read past
+    one page whatever its size. Backends that cannot order and slice
+    compound query parts run the single query instead.
+    """
+
+    def fetch(self, queryset, limit, view=None):
+        field, values = view.get_merge_ranges()
+        values = list(values)
+        if len(values) < 2 or not connection.features.supports_slicing_ordering_in_compound:
+            return super().fetch(queryset, limit, view)
+
+        ordering = queryset.query.order_by
+        parts = [queryset.filter(**{field: value})[:limit] for value in values]
+        return list(parts[0].union(*parts[1:], all=True).order_by(*ordering)[:limit])
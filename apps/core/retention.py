@@ -0,0 +1,281 @@
+"""
+Data retention
+Each pruned model has a policy: the age field and age past which rows
+go, optional extra conditions, and whether rows are archived before
+they are deleted. Policies are declared in DEFAULT_POLICIES and can be
+overridden (or disabled with None) per model label in
+settings.DATA_RETENTION['POLICIES'].
+
+Rows are deleted in primary-key order, CHUNK_SIZE at a time, each chunk
+in its own short transaction with a lock timeout (PostgreSQL), with a
+pause between chunks so replicas, vacuum and live traffic keep up. A
+chunk that cannot get its locks is retried after a back-off; a run stops
+at MAX_SECONDS and the next run resumes where it left off. Archived rows
+are appended to gzip NDJSON files before their chunk is deleted:
+
+    <ARCHIVE_DIR>/retention/<app_label>.<model>/<YYYY-MM-DD>.ndjson.gz
+"""
+
+import gzip
+import json
+import logging
+import os
+import time
+from datetime import timedelta
+from pathlib import Path
+
+from django.apps import apps
+from django.conf import settings
+from django.db import OperationalError, connection, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Model label -> policy:
+#   FIELD: datetime field giving the row age
+#   DAYS: rows older than this many days are removed
+#   FILTER: extra conditions (filter() keyword arguments)
+#   ARCHIVE: write rows to the retention archive before deleting them
+DEFAULT_POLICIES = {
+    'security.SecurityEvent': {
+        'FIELD': 'created_at',
+        'DAYS': 90,
+        'FILTER': {'resolved': True},
+        'ARCHIVE': True,
+    },
+    # Normally moved to the cold archive (apps.devices.archive) and dropped
+    # with their partition long before; catches rows left in non-partitioned
+    # tables or the default partition
+    'devices.DeviceLog': {
+        'FIELD': 'created_at',
+        'DAYS': 366,
+    },
+    # Expired refresh tokens (their blacklist entries go with them)
+    'token_blacklist.OutstandingToken': {
+        'FIELD': 'expires_at',
+        'DAYS': 0,
+    },
+    'django_celery_results.TaskResult': {
+        'FIELD': 'date_done',
+        'DAYS': 7,
+    },
+    'django_celery_results.GroupResult': {
+        'FIELD': 'date_done',
+        'DAYS': 7,
+    },
+    'axes.AccessLog': {
+        'FIELD': 'attempt_time',
+        'DAYS': 90,
+    },
+    'axes.AccessFailureLog': {
+        'FIELD': 'attempt_time',
+        'DAYS': 90,
+    },
+}
+
+# Lock timeouts in a row before a policy is left for the next run
+MAX_LOCK_RETRIES = 3
+LOCK_NOT_AVAILABLE = '55P03'
+
+
+def get_retention_config():
+    """
+    Retention settings with defaults
+    """
+    config = {
+        'CHUNK_SIZE': 1000,         # rows per delete transaction
+        'SLEEP': 0.1,               # seconds between chunks
+        'LOCK_TIMEOUT': 2000,       # milliseconds a chunk may wait for row locks
+        'MAX_SECONDS': 20 * 60,     # per run, below the Celery soft time limit
+        'ARCHIVE_DIR': str(Path(settings.BASE_DIR) / 'archive'),
+        'POLICIES': {},
+    }
+    config.update(getattr(settings, 'DATA_RETENTION', {}))
+    return config
+
+
+def get_policies():
+    """
+    Effective policies of the installed models
+
+    Returns:
+        dict: model label -> policy (FIELD, DAYS, FILTER, ARCHIVE)
+    """
+    overrides = get_retention_config()['POLICIES']
+    policies = {}
+    for label in {**DEFAULT_POLICIES, **overrides}:
+        if label in overrides and overrides[label] is None:
+            continue
+        policy = {'FILTER': {}, 'ARCHIVE': False}
+        policy.update(DEFAULT_POLICIES.get(label, {}))
+        policy.update(overrides.get(label) or {})
+        try:
+            apps.get_model(label)
+        except LookupError:
+            continue
+        policies[label] = policy
+    return policies
+
+
+def expired_rows(label, policy, now=None):
+    """
+    Rows a policy removes
+
+    Returns:
+        QuerySet
+    """
+    model = apps.get_model(label)
+    cutoff = (now or timezone.now()) - timedelta(days=policy['DAYS'])
+    return model._base_manager.filter(**{f"{policy['FIELD']}__lt": cutoff}, **policy['FILTER'])
+
+
+def archive_path(label, now=None):
+    day = timezone.localdate(now or timezone.now())
+    return Path(get_retention_config()['ARCHIVE_DIR']) / 'retention' / label / f'{day:%Y-%m-%d}.ndjson.gz'
+
+
+def _archive_chunk(path, rows):
+    """
+    Append rows to an archive file as one gzip member, synced to disk
+    before the caller deletes them
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'ab') as raw:
+        with gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=6) as compressed:
+            for row in rows:
+                compressed.write(json.dumps(row, default=str, ensure_ascii=False).encode())
+                compressed.write(b'\n')
+        raw.flush()
+        os.fsync(raw.fileno())
+
+
+def _set_lock_timeout(milliseconds):
+    """Lock timeout of the current transaction (PostgreSQL)"""
+    if connection.vendor == 'postgresql' and milliseconds:
+        with connection.cursor() as cursor:
+            cursor.execute(f'SET LOCAL lock_timeout = {int(milliseconds)}')
+
+
+def _is_lock_timeout(error):
+    cause = error.__cause__
+    return (getattr(cause, 'pgcode', None) or getattr(cause, 'sqlstate', None)) == LOCK_NOT_AVAILABLE
+
+
+def _delete_chunk(queryset, pks, label, archive, lock_timeout):
+    """
+    Archive (optionally) and delete one chunk in its own transaction
+
+    Returns:
+        tuple: (rows deleted, rows archived)
+    """
+    with transaction.atomic():
+        _set_lock_timeout(lock_timeout)
+        chunk = queryset.filter(pk__in=pks)
+        archived = 0
+        if archive:
+            # Locked, so the rows written are the rows deleted
+            rows = list(chunk.select_for_update().values())
+            if not rows:
+                return 0, 0
+            _archive_chunk(archive_path(label), rows)
+            archived = len(rows)
+            pk_name = queryset.model._meta.pk.attname
+            chunk = queryset.model._base_manager.filter(pk__in=[row[pk_name] for row in rows])
+        _, per_model = chunk.delete()
+    return per_model.get(queryset.model._meta.label, 0), archived
+
+
+def apply_policy(label, policy, config=None, deadline=None):
+    """
+    Remove the expired rows of one model
+
+    Args:
+        label: Model label (app_label.Model)
+        policy: Retention policy
+        config: get_retention_config() result
+        deadline: time.monotonic() value at which to stop
+
+    Returns:
+        dict: deleted / archived / chunks / lock_timeouts / seconds / rate
+            (rows per second) / complete
+    """
+    config = config or get_retention_config()
+    queryset = expired_rows(label, policy)
+    started = time.monotonic()
+    result = {'deleted': 0, 'archived': 0, 'chunks': 0, 'lock_timeouts': 0, 'complete': False}
+
+    last_pk = None
+    retries = 0
+    while deadline is None or time.monotonic() < deadline:
+        page = queryset.order_by('pk')
+        if last_pk is not None:
+            page = page.filter(pk__gt=last_pk)
+        pks = list(page.values_list('pk', flat=True)[:config['CHUNK_SIZE']])
+        if not pks:
+            result['complete'] = True
+            break
+
+        try:
+            deleted, archived = _delete_chunk(queryset, pks, label, policy['ARCHIVE'], config['LOCK_TIMEOUT'])
+        except OperationalError as e:
+            if not _is_lock_timeout(e):
+                raise
+            result['lock_timeouts'] += 1
+            retries += 1
+            if retries > MAX_LOCK_RETRIES:
+                logger.warning(f"Retention {label}: giving up after {retries} lock timeouts: {str(e)}")
+                break
+            time.sleep(config['SLEEP'] * 10 * retries)
+            continue
+
+        retries = 0
+        last_pk = pks[-1]
+        result['deleted'] += deleted
+        result['archived'] += archived
+        result['chunks'] += 1
+        if len(pks) < config['CHUNK_SIZE']:
+            result['complete'] = True
+            break
+        time.sleep(config['SLEEP'])
+
+    result['seconds'] = round(time.monotonic() - started, 3)
+    result['rate'] = round(result['deleted'] / result['seconds'], 1) if result['seconds'] else 0.0
+    logger.info(
+        f"Retention {label}: {result['deleted']} rows deleted ({result['archived']} archived) "
+        f"in {result['seconds']}s, {result['rate']} rows/s"
+        f"{'' if result['complete'] else ', incomplete'}"
+    )
+    return result
+
+
+def apply_retention(labels=None, dry_run=False):
+    """
+    Apply the retention policies
+
+    Args:
+        labels: Model labels to prune (default: every policy)
+        dry_run: Only count the expired rows
+
+    Returns:
+        dict: model label -> apply_policy() result (dry run: {'expired': count})
+    """
+    config = get_retention_config()
+    policies = get_policies()
+    if labels:
+        policies = {label: policy for label, policy in policies.items() if label in labels}
+
+    if dry_run:
+        return {label: {'expired': expired_rows(label, policy).count()} for label, policy in policies.items()}
+
+    deadline = time.monotonic() + config['MAX_SECONDS']
+    results = {}
+    for label, policy in policies.items():
+        if time.monotonic() >= deadline:
+            logger.warning(f"Retention run out of time before {label}")
+            break
+        try:
+            results[label] = apply_policy(label, policy, config, deadline)
+        except Exception as e:
+            logger.error(f"Retention {label} failed: {str(e)}")
+            results[label] = {'error': str(e)}
+    return results
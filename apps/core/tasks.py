@@ -0,0 +1,21 @@
+"""
+Core Celery tasks
+"""
+
+from celery import shared_task
+
+
+@shared_task
+def apply_retention_policies():
+    """
+    Delete rows past their retention policy, in throttled chunks
+    (Periodic task)
+    """
+    from .retention import apply_retention
+
+    results = apply_retention()
+    return {
+        'success': not any('error' in result for result in results.values()),
+        'deleted': {label: result.get('deleted', 0) for label, result in results.items()},
+        'rates': {label: result.get('rate', 0.0) for label, result in results.items()},
+    }
@@ -2,8 +2,16 @@
 Custom throttling classes
 """
 
+import logging
+
+from django.conf import settings
+from redis.exceptions import RedisError
 from rest_framework.throttling import UserRateThrottle, AnonRateThrottle
 
+from apps.core.utils.redis_client import get_redis, get_verify_cache_alias, redis_key
+
+logger = logging.getLogger(__name__)
+
 
 class UnlockRateThrottle(UserRateThrottle):
     """
@@ -23,10 +31,141 @@ class VerifyRateThrottle(UserRateThrottle):
     scope = 'verify'
 
 
+class ExportRateThrottle(UserRateThrottle):
+    """
+    Throttle for log exports
+    30 requests per hour per user
+    """
+    rate = '30/hour'
+    scope = 'export'
+
+
 class AuthRateThrottle(AnonRateThrottle):
     """
     Throttle for authentication endpoints
     5 requests per minute
     """
     rate = '5/minute'
-    scope = 'auth'
\ No newline at end of file
+    scope = 'auth'
+
+
+class VerifyIPRateThrottle(AnonRateThrottle):
+    """
+    Coarse per-IP guard for public device endpoints
+    Many locks can share one NAT address, so the real limits are the
+    per-device token buckets applied after the signature is verified
+    """
+    scope = 'verify_ip'
+
+
+# Atomic token bucket: refill by elapsed time, then try to take one token.
+# Uses the Redis clock so every web worker sees the same time.
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local refill_per_ms = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1])
+local ts = tonumber(state[2])
+if tokens == nil then
+    tokens = capacity
+    ts = now
+end
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * refill_per_ms)
+local allowed = 0
+local wait_ms = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+else
+    wait_ms = math.ceil((1 - tokens) / refill_per_ms)
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / refill_per_ms))
+return {allowed, wait_ms}
+"""
+
+
+class TokenBucketThrottle:
+    """
+    Redis token bucket keyed on an arbitrary identity (e.g. device ID)
+
+    The rate is read from DEFAULT_THROTTLE_RATES[scope] ("num/period"):
+    the bucket holds num tokens and refills at num per period, so short
+    bursts are allowed while the long-run average stays bounded.
+    Uses the short-timeout verify cache client (VERIFY_CACHE) and fails
+    open when Redis is unavailable or slow, so doors keep working.
+    """
+    scope = None
+    _script = None
+
+    def __init__(self, scope=None):
+        if scope is not None:
+            self.scope = scope
+        self.num_requests, self.duration = self.parse_rate(self.get_rate())
+        self.wait_seconds = None
+
+    def get_rate(self):
+        return settings.REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'][self.scope]
+
+    @staticmethod
+    def parse_rate(rate):
+        num, period = rate.split('/')
+        duration = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}[period[0]]
+        return int(num), duration
+
+    def get_cache_key(self, ident):
+        return redis_key('throttle', self.scope, ident)
+
+    @classmethod
+    def _get_script(cls, client):
+        if TokenBucketThrottle._script is None:
+            TokenBucketThrottle._script = client.register_script(TOKEN_BUCKET_SCRIPT)
+        return TokenBucketThrottle._script
+
+    def allow(self, ident):
+        """
+        Take one token for ident
+
+        Returns:
+            bool: True if the request is allowed
+        """
+        self.wait_seconds = None
+        client = get_redis(get_verify_cache_alias())
+        if client is None:
+            return True
+
+        refill_per_ms = self.num_requests / (self.duration * 1000)
+        try:
+            allowed, wait_ms = self._get_script(client)(
+                keys=[self.get_cache_key(ident)],
+                args=[self.num_requests, repr(refill_per_ms)],
+                client=client,
+            )
+        except RedisError as e:
+            logger.warning(f"Token bucket unavailable ({self.scope}), allowing request: {str(e)}")
+            return True
+
+        if not allowed:
+            self.wait_seconds = int(wait_ms) / 1000
+        return bool(allowed)
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class DeviceRateThrottle(TokenBucketThrottle):
+    """
+    Per-device bucket for signed device requests (keyed on device pk)
+    """
+    scope = 'verify_device'
+
+
+class CredentialRateThrottle(TokenBucketThrottle):
+    """
+    Per-credential bucket for signed device requests
+    Keyed on a digest of (device, presented credential), so one card or
+    PIN hammering a lock cannot use up the whole device bucket
+    """
+    scope = 'verify_credential'
@@ -0,0 +1,115 @@
+"""
+Circuit breaker for calls to a dependency that can stall (e.g. Postgres)
+"""
+
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+STATE_HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+    """
+    Per-process circuit breaker
+
+    - closed: calls go through; `failure_threshold` consecutive failures
+      open the circuit
+    - open: calls are refused for `recovery_timeout` seconds
+    - half_open: a single probe call is let through; success closes the
+      circuit, failure opens it again
+
+    Args:
+        name: Name used in logs and metrics
+        failure_threshold: Consecutive failures that open the circuit
+        recovery_timeout: Seconds to stay open before probing
+        on_close: Callable run (outside the lock) when the circuit closes
+            again after being open
+    """
+    def __init__(self, name, failure_threshold=3, recovery_timeout=10, on_close=None):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.on_close = on_close
+
+        self._lock = threading.Lock()
+        self._state = STATE_CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+        self.times_opened = 0
+        self.rejected = 0
+
+    @property
+    def state(self):
+        return self._state
+
+    def allow_request(self):
+        """
+        Check whether a call may go to the dependency
+
+        Returns:
+            bool: False if the caller must use its fallback
+        """
+        if self._state == STATE_CLOSED:
+            return True
+
+        with self._lock:
+            if self._state == STATE_CLOSED:
+                return True
+            if (self._state == STATE_OPEN
+                    and time.monotonic() - self._opened_at >= self.recovery_timeout):
+                self._state = STATE_HALF_OPEN
+                self._probe_in_flight = False
+            if self._state == STATE_HALF_OPEN and (
+                    not self._probe_in_flight
+                    # A probe that never reported back does not block forever
+                    or time.monotonic() - self._opened_at >= 2 * self.recovery_timeout):
+                self._probe_in_flight = True
+                self._opened_at = time.monotonic() - self.recovery_timeout
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        """Record a successful call"""
+        if self._state == STATE_CLOSED and not self._failures:
+            return
+
+        with self._lock:
+            recovered = self._state != STATE_CLOSED
+            self._state = STATE_CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+        if recovered:
+            logger.info(f"Circuit '{self.name}' closed")
+            if self.on_close is not None:
+                self.on_close()
+
+    def record_failure(self):
+        """Record a failed or timed out call"""
+        with self._lock:
+            self._failures += 1
+            if self._state == STATE_HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != STATE_OPEN:
+                    self.times_opened += 1
+                    logger.error(f"Circuit '{self.name}' opened after {self._failures} failure(s)")
+                self._state = STATE_OPEN
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+    def snapshot(self):
+        """Current state and counters"""
+        with self._lock:
+            return {
+                'state': self._state,
+                'consecutive_failures': self._failures,
+                'times_opened': self.times_opened,
+                'rejected': self.rejected,
+            }
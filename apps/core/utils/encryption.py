@@ -2,11 +2,21 @@
 Encryption utilities
 """
 
+import base64
 import hashlib
 import hmac
+import threading
+from collections import OrderedDict
 from django.conf import settings
 
 
+# Per-process cache of prepared HMAC contexts, keyed by (device pk, secret version).
+# Each entry keeps the secret it was built from so a stale version can never
+# verify with the wrong key.
+_hmac_contexts = OrderedDict()
+_hmac_contexts_lock = threading.Lock()
+
+
 def hash_pin_code(pin_code):
     """
     Hash PIN code using SHA256
@@ -21,7 +31,67 @@ def verify_pin_code(pin_code, hashed_pin):
     return hash_pin_code(pin_code) == hashed_pin
 
 
-def generate_hmac_signature(device_id, timestamp, secret_key=None):
+def get_hmac_context(secret_key, device_pk=None, secret_version=None):
+    """
+    Get a fresh HMAC-SHA256 context keyed with secret_key
+
+    When device_pk and secret_version are given the keyed context is built
+    once per process and cloned with .copy() on every call, which skips
+    re-encoding the secret and re-deriving the inner/outer pads.
+
+    Args:
+        secret_key: Secret key (str)
+        device_pk: Device primary key used as cache key (optional)
+        secret_version: Device secret version used as cache key (optional)
+
+    Returns:
+        hmac.HMAC object ready for update()
+    """
+    if device_pk is None or secret_version is None:
+        return hmac.new(secret_key.encode(), digestmod=hashlib.sha256)
+
+    key = (device_pk, secret_version)
+
+    # Lock-free read: dict/OrderedDict operations are atomic under the GIL
+    entry = _hmac_contexts.get(key)
+    if entry is not None and entry[0] == secret_key:
+        try:
+            _hmac_contexts.move_to_end(key)
+        except KeyError:
+            pass  # Evicted concurrently; the entry we hold is still valid
+        return entry[1].copy()
+
+    context = hmac.new(secret_key.encode(), digestmod=hashlib.sha256)
+    max_size = getattr(settings, 'DEVICE_HMAC_CACHE_SIZE', 1024)
+
+    with _hmac_contexts_lock:
+        _hmac_contexts[key] = (secret_key, context)
+        _hmac_contexts.move_to_end(key)
+        while len(_hmac_contexts) > max_size:
+            _hmac_contexts.popitem(last=False)
+
+    return context.copy()
+
+
+def invalidate_hmac_context(device_pk):
+    """
+    Drop all cached HMAC contexts for a device (e.g. after secret rotation)
+    """
+    device_pk = str(device_pk)
+    with _hmac_contexts_lock:
+        for key in [key for key in _hmac_contexts if str(key[0]) == device_pk]:
+            del _hmac_contexts[key]
+
+
+def clear_hmac_contexts():
+    """
+    Drop every cached HMAC context in this process
+    """
+    with _hmac_contexts_lock:
+        _hmac_contexts.clear()
+
+
+def generate_hmac_signature(device_id, timestamp, secret_key=None, device_pk=None, secret_version=None):
     """
     Generate HMAC signature for device authentication
     """
@@ -29,11 +99,9 @@ def generate_hmac_signature(device_id, timestamp, secret_key=None):
         secret_key = settings.SECRET_KEY
     
     message = f"{device_id}:{timestamp}"
-    signature = hmac.new(
-        secret_key.encode(),
-        message.encode(),
-        hashlib.sha256
-    ).hexdigest()
+    context = get_hmac_context(secret_key, device_pk, secret_version)
+    context.update(message.encode())
+    signature = context.hexdigest()
     
     return signature
 
@@ -46,7 +114,7 @@ def verify_hmac_signature(device_id, timestamp, signature, secret_key=None):
     return hmac.compare_digest(signature, expected)
 
 
-def generate_device_hmac(device_id, timestamp, nfc_uid_or_pin, device_secret):
+def generate_device_hmac(device_id, timestamp, nfc_uid_or_pin, device_secret, device_pk=None, secret_version=None):
     """
     Generate HMAC signature for device communication
     Combines device_id, timestamp, and access code (NFC UID or PIN)
@@ -56,21 +124,21 @@ def generate_device_hmac(device_id, timestamp, nfc_uid_or_pin, device_secret):
         timestamp: Unix timestamp (int or str)
         nfc_uid_or_pin: NFC UID or PIN code
         device_secret: Device secret key
+        device_pk: Device primary key for the HMAC context cache (optional)
+        secret_version: Device secret version for the HMAC context cache (optional)
 
     Returns:
         HMAC signature (hex string)
     """
     message = f"{device_id}:{timestamp}:{nfc_uid_or_pin}"
-    signature = hmac.new(
-        device_secret.encode(),
-        message.encode(),
-        hashlib.sha256
-    ).hexdigest()
+    context = get_hmac_context(device_secret, device_pk, secret_version)
+    context.update(message.encode())
+    signature = context.hexdigest()
 
     return signature
 
 
-def verify_device_hmac(device_id, timestamp, nfc_uid_or_pin, signature, device_secret):
+def verify_device_hmac(device_id, timestamp, nfc_uid_or_pin, signature, device_secret, device_pk=None, secret_version=None):
     """
     Verify HMAC signature for device communication
 
@@ -80,9 +148,110 @@ def verify_device_hmac(device_id, timestamp, nfc_uid_or_pin, signature, device_s
         nfc_uid_or_pin: NFC UID or PIN code
         signature: HMAC signature to verify
         device_secret: Device secret key
+        device_pk: Device primary key for the HMAC context cache (optional)
+        secret_version: Device secret version for the HMAC context cache (optional)
 
     Returns:
         bool: True if signature is valid
     """
-    expected = generate_device_hmac(device_id, timestamp, nfc_uid_or_pin, device_secret)
-    return hmac.compare_digest(signature, expected)
\ No newline at end of file
+    expected = generate_device_hmac(
+        device_id, timestamp, nfc_uid_or_pin, device_secret,
+        device_pk=device_pk, secret_version=secret_version
+    )
+    return hmac.compare_digest(signature, expected)
+
+
+_fernet = None
+
+
+def _get_fernet():
+    """
+    Fernet cipher keyed from SECRET_KEY (built once per process)
+    """
+    global _fernet
+    if _fernet is None:
+        from cryptography.fernet import Fernet
+        key = hashlib.sha256(f"smartlock-data:{settings.SECRET_KEY}".encode()).digest()
+        _fernet = Fernet(base64.urlsafe_b64encode(key))
+    return _fernet
+
+
+def encrypt_data(data):
+    """
+    Encrypt bytes for storage outside the database (e.g. Redis)
+
+    Args:
+        data: Plain bytes
+
+    Returns:
+        Encrypted token (bytes)
+    """
+    return _get_fernet().encrypt(data)
+
+
+def decrypt_data(token):
+    """
+    Decrypt bytes produced by encrypt_data
+
+    Returns:
+        Plain bytes, or None if the token is invalid (e.g. SECRET_KEY changed)
+    """
+    from cryptography.fernet import InvalidToken
+    try:
+        return _get_fernet().decrypt(token)
+    except (InvalidToken, TypeError):
+        return None
+
+
+def _signing_key_password():
+    return hashlib.sha256(f"smartlock-signing:{settings.SECRET_KEY}".encode()).digest()
+
+
+def b64url_encode(data):
+    """Base64url without padding"""
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+def b64url_decode(data):
+    """Decode base64url with or without padding"""
+    return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+
+
+def generate_signing_keypair():
+    """
+    Generate an Ed25519 key pair
+
+    Returns:
+        tuple: (private key as PKCS8 PEM encrypted with a SECRET_KEY derived
+            password, raw public key as base64url)
+    """
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+
+    private_key = Ed25519PrivateKey.generate()
+    private_pem = private_key.private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PrivateFormat.PKCS8,
+        encryption_algorithm=serialization.BestAvailableEncryption(_signing_key_password())
+    ).decode()
+    public_raw = private_key.public_key().public_bytes(
+        encoding=serialization.Encoding.Raw,
+        format=serialization.PublicFormat.Raw
+    )
+    return private_pem, b64url_encode(public_raw)
+
+
+def load_signing_key(private_pem):
+    """
+    Load an Ed25519 private key produced by generate_signing_keypair
+    """
+    from cryptography.hazmat.primitives import serialization
+    return serialization.load_pem_private_key(private_pem.encode(), password=_signing_key_password())
+
+
+def load_verifying_key(public_key):
+    """
+    Load an Ed25519 public key from raw base64url
+    """
+    from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PublicKey
+    return Ed25519PublicKey.from_public_bytes(b64url_decode(public_key))
@@ -0,0 +1,44 @@
+"""
+Raw Redis access for features that need atomic Redis primitives
+(Lua scripts, streams, lists) beyond the Django cache API
+"""
+
+import logging
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Prefix for keys written through the raw client (mirrors CACHES KEY_PREFIX)
+KEY_PREFIX = 'smartlock'
+
+
+def get_redis(alias='default'):
+    """
+    Get the raw redis-py client behind a django-redis cache
+
+    Returns:
+        redis.Redis, or None if the cache backend is not django-redis
+        (e.g. local memory cache in tests)
+    """
+    try:
+        from django_redis import get_redis_connection
+        return get_redis_connection(alias)
+    except NotImplementedError:
+        return None
+
+
+def get_verify_cache_alias():
+    """
+    Cache alias for Redis calls on the device verify path
+    (settings.VERIFY_CACHE, short socket timeouts when configured)
+    """
+    alias = getattr(settings, 'VERIFY_CACHE', 'default')
+    return alias if alias in settings.CACHES else 'default'
+
+
+def redis_key(*parts):
+    """
+    Build a namespaced Redis key: smartlock:part1:part2
+    """
+    return ':'.join([KEY_PREFIX, *(str(part) for part in parts)])
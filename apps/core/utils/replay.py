@@ -0,0 +1,114 @@
+"""
+Replay protection for signed device requests
+"""
+
+import hashlib
+import logging
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from apps.core.utils.redis_client import get_verify_cache_alias
+
+logger = logging.getLogger(__name__)
+
+
+class RotatingBloomFilter:
+    """
+    Process-local bloom filter that forgets entries after one to two windows
+
+    Two generations are kept: new items go into the current one and
+    lookups check both. Every `window` seconds the previous generation is
+    dropped, so memory stays bounded no matter how long the process runs.
+    """
+    def __init__(self, capacity=100000, error_rate=0.001, window=300):
+        self.window = window
+        self.num_bits = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, min(16, round(self.num_bits / capacity * math.log(2))))
+        self._lock = threading.Lock()
+        self._current = bytearray((self.num_bits + 7) // 8)
+        self._previous = bytearray((self.num_bits + 7) // 8)
+        self._rotated_at = time.monotonic()
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def _maybe_rotate(self):
+        if time.monotonic() - self._rotated_at >= self.window:
+            self._previous = self._current
+            self._current = bytearray(len(self._previous))
+            self._rotated_at = time.monotonic()
+
+    def add(self, item):
+        positions = self._positions(item)
+        with self._lock:
+            self._maybe_rotate()
+            for pos in positions:
+                self._current[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, item):
+        positions = self._positions(item)
+        with self._lock:
+            self._maybe_rotate()
+            for bits in (self._current, self._previous):
+                if all(bits[pos >> 3] & (1 << (pos & 7)) for pos in positions):
+                    return True
+        return False
+
+
+class ReplayGuard:
+    """
+    Reject a signed request seen before within its validity window
+
+    The authoritative check is one atomic set-if-absent in the shared
+    verify cache (VERIFY_CACHE, Redis SET NX EX with short socket
+    timeouts) keyed on (device, signature), expiring when
+    the request's timestamp would fall out of the accepted skew window
+    anyway. A process-local bloom filter remembers recently accepted
+    signatures: when Redis cannot be reached a hit in the filter still
+    rejects the replay instead of failing open.
+    """
+    CACHE_PREFIX = 'replay'
+
+    def __init__(self, window=None, capacity=None):
+        self.window = window or getattr(settings, 'DEVICE_SIGNATURE_MAX_SKEW', 300)
+        capacity = capacity or getattr(settings, 'DEVICE_REPLAY_BLOOM_CAPACITY', 200000)
+        self.bloom = RotatingBloomFilter(capacity=capacity, window=self.window)
+
+    def get_cache_key(self, device_pk, signature):
+        return f"{self.CACHE_PREFIX}:{device_pk}:{signature}"
+
+    def check_and_remember(self, device_pk, signature, request_time):
+        """
+        Record a request signature
+
+        Args:
+            device_pk: Device primary key
+            signature: Request HMAC signature
+            request_time: Request unix timestamp (int)
+
+        Returns:
+            bool: True if this is the first time the signature is seen
+        """
+        token = f"{device_pk}:{signature}"
+        # Keep the key exactly as long as the timestamp stays acceptable
+        ttl = max(1, int(request_time) + self.window - int(time.time())) + 1
+
+        try:
+            first_seen = caches[get_verify_cache_alias()].add(self.get_cache_key(device_pk, signature), 1, ttl)
+        except Exception as e:
+            logger.warning(f"Replay cache unavailable, using local filter: {str(e)}")
+            first_seen = token not in self.bloom
+
+        self.bloom.add(token)
+        return first_seen
+
+
+# Shared per-process guard
+replay_guard = ReplayGuard()
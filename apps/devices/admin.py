@@ -3,7 +3,10 @@ Device admin
 """
 
 from django.contrib import admin
-from .models import Device, DeviceLog, DeviceSharing
+from django.contrib.auth import get_user_model
+from django.db.models import Q
+from .models import Device, DeviceAccessRollup, DeviceLog, DeviceSharing, DeviceStatusSummary
+from .search import text_filter
 
 
 @admin.register(Device)
@@ -74,6 +77,7 @@ class DeviceLogAdmin(admin.ModelAdmin):
     list_display = [
         'device',
         'event_type',
+        'rendered_description',
         'user',
         'success',
         'ip_address',
@@ -85,7 +89,9 @@ class DeviceLogAdmin(admin.ModelAdmin):
         'created_at',
     ]
     search_fields = ['device__device_id', 'device__name', 'user__email', 'description']
-    readonly_fields = ['id', 'created_at']
+    search_help_text = 'Device ID or name, user email, or words of the description / error'
+    readonly_fields = ['id', 'created_at', 'rendered_description']
+    exclude = ['search_vector']
     date_hierarchy = 'created_at'
     
     def has_add_permission(self, request):
@@ -94,6 +100,27 @@ class DeviceLogAdmin(admin.ModelAdmin):
     def has_change_permission(self, request, obj=None):
         return False
 
+    @admin.display(description='Description')
+    def rendered_description(self, obj):
+        return obj.get_description()
+
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Full-text match on the log text, or logs of the matching devices /
+        user, resolved first so every branch uses an index
+        """
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+
+        devices = Device.objects.filter(
+            Q(device_id__iexact=search_term) | Q(name__icontains=search_term)
+        ).values('pk')
+        users = get_user_model().objects.filter(email__iexact=search_term).values('pk')
+        return queryset.filter(
+            text_filter(search_term) | Q(device_id__in=devices) | Q(user_id__in=users)
+        ), False
+
 
 @admin.register(DeviceSharing)
 class DeviceSharingAdmin(admin.ModelAdmin):
@@ -119,4 +146,45 @@ class DeviceSharingAdmin(admin.ModelAdmin):
         'shared_with__email',
         'shared_by__email',
     ]
-    readonly_fields = ['id', 'created_at', 'updated_at']
\ No newline at end of file
+    readonly_fields = ['id', 'created_at', 'updated_at']
+
+
+@admin.register(DeviceStatusSummary)
+class DeviceStatusSummaryAdmin(admin.ModelAdmin):
+    """
+    Daily device heartbeat summary admin
+    """
+    list_display = [
+        'device',
+        'date',
+        'heartbeat_count',
+        'online_transitions',
+        'offline_transitions',
+        'min_battery_level',
+        'last_heartbeat_at',
+    ]
+    list_filter = ['date']
+    search_fields = ['device__device_id', 'device__name']
+    date_hierarchy = 'date'
+    readonly_fields = [field.name for field in DeviceStatusSummary._meta.fields]
+
+
+@admin.register(DeviceAccessRollup)
+class DeviceAccessRollupAdmin(admin.ModelAdmin):
+    """
+    Daily device access rollup admin
+    """
+    list_display = [
+        'device',
+        'date',
+        'app_unlocks',
+        'pin_unlocks',
+        'nfc_unlocks',
+        'physical_unlocks',
+        'failed_attempts',
+        'last_activity_at',
+    ]
+    list_filter = ['date']
+    search_fields = ['device__device_id', 'device__name']
+    date_hierarchy = 'date'
+    readonly_fields = [field.name for field in DeviceAccessRollup._meta.fields]
@@ -0,0 +1,320 @@
+"""
+Cold archive of old DeviceLog rows
+Whole months older than AFTER_MONTHS are moved out of the database into
+gzip NDJSON files, one per device and month (UTC, like the partitions):
+
+    <DIR>/device_logs/<device pk>/<YYYY-MM>.ndjson.gz
+
+Rows in a file are sorted by (created_at, id). Once a month is written
+the watermark (first instant not archived) is moved past it and its rows
+are removed from the database (the monthly partition is dropped on
+PostgreSQL). Reads split at the watermark: older rows come from the
+files, newer rows from the database, so the log list and the export see
+one continuous history. Files are read through mmap, no copy of the
+compressed file is kept in memory.
+"""
+
+import gzip
+import heapq
+import json
+import logging
+import mmap
+import os
+from datetime import timedelta, timezone as dt_timezone
+from itertools import groupby
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Min
+from django.utils.dateparse import parse_datetime
+
+from .log_writer import RowEncoder
+from .models import DeviceLog
+from .partitions import (
+    DEFAULT_PARTITION,
+    add_months,
+    current_month,
+    is_partitioned,
+    list_log_partitions,
+    partition_name,
+)
+from .serializers import DeviceLogRowSerializer
+
+logger = logging.getLogger(__name__)
+
+# Every column, plus the user columns rendered by the log list (the user
+# may be deleted by the time the archive is read) and the interned user agent
+ARCHIVE_FIELDS = tuple(dict.fromkeys((
+    *(field.attname for field in DeviceLog._meta.concrete_fields if field.attname != 'search_vector'),
+    *DeviceLogRowSerializer.VALUES,
+    'user_agent__value',
+)))
+DATETIME_FIELDS = ('created_at', 'user__created_at', 'user__updated_at')
+
+DB_CHUNK_SIZE = 2000
+DELETE_BATCH_SIZE = 5000
+
+
+def get_archive_config():
+    """
+    Archive settings with defaults
+    """
+    config = {
+        'DIR': str(Path(settings.BASE_DIR) / 'archive'),
+        'AFTER_MONTHS': 6,      # whole months kept in the database
+    }
+    config.update(getattr(settings, 'DEVICE_LOG_ARCHIVE', {}))
+    return config
+
+
+def archive_root():
+    return Path(get_archive_config()['DIR']) / 'device_logs'
+
+
+def month_path(device_pk, month):
+    return archive_root() / str(device_pk) / f'{month.year:04d}-{month.month:02d}.ndjson.gz'
+
+
+def get_archive_watermark():
+    """
+    First instant not archived: rows before it are only in the files
+
+    Returns:
+        datetime or None: None if nothing was archived yet
+    """
+    try:
+        return parse_datetime((archive_root() / 'WATERMARK').read_text().strip())
+    except FileNotFoundError:
+        return None
+
+
+def _set_watermark(value):
+    path = archive_root() / 'WATERMARK'
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix('.tmp')
+    tmp.write_text(value.isoformat())
+    os.replace(tmp, path)
+
+
+def _read_file(path):
+    """Rows of an archive file (dicts, datetimes parsed), in file order"""
+    try:
+        raw = open(path, 'rb')
+    except FileNotFoundError:
+        return
+    with raw:
+        if os.fstat(raw.fileno()).st_size == 0:
+            return
+        with mmap.mmap(raw.fileno(), 0, access=mmap.ACCESS_READ) as mapped, \
+                gzip.GzipFile(fileobj=mapped, mode='rb') as lines:
+            for line in lines:
+                row = json.loads(line)
+                for name in DATETIME_FIELDS:
+                    if row.get(name):
+                        row[name] = parse_datetime(row[name])
+                yield row
+
+
+def _write_file(path, rows):
+    """Write rows to path atomically (temporary file, fsync, rename)"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + '.tmp')
+    count = 0
+    with open(tmp, 'wb') as raw:
+        with gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=6, mtime=0) as compressed:
+            for row in rows:
+                compressed.write(json.dumps(row, cls=RowEncoder, ensure_ascii=False).encode())
+                compressed.write(b'\n')
+                count += 1
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(tmp, path)
+    return count
+
+
+def _sort_key(row):
+    return row['created_at'], str(row['id'])
+
+
+def _store_device_month(device_pk, month, rows):
+    """
+    Write the rows of one device and month, merged with an existing file
+    (rerun after an interrupted archive, or rows uploaded late)
+
+    Returns:
+        int: Number of rows not archived before
+    """
+    path = month_path(device_pk, month)
+    if not path.exists():
+        return _write_file(path, rows)
+
+    merged = {str(row['id']): row for row in _read_file(path)}
+    existing = len(merged)
+    for row in rows:
+        merged.setdefault(str(row['id']), row)
+    _write_file(path, sorted(merged.values(), key=_sort_key))
+    return len(merged) - existing
+
+
+def _delete_month(month):
+    """Remove the archived rows of a month from the database"""
+    start, end = month, add_months(month, 1)
+
+    if is_partitioned():
+        quote = connection.ops.quote_name
+        name = partition_name(month)
+        with transaction.atomic(), connection.cursor() as cursor:
+            if name in {existing for existing, _ in list_log_partitions()}:
+                cursor.execute(f'DROP TABLE {quote(name)}')
+            cursor.execute(
+                f'DELETE FROM {quote(DEFAULT_PARTITION)} WHERE created_at >= %s AND created_at < %s',
+                [start.isoformat(), end.isoformat()]
+            )
+        return
+
+    rows = DeviceLog.objects.filter(created_at__gte=start, created_at__lt=end)
+    while True:
+        pks = list(rows.values_list('pk', flat=True)[:DELETE_BATCH_SIZE])
+        if not pks:
+            break
+        DeviceLog.objects.filter(pk__in=pks).delete()
+
+
+def archive_month(month):
+    """
+    Archive every DeviceLog row of a month (UTC), then remove them from
+    the database
+
+    Returns:
+        int: Number of rows archived
+    """
+    end = add_months(month, 1)
+    rows = DeviceLog.objects.filter(
+        created_at__gte=month,
+        created_at__lt=end
+    ).order_by('device_id', 'created_at', 'id').values(*ARCHIVE_FIELDS)
+
+    count = 0
+    for device_pk, device_rows in groupby(rows.iterator(chunk_size=DB_CHUNK_SIZE), key=lambda row: row['device_id']):
+        count += _store_device_month(device_pk, month, device_rows)
+
+    # Files first, then the watermark, then the rows: readers always find
+    # every row on one side of the watermark
+    watermark = get_archive_watermark()
+    if watermark is None or watermark < end:
+        _set_watermark(end)
+    _delete_month(month)
+
+    logger.info(f"Archived {count} device log rows of {month:%Y-%m}")
+    return count
+
+
+def _months_between(start, end):
+    """First days of the months overlapping [start, end), oldest first"""
+    months = []
+    month = add_months(start.astimezone(dt_timezone.utc), 0)
+    while month < end:
+        months.append(month)
+        month = add_months(month, 1)
+    return months
+
+
+def archive_device_logs(after_months=None, dry_run=False):
+    """
+    Archive all whole months older than after_months
+
+    Returns:
+        list: (first day of month, rows) per month, oldest first
+    """
+    if after_months is None:
+        after_months = get_archive_config()['AFTER_MONTHS']
+
+    cutoff = add_months(current_month(), -after_months)
+    oldest = DeviceLog.objects.filter(created_at__lt=cutoff).aggregate(oldest=Min('created_at'))['oldest']
+    if oldest is None:
+        return []
+
+    months = _months_between(oldest, cutoff)
+    if dry_run:
+        return [
+            (month, DeviceLog.objects.filter(created_at__gte=month, created_at__lt=add_months(month, 1)).count())
+            for month in months
+        ]
+    return [(month, archive_month(month)) for month in months]
+
+
+def iter_archived_rows(device_pk, start, end):
+    """
+    Archived rows of a device with start <= created_at < end, oldest first
+    (streamed, one month file at a time)
+    """
+    for month in _months_between(start, end):
+        for row in _read_file(month_path(device_pk, month)):
+            if start <= row['created_at'] < end:
+                yield row
+
+
+def merge_archived_rows(device_pks, start, end):
+    """
+    Archived rows of several devices ordered by (created_at, id)
+    """
+    return heapq.merge(*(iter_archived_rows(pk, start, end) for pk in device_pks), key=_sort_key)
+
+
+def read_archived_page(device_pk, start, end, boundary=None, reverse=False, limit=20):
+    """
+    One page of archived rows of a device, for keyset pagination
+
+    Args:
+        start, end: created_at range
+        boundary: (created_at, id) of the cursor row, excluded
+        reverse: Rows after the boundary oldest first, instead of rows
+            before it newest first
+        limit: Max rows
+
+    Returns:
+        list: Row dicts in page order
+    """
+    if boundary is not None:
+        created_at, pk = boundary[0], str(boundary[1])
+        if reverse:
+            start = max(start, created_at)
+        else:
+            end = min(end, created_at + timedelta(microseconds=1))
+
+    months = _months_between(start, end)
+    if not reverse:
+        months.reverse()
+
+    page = []
+    for month in months:
+        rows = [row for row in _read_file(month_path(device_pk, month)) if start <= row['created_at'] < end]
+        if not reverse:
+            rows.reverse()
+        for row in rows:
+            if boundary is not None:
+                key = _sort_key(row)
+                if (key <= (created_at, pk)) if reverse else (key >= (created_at, pk)):
+                    continue
+            page.append(row)
+            if len(page) >= limit:
+                return page
+    return page
+
+
+def get_archive_stats():
+    """
+    Archive size for monitoring
+
+    Returns:
+        dict: watermark, file count and total bytes
+    """
+    root = archive_root()
+    files = list(root.glob('*/*.ndjson.gz')) if root.exists() else []
+    watermark = get_archive_watermark()
+    return {
+        'watermark': watermark.isoformat() if watermark else None,
+        'files': len(files),
+        'bytes': sum(path.stat().st_size for path in files),
+    }
@@ -0,0 +1,161 @@
+"""
+Streaming DeviceLog export
+Rows are read through a server-side cursor (iterator(chunk_size=...)),
+preceded by the archived rows of the range (apps.devices.archive), and
+encoded in chunks of about CHUNK_BYTES as they are sent, optionally gzip
+compressed on the fly, so memory stays constant whatever the row count.
+"""
+
+import csv
+import io
+import json
+import zlib
+
+from django.db.models import Q
+from django.utils import timezone
+
+from .archive import get_archive_watermark, merge_archived_rows
+from .messages import describe
+from .models import Device, DeviceLog, DeviceSharing
+
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+}
+
+COLUMNS = (
+    ('created_at', 'created_at'),
+    ('device_id', 'device'),
+    ('device__name', 'device_name'),
+    ('event_type', 'event_type'),
+    ('success', 'success'),
+    ('description', 'description'),
+    ('error_message', 'error_message'),
+    ('attempt_count', 'attempt_count'),
+    ('user__email', 'user_email'),
+    ('ip_address', 'ip_address'),
+    ('event_id', 'event_id'),
+)
+
+# Read along with COLUMNS to render templated descriptions
+MESSAGE_FIELDS = ('message', 'message_params')
+
+DB_CHUNK_SIZE = 2000
+CHUNK_BYTES = 64 * 1024
+
+# Spreadsheet formula prefixes (CSV injection through names / descriptions)
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def readable_devices(user):
+    """
+    Devices whose logs a user may read: owned, or shared with log access
+    and not expired
+    """
+    now = timezone.now()
+    shared = DeviceSharing.objects.filter(
+        shared_with=user,
+        is_active=True,
+        can_view_logs=True
+    ).filter(Q(expires_at__isnull=True) | Q(expires_at__gt=now)).values('device_id')
+    return Device.objects.filter(Q(owner=user) | Q(pk__in=shared))
+
+
+def export_queryset(device_pks, start, end):
+    """
+    Rows of the export, oldest first, as value dicts of COLUMNS and
+    MESSAGE_FIELDS
+    """
+    return DeviceLog.objects.filter(
+        device_id__in=device_pks,
+        created_at__gte=start,
+        created_at__lt=end
+    ).order_by('created_at', 'id').values(*(field for field, _ in COLUMNS), *MESSAGE_FIELDS)
+
+
+def _export_row(row):
+    """Value tuple in COLUMNS order, with the description rendered"""
+    row['description'] = describe(row)
+    return tuple(row.get(field) for field, _ in COLUMNS)
+
+
+def export_rows(device_pks, start, end):
+    """
+    Rows of the export, oldest first: archived rows before the archive
+    watermark, then database rows
+    """
+    watermark = get_archive_watermark()
+    if watermark is not None and start < watermark:
+        names = {str(pk): name for pk, name in Device.objects.filter(pk__in=device_pks).values_list('pk', 'name')}
+        for row in merge_archived_rows(device_pks, start, min(end, watermark)):
+            row['device__name'] = names.get(row['device_id'], row['device__name'])
+            yield _export_row(row)
+        start = watermark
+
+    if start < end:
+        for row in export_queryset(device_pks, start, end).iterator(chunk_size=DB_CHUNK_SIZE):
+            yield _export_row(row)
+
+
+def _csv_cell(value):
+    if value is None:
+        return ''
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def _encode_rows(rows, fmt):
+    """Yield encoded text chunks of about CHUNK_BYTES"""
+    buffer = io.StringIO()
+    names = [name for _, name in COLUMNS]
+
+    if fmt == 'csv':
+        writer = csv.writer(buffer)
+        writer.writerow(names)
+        for row in rows:
+            writer.writerow([
+                value.isoformat() if index == 0 else _csv_cell(value)
+                for index, value in enumerate(row)
+            ])
+            if buffer.tell() >= CHUNK_BYTES:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+    else:
+        for row in rows:
+            record = dict(zip(names, row))
+            record['created_at'] = record['created_at'].isoformat()
+            record['device'] = str(record['device'])
+            buffer.write(json.dumps(record, ensure_ascii=False))
+            buffer.write('\n')
+            if buffer.tell() >= CHUNK_BYTES:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def stream_device_logs(rows, fmt, compress=False):
+    """
+    Encoded export chunks (bytes) for StreamingHttpResponse
+
+    Args:
+        rows: export_rows() result
+        fmt: 'csv' or 'ndjson'
+        compress: gzip the stream
+    """
+    chunks = (chunk.encode() for chunk in _encode_rows(rows, fmt))
+
+    if not compress:
+        yield from chunks
+        return
+
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
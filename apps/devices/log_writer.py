@@ -0,0 +1,514 @@
+"""
+Write-behind DeviceLog writer
+Handlers, tasks and views emit log rows instead of inserting them: rows are
+appended to a Redis Stream once the surrounding transaction commits, and
+the device log writer (manage.py run_device_log_writer) loads them in
+batches bounded by size and time, with COPY on PostgreSQL and bulk_create
+on other backends.
+
+Without Redis (e.g. local memory cache) rows are buffered in the emitting
+process and written by a background thread with the same loader.
+
+Rows get their primary key and created_at when emitted, so a batch that is
+loaded twice (writer crash before the ack) is skipped on conflict. A batch
+whose entries keep failing is written row by row, and rows the database
+rejects are moved to a dead-letter stream so they do not hold back the rest.
+"""
+
+import atexit
+import io
+import json
+import logging
+import socket
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import InterfaceError, OperationalError, close_old_connections, connection, transaction
+
+from apps.core.utils.redis_client import get_redis, get_verify_cache_alias, redis_key
+from .models import Device, DeviceLog
+from .recent import queue_recent_events
+from .rollups import record_access_rollups
+from .user_agents import MAX_LENGTH as USER_AGENT_MAX_LENGTH, intern_user_agents
+
+logger = logging.getLogger(__name__)
+
+STREAM_KEY = redis_key('device_log_stream')
+# Rows the database rejected (entry_id, error, row)
+DEAD_LETTER_KEY = redis_key('device_log_dead_letter')
+
+# Columns returned for inserted rows (daily access rollups)
+ROLLUP_COLUMNS = (
+    'device_id', 'event_type', 'success', 'attempt_count', 'created_at',
+    'message', 'message_params', 'description',
+)
+CONSUMER_GROUP = 'device-log-writer'
+
+_buffer = []
+_buffer_lock = threading.Lock()
+_buffer_event = threading.Event()
+_flusher = None
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def get_writer_config():
+    """
+    Device log writer settings with defaults
+    """
+    config = {
+        'BATCH_SIZE': 1000,         # max rows per load
+        'MAX_WAIT': 1.0,            # seconds a row may wait for its batch
+        'STREAM_MAXLEN': 1000000,   # rows kept in the stream if the writer is down
+        'CLAIM_IDLE': 60,           # seconds before another consumer's pending rows are taken over
+        'MAX_DELIVERIES': 5,        # deliveries of an entry before its batch is written row by row
+        'DEAD_LETTER_MAXLEN': 100000,   # rejected rows kept for inspection
+    }
+    config.update(getattr(settings, 'DEVICE_LOG_WRITER', {}))
+    return config
+
+
+def _incr_stat(name, count=1):
+    with _stats_lock:
+        _stats[name] += count
+
+
+class RowEncoder(DjangoJSONEncoder):
+    """JSON encoder keeping microseconds (DjangoJSONEncoder rounds to ms)"""
+    def default(self, o):
+        if isinstance(o, datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def _serialize(log):
+    """Column values of an unsaved DeviceLog as a JSON-safe dict (attname -> value)"""
+    return {
+        field.attname: field.pre_save(log, True)
+        for field in DeviceLog._meta.concrete_fields
+    }
+
+
+def emit_device_log(user_agent='', **fields):
+    """
+    Emit one DeviceLog row (same keyword arguments as DeviceLog, except
+    user_agent: the string, interned by the writer)
+    """
+    emit_device_logs([DeviceLog(**fields)], user_agent=user_agent)
+
+
+def emit_device_logs(logs, user_agent=''):
+    """
+    Emit unsaved DeviceLog instances to the writer once the current
+    transaction commits (immediately outside of one)
+
+    Args:
+        logs: List of unsaved DeviceLog instances
+        user_agent: User agent string of the request (optional)
+    """
+    if not logs:
+        return
+    rows = []
+    for log in logs:
+        row = _serialize(log)
+        if user_agent:
+            row['user_agent'] = user_agent[:USER_AGENT_MAX_LENGTH]
+        rows.append(json.dumps(row, cls=RowEncoder))
+    transaction.on_commit(lambda: _append(rows, logs))
+
+
+def _append(rows, logs=()):
+    try:
+        client = get_redis()
+        if client is not None:
+            maxlen = get_writer_config()['STREAM_MAXLEN']
+            pipe = client.pipeline(transaction=False)
+            for row in rows:
+                pipe.xadd(STREAM_KEY, {'row': row}, maxlen=maxlen, approximate=True)
+            # Recent events rings, same round trip
+            queue_recent_events(pipe, logs)
+            pipe.execute()
+            return
+    except Exception as e:
+        logger.warning(f"Device log stream unavailable, buffering locally: {str(e)}")
+
+    with _buffer_lock:
+        _buffer.extend(rows)
+        full = len(_buffer) >= get_writer_config()['BATCH_SIZE']
+    _ensure_flusher()
+    if full:
+        _buffer_event.set()
+
+
+def _copy_text(value):
+    """Encode a value for COPY ... FROM STDIN (text format)"""
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, (dict, list)):
+        value = json.dumps(value)
+    return (
+        str(value)
+        .replace('\\', '\\\\')
+        .replace('\t', '\\t')
+        .replace('\n', '\\n')
+        .replace('\r', '\\r')
+    )
+
+
+def _copy_rows(rows):
+    """
+    Load rows with COPY into a temporary table, then insert the rows whose
+    device still exists, skipping rows already stored
+
+    Returns:
+        list: Inserted rows (ROLLUP_COLUMNS dicts)
+    """
+    User = get_user_model()
+    quote = connection.ops.quote_name
+    columns = [field.column for field in DeviceLog._meta.concrete_fields]
+    attnames = [field.attname for field in DeviceLog._meta.concrete_fields]
+    table = quote(DeviceLog._meta.db_table)
+    column_list = ', '.join(quote(column) for column in columns)
+
+    data = io.StringIO()
+    for row in rows:
+        data.write('\t'.join(_copy_text(row.get(attname)) for attname in attnames))
+        data.write('\n')
+    data.seek(0)
+
+    # Users may have been deleted since (SET NULL, like the foreign key)
+    user_column = quote(DeviceLog._meta.get_field('user').column)
+    select_list = ', '.join(
+        f'(SELECT u.{quote(User._meta.pk.column)} FROM {quote(User._meta.db_table)} u '
+        f'WHERE u.{quote(User._meta.pk.column)} = l.{user_column})'
+        if quote(column) == user_column else f'l.{quote(column)}'
+        for column in columns
+    )
+    device_column = quote(DeviceLog._meta.get_field('device').column)
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f'CREATE TEMPORARY TABLE device_log_load (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP'
+        )
+        copy_sql = f'COPY device_log_load ({column_list}) FROM STDIN'
+        raw = cursor.cursor
+        if hasattr(raw, 'copy_expert'):
+            raw.copy_expert(copy_sql, data)
+        else:
+            # psycopg 3
+            with raw.copy(copy_sql) as copy:
+                copy.write(data.getvalue())
+        cursor.execute(
+            f'INSERT INTO {table} ({column_list}) '
+            f'SELECT {select_list} FROM device_log_load l '
+            f'WHERE EXISTS (SELECT 1 FROM {quote(Device._meta.db_table)} d '
+            f'WHERE d.{quote(Device._meta.pk.column)} = l.{device_column}) '
+            f'ON CONFLICT DO NOTHING '
+            f'RETURNING {", ".join(quote(column) for column in ROLLUP_COLUMNS)}'
+        )
+        return [dict(zip(ROLLUP_COLUMNS, row)) for row in cursor.fetchall()]
+
+
+def _bulk_create_rows(rows):
+    User = get_user_model()
+    device_pks = {str(pk) for pk in Device.objects.filter(
+        pk__in={row['device_id'] for row in rows}
+    ).values_list('pk', flat=True)}
+    user_pks = {str(pk) for pk in User.objects.filter(
+        pk__in={row['user_id'] for row in rows if row.get('user_id')}
+    ).values_list('pk', flat=True)}
+
+    logs = []
+    for row in rows:
+        if row['device_id'] not in device_pks:
+            continue
+        if row.get('user_id') and row['user_id'] not in user_pks:
+            row = {**row, 'user_id': None}
+        logs.append(DeviceLog(**{
+            field.attname: field.to_python(row.get(field.attname))
+            for field in DeviceLog._meta.concrete_fields
+        }))
+
+    DeviceLog.objects.bulk_create(logs, batch_size=500, ignore_conflicts=True)
+    return logs
+
+
+def _resolve_user_agents(rows):
+    """Replace user agent strings of emitted rows with interned ids"""
+    ids = intern_user_agents(row['user_agent'] for row in rows if row.get('user_agent'))
+    resolved = []
+    for row in rows:
+        if 'user_agent' in row:
+            row = dict(row)
+            row['user_agent_id'] = ids.get(row.pop('user_agent'))
+        resolved.append(row)
+    return resolved
+
+
+def write_device_logs(rows):
+    """
+    Store emitted rows and add them to the daily access rollups, in one
+    transaction
+
+    Args:
+        rows: List of row dicts (attname -> JSON value)
+
+    Returns:
+        int: Number of rows inserted (rows loaded, including skipped
+            duplicates, on backends without COPY)
+    """
+    if not rows:
+        return 0
+    with transaction.atomic():
+        rows = _resolve_user_agents(rows)
+        if connection.vendor == 'postgresql':
+            written = _copy_rows(rows)
+        else:
+            written = _bulk_create_rows(rows)
+        record_access_rollups(written)
+    _incr_stat('written', len(written))
+    return len(written)
+
+
+def flush_local_buffer():
+    """
+    Write rows buffered in this process (no Redis)
+
+    Returns:
+        int: Number of rows inserted
+    """
+    batch_size = get_writer_config()['BATCH_SIZE']
+    written = 0
+    while True:
+        with _buffer_lock:
+            rows = _buffer[:batch_size]
+            del _buffer[:batch_size]
+            _buffer_event.clear()
+        if not rows:
+            return written
+        try:
+            written += write_device_logs([json.loads(row) for row in rows])
+        except Exception as e:
+            logger.error(f"Failed to write buffered device logs, will retry: {str(e)}")
+            with _buffer_lock:
+                _buffer[:0] = rows
+            return written
+
+
+def _flush_worker():
+    while True:
+        _buffer_event.wait(get_writer_config()['MAX_WAIT'])
+        close_old_connections()
+        try:
+            flush_local_buffer()
+        except Exception as e:
+            logger.error(f"Device log flush error: {str(e)}")
+
+
+def _ensure_flusher():
+    global _flusher
+    if _flusher is not None:
+        return
+    with _buffer_lock:
+        if _flusher is None:
+            _flusher = threading.Thread(target=_flush_worker, name='device-log-flush', daemon=True)
+            _flusher.start()
+            atexit.register(flush_local_buffer)
+
+
+def _ensure_group(client):
+    try:
+        client.xgroup_create(STREAM_KEY, CONSUMER_GROUP, id='0', mkstream=True)
+    except Exception as e:
+        if 'BUSYGROUP' not in str(e):
+            raise
+
+
+def _claim_stale_entries(client, consumer, idle):
+    """
+    Take over entries left pending by other consumers for over `idle`
+    seconds (a writer that died, or ran under a host name that is gone)
+
+    Returns:
+        int: Number of entries claimed
+    """
+    claimed = 0
+    start_id = '0-0'
+    while True:
+        response = client.xautoclaim(
+            STREAM_KEY, CONSUMER_GROUP, consumer, int(idle * 1000),
+            start_id=start_id, count=1000
+        )
+        # Claimed entries are read back as this consumer's pending entries
+        start_id, entries = response[0], response[1]
+        claimed += len(entries)
+        if start_id in (b'0-0', '0-0'):
+            break
+    if claimed:
+        logger.warning(f"Device log writer {consumer} claimed {claimed} stale pending rows")
+    return claimed
+
+
+def _entry_row(fields):
+    """Serialized row of a stream entry (None if trimmed from the stream)"""
+    if not fields:
+        return None
+    return fields.get(b'row') or fields.get('row')
+
+
+def _ack(client, ids):
+    pipe = client.pipeline(transaction=False)
+    pipe.xack(STREAM_KEY, CONSUMER_GROUP, *ids)
+    pipe.xdel(STREAM_KEY, *ids)
+    pipe.execute()
+
+
+def _max_deliveries(client, consumer, entries):
+    """Highest delivery count among this consumer's pending entries"""
+    ids = [entry_id for entry_id, _ in entries]
+    pending = client.xpending_range(
+        STREAM_KEY, CONSUMER_GROUP, min=ids[0], max=ids[-1], count=len(ids), consumername=consumer
+    )
+    return max((item['times_delivered'] for item in pending), default=0)
+
+
+def _write_entries_one_by_one(client, entries, config):
+    """
+    Write a failing batch entry by entry, moving the rows the database
+    rejects to the dead-letter stream
+
+    Raises:
+        OperationalError / InterfaceError: Database unavailable (the
+            remaining entries stay pending)
+
+    Returns:
+        int: Number of rows dead-lettered
+    """
+    dead = 0
+    for entry_id, fields in entries:
+        if isinstance(entry_id, bytes):
+            entry_id = entry_id.decode()
+        row = _entry_row(fields)
+        if row is not None:
+            try:
+                write_device_logs([json.loads(row)])
+            except (OperationalError, InterfaceError):
+                raise
+            except Exception as e:
+                client.xadd(
+                    DEAD_LETTER_KEY,
+                    {'entry_id': entry_id, 'error': str(e)[:1000], 'row': row},
+                    maxlen=config['DEAD_LETTER_MAXLEN'], approximate=True
+                )
+                logger.error(f"Device log writer moved entry {entry_id} to the dead-letter stream: {str(e)}")
+                dead += 1
+        _ack(client, [entry_id])
+    _incr_stat('dead_lettered', dead)
+    return dead
+
+
+def run_stream_writer(should_stop, consumer=None):
+    """
+    Load rows from the stream until should_stop() is true
+
+    Entries are acknowledged and deleted after their batch is committed;
+    entries left pending by a failed load (or a previous run of the same
+    consumer) are loaded again first. Entries other consumers left pending
+    for over CLAIM_IDLE seconds are claimed at start and every CLAIM_IDLE.
+    Once an entry has been delivered MAX_DELIVERIES times its batch is
+    written row by row and rejected rows go to the dead-letter stream.
+
+    Args:
+        should_stop: Callable polled between batches
+        consumer: Consumer name (default: host name)
+    """
+    consumer = consumer or socket.gethostname()
+    client = get_redis()
+    if client is None:
+        raise RuntimeError('The device log writer needs the Redis cache backend')
+
+    _ensure_group(client)
+    start_id = '0'
+    next_claim = 0.0
+
+    while not should_stop():
+        config = get_writer_config()
+        entries = []
+        try:
+            if time.monotonic() >= next_claim:
+                next_claim = time.monotonic() + config['CLAIM_IDLE']
+                if _claim_stale_entries(client, consumer, config['CLAIM_IDLE']):
+                    start_id = '0'
+
+            if start_id == '0':
+                # Own pending entries first
+                response = client.xreadgroup(
+                    CONSUMER_GROUP, consumer, {STREAM_KEY: '0'}, count=config['BATCH_SIZE']
+                )
+                entries = response[0][1] if response else []
+                if not entries:
+                    start_id = '>'
+                    continue
+            else:
+                deadline = time.monotonic() + config['MAX_WAIT']
+                while len(entries) < config['BATCH_SIZE']:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    response = client.xreadgroup(
+                        CONSUMER_GROUP, consumer, {STREAM_KEY: '>'},
+                        count=config['BATCH_SIZE'] - len(entries),
+                        block=max(1, int(remaining * 1000))
+                    )
+                    if response:
+                        entries.extend(response[0][1])
+                    elif should_stop():
+                        break
+
+            if not entries:
+                continue
+
+            close_old_connections()
+            if start_id == '0' and _max_deliveries(client, consumer, entries) >= config['MAX_DELIVERIES']:
+                _write_entries_one_by_one(client, entries, config)
+                _incr_stat('batches')
+                continue
+
+            # Pending entries trimmed from the stream come back without fields
+            rows = [json.loads(row) for row in (_entry_row(fields) for _, fields in entries) if row is not None]
+            write_device_logs(rows)
+
+            _ack(client, [entry_id for entry_id, _ in entries])
+            _incr_stat('batches')
+        except Exception as e:
+            logger.error(f"Device log writer error, retrying: {str(e)}")
+            _incr_stat('errors')
+            start_id = '0'
+            time.sleep(1)
+
+
+def get_log_writer_stats():
+    """
+    Rows waiting to be written (stream backlog, local buffer) and this
+    process's writer counters
+    """
+    with _stats_lock:
+        stats = {name: _stats.get(name, 0) for name in ('written', 'batches', 'errors', 'dead_lettered')}
+    with _buffer_lock:
+        stats['buffered'] = len(_buffer)
+    try:
+        # Short-timeout client, a slow Redis must not hold the stats request
+        client = get_redis(get_verify_cache_alias())
+        if client is not None:
+            stats['backlog'] = client.xlen(STREAM_KEY)
+    except Exception:
+        pass
+    return stats
@@ -0,0 +1,37 @@
+"""
+Django management command to archive old DeviceLog months
+"""
+
+from django.core.management.base import BaseCommand
+
+from apps.devices.archive import archive_device_logs, get_archive_config, get_archive_stats
+
+
+class Command(BaseCommand):
+    """
+    Move whole months of device logs older than the archive age into gzip
+    NDJSON files (one per device and month) and remove them from the
+    database. The log list and the export keep reading them.
+    """
+    help = 'Archive DeviceLog months older than the archive age to compressed files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--after-months', type=int, default=get_archive_config()['AFTER_MONTHS'],
+                            help='Whole months kept in the database')
+        parser.add_argument('--dry-run', action='store_true', help='Only list the months and their row counts')
+
+    def handle(self, *args, **options):
+        months = archive_device_logs(options['after_months'], dry_run=options['dry_run'])
+
+        for month, count in months:
+            self.stdout.write(f'{month:%Y-%m}: {count} rows')
+
+        verb = 'Would archive' if options['dry_run'] else 'Archived'
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ {verb} {sum(count for _, count in months)} rows in {len(months)} month(s)'
+        ))
+        stats = get_archive_stats()
+        self.stdout.write(
+            f"Archive: {stats['files']} files, {stats['bytes'] / 1024 / 1024:.1f} MB, "
+            f"watermark {stats['watermark'] or 'none'}"
+        )
@@ -0,0 +1,43 @@
+"""
+Django management command to rebuild daily access rollups from DeviceLog
+"""
+
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from apps.devices.models import Device
+from apps.devices.rollups import rebuild_access_rollups
+
+
+class Command(BaseCommand):
+    """
+    Recompute DeviceAccessRollup rows for the last --days days (today
+    included), replacing existing rows of that range
+
+    Logs written for a device while it is being rebuilt can be missed;
+    run it when traffic is low or re-run it for the affected days.
+    """
+    help = 'Rebuild daily access rollups from device logs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30, help='Days to rebuild, today included')
+        parser.add_argument('--device', help='Only this device (UUID)')
+
+    def handle(self, *args, **options):
+        end = timezone.localdate() + timedelta(days=1)
+        start = end - timedelta(days=options['days'])
+
+        devices = Device.objects.all()
+        if options['device']:
+            devices = devices.filter(pk=options['device'])
+
+        device_count = day_count = 0
+        for device_pk in devices.values_list('pk', flat=True).iterator():
+            day_count += rebuild_access_rollups(device_pk, start, end)
+            device_count += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Rebuilt {day_count} daily rollups for {device_count} device(s) from {start} to {end - timedelta(days=1)}'
+        ))
@@ -0,0 +1,81 @@
+"""
+Django management command to benchmark a device logs page
+Compares DeviceLogSerializer over model instances with the values() read
+path used by DeviceLogsView
+"""
+
+import time
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from apps.devices.messages import LogMessage
+from apps.devices.models import Device, DeviceLog
+from apps.devices.serializers import DeviceLogRowSerializer, DeviceLogSerializer
+
+User = get_user_model()
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Benchmark query count and latency of one device logs page (rows are rolled back)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100, help='Rows per page')
+        parser.add_argument('--repeat', type=int, default=50)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options['rows'], options['repeat'])
+                raise Rollback()
+        except Rollback:
+            pass
+
+    def run(self, rows, repeat):
+        user = User.objects.create_user(email='bench-logs@example.com', password=None, first_name='Bench')
+        device = Device.objects.create(owner=user, device_id='BENCH_LOGS_PAGE', name='Bench door')
+        now = timezone.now()
+        DeviceLog.objects.bulk_create([
+            DeviceLog(
+                device=device,
+                user=user,
+                event_type='UNLOCK_PIN',
+                message=LogMessage.UNLOCKED_WITH,
+                message_params={'method': 'pin', 'name': f'bench {i}'},
+                created_at=now - timedelta(seconds=i)
+            )
+            for i in range(rows)
+        ])
+        queryset = DeviceLog.objects.filter(device=device).order_by('-created_at', '-id')
+
+        def nested():
+            return DeviceLogSerializer(list(queryset[:rows]), many=True).data
+
+        def flat():
+            return DeviceLogRowSerializer().many(DeviceLogRowSerializer.values(queryset)[:rows])
+
+        render = JSONRenderer().render
+        assert render(nested()) == render(flat()), 'read paths render different JSON'
+
+        results = {}
+        for name, func in (('nested', nested), ('values', flat)):
+            queries = []
+            with connection.execute_wrapper(lambda execute, sql, *args: queries.append(sql) or execute(sql, *args)):
+                func()
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                func()
+                timings.append(time.perf_counter() - started)
+            results[name] = min(timings) * 1000
+            self.stdout.write(f"{name:>7}: {len(queries):4d} queries, {results[name]:7.2f} ms/page")
+
+        self.stdout.write(self.style.SUCCESS(f"✅ values() read path: {results['nested'] / results['values']:.1f}x faster"))
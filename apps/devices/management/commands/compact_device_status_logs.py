@@ -0,0 +1,72 @@
+"""
+Django management command to compact heartbeat DEVICE_ONLINE logs
+"""
+
+from collections import defaultdict
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from apps.devices.models import Device, DeviceLog, DeviceStatusSummary
+
+DELETE_BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    """
+    Remove DEVICE_ONLINE rows written for every heartbeat before status
+    logging was limited to transitions
+
+    A row is kept when it starts a session (no earlier DEVICE_ONLINE row of
+    the device within --gap seconds); the rest are counted into daily
+    DeviceStatusSummary rows for days that have none, then deleted.
+    """
+    help = 'Collapse repeated DEVICE_ONLINE logs into transitions and daily summaries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--gap', type=int, default=300, help='Seconds without heartbeat that start a new session')
+        parser.add_argument('--dry-run', action='store_true', help='Only count rows that would be deleted')
+
+    def handle(self, *args, **options):
+        gap = timedelta(seconds=options['gap'])
+        dry_run = options['dry_run']
+        kept = deleted = 0
+
+        for device_pk in Device.objects.values_list('pk', flat=True).iterator():
+            rows = DeviceLog.objects.filter(
+                device_id=device_pk,
+                event_type='DEVICE_ONLINE'
+            ).order_by('created_at').values_list('pk', 'created_at')
+
+            days = defaultdict(list)
+            to_delete = []
+            previous = None
+            for pk, created_at in rows.iterator(chunk_size=5000):
+                days[timezone.localdate(created_at)].append(created_at)
+                if previous is None or created_at - previous > gap:
+                    kept += 1
+                else:
+                    to_delete.append(pk)
+                previous = created_at
+
+            deleted += len(to_delete)
+            if dry_run or not to_delete:
+                continue
+
+            DeviceStatusSummary.objects.bulk_create([
+                DeviceStatusSummary(
+                    device_id=device_pk,
+                    date=date,
+                    heartbeat_count=len(heartbeats),
+                    first_heartbeat_at=heartbeats[0],
+                    last_heartbeat_at=heartbeats[-1]
+                )
+                for date, heartbeats in days.items()
+            ], ignore_conflicts=True)
+
+            for i in range(0, len(to_delete), DELETE_BATCH_SIZE):
+                DeviceLog.objects.filter(pk__in=to_delete[i:i + DELETE_BATCH_SIZE]).delete()
+
+        verb = 'Would delete' if dry_run else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(f'✅ {verb} {deleted} heartbeat logs, kept {kept} transitions'))
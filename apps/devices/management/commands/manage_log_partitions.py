@@ -0,0 +1,49 @@
+"""
+Django management command to maintain DeviceLog monthly partitions
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.devices.partitions import (
+    create_future_partitions,
+    get_partition_config,
+    is_partitioned,
+    list_log_partitions,
+    remove_expired_partitions,
+)
+
+
+class Command(BaseCommand):
+    """
+    Pre-create monthly partitions of device_logs and remove the ones older
+    than the retention by dropping (or detaching) them whole
+    """
+    help = 'Create upcoming DeviceLog partitions and drop expired ones'
+
+    def add_arguments(self, parser):
+        config = get_partition_config()
+        parser.add_argument('--months-ahead', type=int, default=config['MONTHS_AHEAD'],
+                            help='Future months to create partitions for')
+        parser.add_argument('--retention-months', type=int, default=config['RETENTION_MONTHS'],
+                            help='Whole months of logs to keep')
+        parser.add_argument('--detach', action='store_true', default=config['DETACH'],
+                            help='Detach expired partitions instead of dropping them')
+        parser.add_argument('--dry-run', action='store_true', help='Only list expired partitions')
+
+    def handle(self, *args, **options):
+        if not is_partitioned():
+            raise CommandError('device_logs is not a partitioned table (PostgreSQL only)')
+
+        created = [] if options['dry_run'] else create_future_partitions(options['months_ahead'])
+        expired = remove_expired_partitions(
+            options['retention_months'],
+            detach=options['detach'],
+            dry_run=options['dry_run']
+        )
+
+        verb = 'Would remove' if options['dry_run'] else ('Detached' if options['detach'] else 'Dropped')
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Created {len(created)} partition(s), {verb.lower()} {len(expired)}: '
+            f'{", ".join(expired) or "none"}'
+        ))
+        self.stdout.write(f'Partitions: {", ".join(name for name, _ in list_log_partitions())}')
@@ -0,0 +1,36 @@
+"""
+Django management command to run the device log writer
+Loads DeviceLog rows emitted to the Redis stream in batches
+"""
+
+import signal
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Run the write-behind device log writer'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.should_stop = False
+
+    def add_arguments(self, parser):
+        parser.add_argument('--consumer', default=None, help='Consumer name (default: host name)')
+
+    def handle(self, *args, **options):
+        signal.signal(signal.SIGINT, self.signal_handler)
+        signal.signal(signal.SIGTERM, self.signal_handler)
+
+        from apps.devices.log_writer import run_stream_writer
+
+        self.stdout.write(self.style.SUCCESS('🚀 Starting device log writer...'))
+        run_stream_writer(lambda: self.should_stop, consumer=options['consumer'])
+        self.stdout.write(self.style.SUCCESS('✅ Device log writer stopped'))
+
+    def signal_handler(self, sig, frame):
+        """
+        Finish the current batch, then stop
+        """
+        self.stdout.write(self.style.WARNING(f'\n⚠️  Received signal {sig}. Shutting down...'))
+        self.should_stop = True
@@ -0,0 +1,102 @@
+"""
+Device log messages
+Log rows store a message code and its parameters instead of a rendered
+description; the text is rendered (and translated) when read. Codes are
+stored in the database: never renumber or reuse one, add new codes at
+the end. Rows without a code (older rows, free-text events) keep their
+description.
+"""
+
+from enum import IntEnum
+
+from django.utils.translation import gettext_lazy as _
+
+
+class LogMessage(IntEnum):
+    DEVICE_ONLINE = 1
+    DEVICE_OFFLINE = 2
+    REPORTED_LOCKED = 3
+    REPORTED_UNLOCKED = 4
+    UNLOCKED_VIA = 5
+    LOCKED = 6
+    BATTERY_LOW = 7
+    TAMPER_DETECTED = 8
+    UNLOCK_COMMAND = 9
+    LOCK_COMMAND = 10
+    UNLOCKED_WITH = 11
+    FAILED_ATTEMPT = 12
+    FAILED_ATTEMPTS = 13
+    OFFLINE_LOCKED = 14
+    OFFLINE_UNLOCKED = 15
+    OFFLINE_UNLOCKED_WITH = 16
+    OFFLINE_REJECTED = 17
+    OFFLINE_REJECTED_WITH = 18
+
+
+TEMPLATES = {
+    LogMessage.DEVICE_ONLINE: _('Device came online'),
+    LogMessage.DEVICE_OFFLINE: _('Device went offline'),
+    LogMessage.REPORTED_LOCKED: _('Device reported locked'),
+    LogMessage.REPORTED_UNLOCKED: _('Device reported unlocked'),
+    LogMessage.UNLOCKED_VIA: _('Device unlocked via {via}'),
+    LogMessage.LOCKED: _('Device locked'),
+    LogMessage.BATTERY_LOW: _('Low battery alert: {level}%'),
+    LogMessage.TAMPER_DETECTED: _('Tamper detected on device!'),
+    LogMessage.UNLOCK_COMMAND: _('Unlock command sent via app (duration: {duration}s)'),
+    LogMessage.LOCK_COMMAND: _('Lock command sent via app'),
+    LogMessage.UNLOCKED_WITH: _('Unlocked with {label}: {name}'),
+    LogMessage.FAILED_ATTEMPT: _('Failed {short_label} attempt: {reason}'),
+    LogMessage.FAILED_ATTEMPTS: _('{count} failed {short_label} attempts in {window}s: {reason}'),
+    LogMessage.OFFLINE_LOCKED: _('Device locked ({source})'),
+    LogMessage.OFFLINE_UNLOCKED: _('Unlocked with {label} ({source})'),
+    LogMessage.OFFLINE_UNLOCKED_WITH: _('Unlocked with {label}: {name} ({source})'),
+    LogMessage.OFFLINE_REJECTED: _('{label} rejected ({source}): {reason}'),
+    LogMessage.OFFLINE_REJECTED_WITH: _('{label} rejected: {name} ({source}): {reason}'),
+}
+
+# Credential method parameter -> {label} / {short_label}
+METHOD_LABELS = {
+    'nfc': _('NFC card'),
+    'pin': _('PIN'),
+    'app': _('app'),
+    'physical': _('physical key'),
+    'lock': _('lock'),
+}
+METHOD_SHORT_LABELS = {
+    'nfc': _('NFC'),
+    'pin': _('PIN'),
+}
+
+
+def render_message(code, params=None, description=''):
+    """
+    Text of a log row
+
+    Args:
+        code: LogMessage value, or None
+        params: Template parameters
+        description: Stored description (rows without a code)
+
+    Returns:
+        str: Rendered description, in the active language
+    """
+    template = TEMPLATES.get(code) if code is not None else None
+    if template is None:
+        return description
+
+    values = dict(params or {})
+    method = values.get('method')
+    if method is not None:
+        values.setdefault('label', METHOD_LABELS.get(method, method))
+        values.setdefault('short_label', METHOD_SHORT_LABELS.get(method, method))
+    try:
+        return str(template).format(**values)
+    except (KeyError, IndexError, ValueError):
+        return description or str(template)
+
+
+def describe(log):
+    """Rendered description of a DeviceLog instance or row dict"""
+    if isinstance(log, dict):
+        return render_message(log.get('message'), log.get('message_params'), log.get('description') or '')
+    return render_message(log.message, log.message_params, log.description)
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.16 on 2026-10-19 01:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devices', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='device',
+            name='secret_version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
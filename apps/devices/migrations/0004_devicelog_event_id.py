@@ -0,0 +1,28 @@
+# Generated by Django 4.2.16 on 2026-10-19 01:14
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devices', '0003_device_secret_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='devicelog',
+            name='event_id',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AlterField(
+            model_name='devicelog',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.AddConstraint(
+            model_name='devicelog',
+            constraint=models.UniqueConstraint(fields=('device', 'event_id'), name='device_logs_device_event_id_uniq'),
+        ),
+    ]
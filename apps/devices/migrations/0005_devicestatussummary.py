@@ -0,0 +1,42 @@
+# Generated by Django 4.2.16 on 2026-10-19 01:36
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devices', '0004_devicelog_event_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeviceStatusSummary',
+            fields=[
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('date', models.DateField()),
+                ('heartbeat_count', models.PositiveIntegerField(default=0)),
+                ('first_heartbeat_at', models.DateTimeField()),
+                ('last_heartbeat_at', models.DateTimeField()),
+                ('min_battery_level', models.IntegerField(blank=True, null=True)),
+                ('max_battery_level', models.IntegerField(blank=True, null=True)),
+                ('online_transitions', models.PositiveIntegerField(default=0)),
+                ('offline_transitions', models.PositiveIntegerField(default=0)),
+                ('device', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='status_summaries', to='devices.device')),
+            ],
+            options={
+                'verbose_name': 'Device Status Summary',
+                'verbose_name_plural': 'Device Status Summaries',
+                'db_table': 'device_status_summaries',
+                'ordering': ['-date'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='devicestatussummary',
+            constraint=models.UniqueConstraint(fields=('device', 'date'), name='device_status_summaries_device_date'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.16 on 2026-10-19 01:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devices', '0005_devicestatussummary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='devicelog',
+            name='attempt_count',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='devicelog',
+            name='details',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,103 @@
+# Partition device_logs by month on PostgreSQL (see apps.devices.partitions)
+
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db import migrations, models
+
+OLD_CONSTRAINT = models.UniqueConstraint(
+    fields=('device', 'event_id'),
+    name='device_logs_device_event_id_uniq',
+)
+
+# Unique constraints of a partitioned table must include the partition key
+NEW_CONSTRAINT = models.UniqueConstraint(
+    fields=('device', 'event_id', 'created_at'),
+    name='device_logs_device_event_id_uniq',
+)
+
+MONTHS_AHEAD = 3
+
+
+def _add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+def partition_device_logs(apps, schema_editor):
+    DeviceLog = apps.get_model('devices', 'DeviceLog')
+
+    if schema_editor.connection.vendor != 'postgresql':
+        schema_editor.remove_constraint(DeviceLog, OLD_CONSTRAINT)
+        schema_editor.add_constraint(DeviceLog, NEW_CONSTRAINT)
+        return
+
+    quote = schema_editor.quote_name
+    Device = apps.get_model('devices', 'Device')
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    table = DeviceLog._meta.db_table
+
+    now = datetime.now(timezone.utc)
+    current = datetime(now.year, now.month, 1, tzinfo=timezone.utc)
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'SELECT MIN(created_at) FROM {quote(table)}')
+        oldest = cursor.fetchone()[0]
+    month = datetime(oldest.year, oldest.month, 1, tzinfo=timezone.utc) if oldest else current
+    month = min(month, current)
+
+    statements = [
+        f'CREATE TABLE {quote(table + "_new")} (LIKE {quote(table)} INCLUDING DEFAULTS) '
+        f'PARTITION BY RANGE (created_at)',
+        f'CREATE TABLE {quote(table + "_default")} PARTITION OF {quote(table + "_new")} DEFAULT',
+    ]
+    while month <= _add_months(current, MONTHS_AHEAD):
+        following = _add_months(month, 1)
+        statements.append(
+            f'CREATE TABLE {quote(f"{table}_p{month.year:04d}{month.month:02d}")} '
+            f'PARTITION OF {quote(table + "_new")} '
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{following.isoformat()}')"
+        )
+        month = following
+
+    statements += [
+        f'INSERT INTO {quote(table + "_new")} SELECT * FROM {quote(table)}',
+        f'DROP TABLE {quote(table)}',
+        f'ALTER TABLE {quote(table + "_new")} RENAME TO {quote(table)}',
+        f'ALTER TABLE {quote(table)} ADD CONSTRAINT {quote(table + "_pkey")} PRIMARY KEY (id, created_at)',
+        f'ALTER TABLE {quote(table)} ADD CONSTRAINT {quote(NEW_CONSTRAINT.name)} '
+        f'UNIQUE (device_id, event_id, created_at)',
+        f'ALTER TABLE {quote(table)} ADD CONSTRAINT {quote(table + "_device_id_fk")} '
+        f'FOREIGN KEY (device_id) REFERENCES {quote(Device._meta.db_table)} (id) DEFERRABLE INITIALLY DEFERRED',
+        f'ALTER TABLE {quote(table)} ADD CONSTRAINT {quote(table + "_user_id_fk")} '
+        f'FOREIGN KEY (user_id) REFERENCES {quote(User._meta.db_table)} (id) DEFERRABLE INITIALLY DEFERRED',
+        f'CREATE INDEX {quote("device_logs_device__15f61f_idx")} ON {quote(table)} (device_id, created_at DESC)',
+        f'CREATE INDEX {quote("device_logs_event_t_e26126_idx")} ON {quote(table)} (event_type, created_at DESC)',
+        f'CREATE INDEX {quote(table + "_user_id_idx")} ON {quote(table)} (user_id)',
+    ]
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devices', '0006_devicelog_attempt_count'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(partition_device_logs),
+            ],
+            state_operations=[
+                migrations.RemoveConstraint(
+                    model_name='devicelog',
+                    name='device_logs_device_event_id_uniq',
+                ),
+                migrations.AddConstraint(
+                    model_name='devicelog',
+                    constraint=NEW_CONSTRAINT,
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.16 on 2026-10-19 01:49
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devices', '0008_time_ordered_ids'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeviceAccessRollup',
+            fields=[
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('date', models.DateField()),
+                ('app_unlocks', models.PositiveIntegerField(default=0)),
+                ('pin_unlocks', models.PositiveIntegerField(default=0)),
+                ('nfc_unlocks', models.PositiveIntegerField(default=0)),
+                ('physical_unlocks', models.PositiveIntegerField(default=0)),
+                ('failed_attempts', models.PositiveIntegerField(default=0)),
+                ('last_activity_at', models.DateTimeField(blank=True, null=True)),
+                ('last_event_type', models.CharField(blank=True, max_length=30)),
+                ('last_description', models.TextField(blank=True)),
+                ('device', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='access_rollups', to='devices.device')),
+            ],
+            options={
+                'verbose_name': 'Device Access Rollup',
+                'verbose_name_plural': 'Device Access Rollups',
+                'db_table': 'device_access_rollups',
+                'ordering': ['-date'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='deviceaccessrollup',
+            constraint=models.UniqueConstraint(fields=('device', 'date'), name='device_access_rollups_device_date'),
+        ),
+    ]
@@ -0,0 +1,86 @@
+# Full-text search over device logs (see apps.devices.search)
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+# Searched document: description (A), error message (B), event type words (C)
+SEARCH_DOCUMENT = (
+    "setweight(to_tsvector('simple', coalesce({row}description, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce({row}error_message, '')), 'B') || "
+    "setweight(to_tsvector('simple', replace(lower({row}event_type), '_', ' ')), 'C')"
+)
+
+
+def _search_vector_field():
+    field = django.contrib.postgres.search.SearchVectorField(editable=False, null=True)
+    field.set_attributes_from_name('search_vector')
+    return field
+
+
+def add_search_vector(apps, schema_editor):
+    DeviceLog = apps.get_model('devices', 'DeviceLog')
+
+    if schema_editor.connection.vendor != 'postgresql':
+        schema_editor.add_field(DeviceLog, _search_vector_field())
+        return
+
+    quote = schema_editor.quote_name
+    table = quote(DeviceLog._meta.db_table)
+    statements = [
+        f'ALTER TABLE {table} ADD COLUMN search_vector tsvector',
+        # Rows are written through COPY, bulk_create and ORM inserts alike,
+        # so the document is computed in the database
+        'CREATE OR REPLACE FUNCTION device_logs_search_vector() RETURNS trigger AS $$ '
+        f'BEGIN NEW.search_vector := {SEARCH_DOCUMENT.format(row="NEW.")}; RETURN NEW; END '
+        '$$ LANGUAGE plpgsql',
+        f'CREATE TRIGGER device_logs_search_vector BEFORE INSERT OR UPDATE OF description, error_message, event_type '
+        f'ON {table} FOR EACH ROW EXECUTE FUNCTION device_logs_search_vector()',
+        f'UPDATE {table} SET search_vector = {SEARCH_DOCUMENT.format(row="")}',
+        # Created on every partition, and on partitions attached later
+        f'CREATE INDEX {quote("device_logs_search_gin")} ON {table} USING gin (search_vector)',
+    ]
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def remove_search_vector(apps, schema_editor):
+    DeviceLog = apps.get_model('devices', 'DeviceLog')
+
+    if schema_editor.connection.vendor != 'postgresql':
+        schema_editor.remove_field(DeviceLog, _search_vector_field())
+        return
+
+    table = schema_editor.quote_name(DeviceLog._meta.db_table)
+    schema_editor.execute(f'DROP TRIGGER IF EXISTS device_logs_search_vector ON {table}')
+    schema_editor.execute('DROP FUNCTION IF EXISTS device_logs_search_vector()')
+    schema_editor.execute(f'ALTER TABLE {table} DROP COLUMN search_vector')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devices', '0009_deviceaccessrollup'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(add_search_vector, remove_search_vector),
+            ],
+            state_operations=[
+                migrations.AddField(
+                    model_name='devicelog',
+                    name='search_vector',
+                    field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+                ),
+                migrations.AddIndex(
+                    model_name='devicelog',
+                    index=django.contrib.postgres.indexes.GinIndex(
+                        fields=['search_vector'],
+                        name='device_logs_search_gin',
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,102 @@
+# Templated log messages and interned user agents
+
+import hashlib
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Searched document: description and message parameters (A), error
+# message (B), event type words (C)
+SEARCH_DOCUMENT = (
+    "setweight(to_tsvector('simple', coalesce(NEW.description, '')), 'A') || "
+    "setweight(jsonb_to_tsvector('simple', coalesce(NEW.message_params, '{}'::jsonb), '[\"string\", \"numeric\"]'), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(NEW.error_message, '')), 'B') || "
+    "setweight(to_tsvector('simple', replace(lower(NEW.event_type), '_', ' ')), 'C')"
+)
+
+
+def intern_user_agents(apps, schema_editor):
+    DeviceLog = apps.get_model('devices', 'DeviceLog')
+    UserAgent = apps.get_model('devices', 'UserAgent')
+
+    values = DeviceLog.objects.exclude(user_agent_text='').values_list('user_agent_text', flat=True).distinct()
+    for value in values.iterator():
+        digest = hashlib.sha256(value.encode()).hexdigest()
+        agent, _ = UserAgent.objects.get_or_create(digest=digest, defaults={'value': value})
+        DeviceLog.objects.filter(user_agent_text=value).update(user_agent_id=agent.pk)
+
+
+def update_search_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    DeviceLog = apps.get_model('devices', 'DeviceLog')
+    table = schema_editor.quote_name(DeviceLog._meta.db_table)
+    statements = [
+        'CREATE OR REPLACE FUNCTION device_logs_search_vector() RETURNS trigger AS $$ '
+        f'BEGIN NEW.search_vector := {SEARCH_DOCUMENT}; RETURN NEW; END '
+        '$$ LANGUAGE plpgsql',
+        f'DROP TRIGGER IF EXISTS device_logs_search_vector ON {table}',
+        f'CREATE TRIGGER device_logs_search_vector '
+        f'BEFORE INSERT OR UPDATE OF description, message_params, error_message, event_type '
+        f'ON {table} FOR EACH ROW EXECUTE FUNCTION device_logs_search_vector()',
+    ]
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devices', '0010_devicelog_search_vector'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserAgent',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('digest', models.CharField(max_length=64, unique=True)),
+                ('value', models.TextField()),
+            ],
+            options={
+                'verbose_name': 'User Agent',
+                'verbose_name_plural': 'User Agents',
+                'db_table': 'user_agents',
+            },
+        ),
+        migrations.AddField(
+            model_name='devicelog',
+            name='message',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='devicelog',
+            name='message_params',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.RenameField(
+            model_name='devicelog',
+            old_name='user_agent',
+            new_name='user_agent_text',
+        ),
+        migrations.AddField(
+            model_name='devicelog',
+            name='user_agent',
+            field=models.ForeignKey(
+                blank=True,
+                db_constraint=False,
+                db_index=False,
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name='+',
+                to='devices.useragent',
+            ),
+        ),
+        migrations.RunPython(intern_user_agents, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='devicelog',
+            name='user_agent_text',
+        ),
+        migrations.RunPython(update_search_trigger, migrations.RunPython.noop),
+    ]
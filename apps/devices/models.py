@@ -4,8 +4,12 @@ Device models
 
 from django.db import models
 from django.contrib.auth import get_user_model
-from apps.core.models import TimeStampedModel, UUIDModel
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.utils import timezone
+from apps.core.models import TimeOrderedUUIDModel, TimeStampedModel, UUIDModel
 from apps.core.utils.validators import validate_device_id
+from .messages import render_message
 import secrets
 
 User = get_user_model()
@@ -15,6 +19,10 @@ class Device(TimeStampedModel, UUIDModel):
     """
     Smart Lock Device
     """
+    # Columns needed to authenticate a signed device request and update
+    # the device afterwards (used with .only() on the verify hot path)
+    VERIFY_FIELDS = ('id', 'device_id', 'device_secret', 'secret_version', 'device_type')
+
     DEVICE_TYPE_CHOICES = [
         ('LITE', 'SmartLock LITE'),
         ('PRO', 'SmartLock PRO'),
@@ -49,6 +57,7 @@ class Device(TimeStampedModel, UUIDModel):
     
     # Security
     device_secret = models.CharField(max_length=64, unique=True)
+    secret_version = models.PositiveIntegerField(default=1)
     
     # Location
     location = models.CharField(max_length=200, blank=True)
@@ -117,10 +126,35 @@ class Device(TimeStampedModel, UUIDModel):
         """Check if battery is low"""
         return self.battery_level <= self.battery_low_threshold
 
+    def rotate_secret(self):
+        """Generate a new device secret and bump its version"""
+        self.device_secret = secrets.token_hex(32)
+        self.secret_version += 1
+        self.save(update_fields=['device_secret', 'secret_version', 'updated_at'])
+
 
-class DeviceLog(TimeStampedModel, UUIDModel):
+class UserAgent(models.Model):
+    """
+    Interned user agent strings (device logs reference them by id)
+    """
+    id = models.AutoField(primary_key=True)
+    digest = models.CharField(max_length=64, unique=True)  # SHA-256 of value
+    value = models.TextField()
+
+    class Meta:
+        db_table = 'user_agents'
+        verbose_name = 'User Agent'
+        verbose_name_plural = 'User Agents'
+
+    def __str__(self):
+        return self.value
+
+
+class DeviceLog(TimeStampedModel, TimeOrderedUUIDModel):
     """
     Device activity logs
+    On PostgreSQL the table is partitioned by month of created_at (see
+    partitions); filter on created_at so only recent partitions are scanned.
     """
     EVENT_TYPE_CHOICES = [
         ('UNLOCK', 'Unlock'),
@@ -149,16 +183,43 @@ class DeviceLog(TimeStampedModel, UUIDModel):
     )
     
     event_type = models.CharField(max_length=30, choices=EVENT_TYPE_CHOICES)
+    # Message code and parameters, rendered on read (see messages); rows
+    # without a code use the free-text description
+    message = models.PositiveSmallIntegerField(null=True, blank=True)
+    message_params = models.JSONField(null=True, blank=True)
     description = models.TextField(blank=True)
     
     # Request info
     ip_address = models.GenericIPAddressField(null=True, blank=True)
-    user_agent = models.TextField(blank=True)
+    user_agent = models.ForeignKey(
+        UserAgent,
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        db_constraint=False,
+        db_index=False,
+        related_name='+'
+    )
     
     # Result
     success = models.BooleanField(default=True)
     error_message = models.TextField(blank=True)
 
+    # Device-generated event ID (batch uploads), used to drop retried duplicates
+    event_id = models.CharField(max_length=64, null=True, blank=True)
+
+    # Attempts summarized by this row (failed verifications are aggregated
+    # per window) and their sampled details
+    attempt_count = models.PositiveIntegerField(default=1)
+    details = models.JSONField(null=True, blank=True)
+
+    # Full-text document of description, message parameters, error message
+    # and event type, set by a trigger on PostgreSQL (see apps.devices.search)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    # When the event happened (may be earlier than insert time for offline uploads)
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+
     class Meta:
         db_table = 'device_logs'
         verbose_name = 'Device Log'
@@ -167,11 +228,99 @@ class DeviceLog(TimeStampedModel, UUIDModel):
         indexes = [
             models.Index(fields=['device', '-created_at']),
             models.Index(fields=['event_type', '-created_at']),
+            GinIndex(fields=['search_vector'], name='device_logs_search_gin'),
+        ]
+        constraints = [
+            # Includes the partition key (device_logs is partitioned by month)
+            models.UniqueConstraint(
+                fields=['device', 'event_id', 'created_at'],
+                name='device_logs_device_event_id_uniq',
+            ),
         ]
 
     def __str__(self):
         return f"{self.device.name} - {self.event_type} - {self.created_at}"
 
+    def get_description(self):
+        """Description rendered from the message code, in the active language"""
+        return render_message(self.message, self.message_params, self.description)
+
+
+class DeviceStatusSummary(TimeStampedModel, UUIDModel):
+    """
+    Daily aggregate of device status heartbeats
+    Heartbeats are counted here; only state transitions go to DeviceLog.
+    """
+    device = models.ForeignKey(
+        Device,
+        on_delete=models.CASCADE,
+        related_name='status_summaries'
+    )
+    date = models.DateField()
+
+    heartbeat_count = models.PositiveIntegerField(default=0)
+    first_heartbeat_at = models.DateTimeField()
+    last_heartbeat_at = models.DateTimeField()
+
+    min_battery_level = models.IntegerField(null=True, blank=True)
+    max_battery_level = models.IntegerField(null=True, blank=True)
+
+    # Online / offline edges seen that day
+    online_transitions = models.PositiveIntegerField(default=0)
+    offline_transitions = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        db_table = 'device_status_summaries'
+        verbose_name = 'Device Status Summary'
+        verbose_name_plural = 'Device Status Summaries'
+        ordering = ['-date']
+        constraints = [
+            models.UniqueConstraint(fields=['device', 'date'], name='device_status_summaries_device_date'),
+        ]
+
+    def __str__(self):
+        return f"{self.device_id} - {self.date}: {self.heartbeat_count} heartbeats"
+
+
+class DeviceAccessRollup(TimeStampedModel, UUIDModel):
+    """
+    Daily per-device access counters
+    Updated as DeviceLog rows are written (see rollups), so stats read
+    one row per day instead of scanning logs.
+    """
+    device = models.ForeignKey(
+        Device,
+        on_delete=models.CASCADE,
+        related_name='access_rollups'
+    )
+    date = models.DateField()
+
+    # Successful unlocks by method
+    app_unlocks = models.PositiveIntegerField(default=0)
+    pin_unlocks = models.PositiveIntegerField(default=0)
+    nfc_unlocks = models.PositiveIntegerField(default=0)
+    physical_unlocks = models.PositiveIntegerField(default=0)
+
+    # Failed attempts (aggregated failure rows count all their attempts)
+    failed_attempts = models.PositiveIntegerField(default=0)
+
+    # Latest log row of the day, any event type
+    last_activity_at = models.DateTimeField(null=True, blank=True)
+    last_event_type = models.CharField(max_length=30, blank=True)
+    last_description = models.TextField(blank=True)
+
+    class Meta:
+        db_table = 'device_access_rollups'
+        verbose_name = 'Device Access Rollup'
+        verbose_name_plural = 'Device Access Rollups'
+        ordering = ['-date']
+        constraints = [
+            models.UniqueConstraint(fields=['device', 'date'], name='device_access_rollups_device_date'),
+        ]
+
+    def __str__(self):
+        return f"{self.device_id} - {self.date}"
+
 
 class DeviceSharing(TimeStampedModel, UUIDModel):
     """
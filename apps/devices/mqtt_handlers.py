@@ -4,11 +4,64 @@ MQTT message handlers for devices
 
 import json
 import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce, Greatest, Least
 from django.utils import timezone
-from .models import Device, DeviceLog
+from .log_writer import emit_device_log, emit_device_logs
+from .messages import LogMessage
+from .models import Device, DeviceLog, DeviceStatusSummary
 
 logger = logging.getLogger('mqtt')
 
+# Verify requests are decided off the MQTT network thread, so a slow
+# verification cannot hold up other devices' messages
+_verify_executor = None
+_verify_executor_lock = threading.Lock()
+
+
+def record_status_heartbeat(device, now, went_online=False, went_offline=False):
+    """
+    Count a status message in the device's daily summary
+    (one UPDATE per heartbeat instead of a DeviceLog row)
+    """
+    date = timezone.localdate(now)
+    battery_level = Value(device.battery_level)
+    updates = {
+        'heartbeat_count': F('heartbeat_count') + 1,
+        'last_heartbeat_at': now,
+        'min_battery_level': Least(Coalesce(F('min_battery_level'), battery_level), battery_level),
+        'max_battery_level': Greatest(Coalesce(F('max_battery_level'), battery_level), battery_level),
+        'online_transitions': F('online_transitions') + int(went_online),
+        'offline_transitions': F('offline_transitions') + int(went_offline),
+        'updated_at': now,
+    }
+
+    summaries = DeviceStatusSummary.objects.filter(device=device, date=date)
+    if summaries.update(**updates):
+        return
+
+    try:
+        with transaction.atomic():
+            DeviceStatusSummary.objects.create(
+                device=device,
+                date=date,
+                heartbeat_count=1,
+                first_heartbeat_at=now,
+                last_heartbeat_at=now,
+                min_battery_level=device.battery_level,
+                max_battery_level=device.battery_level,
+                online_transitions=int(went_online),
+                offline_transitions=int(went_offline)
+            )
+    except IntegrityError:
+        # Created concurrently for the same day
+        summaries.update(**updates)
+
 
 def handle_device_status(device_id, payload):
     """
@@ -21,32 +74,59 @@ def handle_device_status(device_id, payload):
         "battery_level": 85,
         "timestamp": 1234567890
     }
+    
+    Only state transitions (online / offline, locked / unlocked) are
+    logged; heartbeats are aggregated in DeviceStatusSummary.
     """
     try:
-        device = Device.objects.get(device_id=device_id)
+        # Device.save() reads device_secret / device_type
+        device = Device.objects.only(
+            *Device.VERIFY_FIELDS, 'is_online', 'is_locked', 'battery_level'
+        ).get(device_id=device_id)
+        
+        now = timezone.now()
+        was_online = device.is_online
+        was_locked = device.is_locked
         
         # Update device status
         device.is_online = payload.get('status') == 'online'
         device.is_locked = payload.get('is_locked', device.is_locked)
         device.battery_level = payload.get('battery_level', device.battery_level)
-        device.last_seen = timezone.now()
-        
-        device.save(update_fields=[
-            'is_online',
-            'is_locked',
-            'battery_level',
-            'last_seen',
-            'updated_at'
-        ])
-        
-        # Log status change
-        if device.is_online:
-            DeviceLog.objects.create(
+        device.last_seen = now
+        
+        # Tracked fields only when they changed (see device_pre_save)
+        update_fields = ['battery_level', 'last_seen', 'updated_at']
+        logs = []
+        
+        if device.is_online != was_online:
+            update_fields.append('is_online')
+            logs.append(DeviceLog(
                 device=device,
-                event_type='DEVICE_ONLINE',
-                description='Device came online',
+                event_type='DEVICE_ONLINE' if device.is_online else 'DEVICE_OFFLINE',
+                message=LogMessage.DEVICE_ONLINE if device.is_online else LogMessage.DEVICE_OFFLINE,
                 success=True
-            )
+            ))
+        
+        if device.is_locked != was_locked:
+            update_fields.append('is_locked')
+            logs.append(DeviceLog(
+                device=device,
+                event_type='LOCK' if device.is_locked else 'UNLOCK',
+                message=LogMessage.REPORTED_LOCKED if device.is_locked else LogMessage.REPORTED_UNLOCKED,
+                success=True
+            ))
+        
+        device.save(update_fields=update_fields)
+        
+        if logs:
+            emit_device_logs(logs)
+        
+        record_status_heartbeat(
+            device,
+            now,
+            went_online=device.is_online and not was_online,
+            went_offline=was_online and not device.is_online
+        )
         
         logger.info(f"Device status updated: {device_id}")
         
@@ -88,10 +168,11 @@ def handle_unlock_response(device_id, payload):
             
             event_type = event_type_map.get(method, 'UNLOCK')
             
-            DeviceLog.objects.create(
+            emit_device_log(
                 device=device,
                 event_type=event_type,
-                description=f'Device unlocked via {method}',
+                message=LogMessage.UNLOCKED_VIA,
+                message_params={'via': method},
                 success=True
             )
             
@@ -120,10 +201,10 @@ def handle_lock_response(device_id, payload):
             device.last_lock = timezone.now()
             device.save(update_fields=['is_locked', 'last_lock', 'updated_at'])
             
-            DeviceLog.objects.create(
+            emit_device_log(
                 device=device,
                 event_type='LOCK',
-                description='Device locked',
+                message=LogMessage.LOCKED,
                 success=True
             )
             
@@ -147,10 +228,11 @@ def handle_battery_low(device_id, payload):
         device.battery_level = battery_level
         device.save(update_fields=['battery_level', 'updated_at'])
         
-        DeviceLog.objects.create(
+        emit_device_log(
             device=device,
             event_type='BATTERY_LOW',
-            description=f'Low battery alert: {battery_level}%',
+            message=LogMessage.BATTERY_LOW,
+            message_params={'level': battery_level},
             success=True
         )
         
@@ -171,10 +253,10 @@ def handle_tamper_detected(device_id, payload):
     try:
         device = Device.objects.get(device_id=device_id)
         
-        DeviceLog.objects.create(
+        emit_device_log(
             device=device,
             event_type='TAMPER_DETECTED',
-            description='Tamper detected on device!',
+            message=LogMessage.TAMPER_DETECTED,
             success=True
         )
         
@@ -188,6 +270,191 @@ def handle_tamper_detected(device_id, payload):
         logger.error(f"Error handling tamper detection: {str(e)}")
 
 
+def handle_event_batch(device_id, payload):
+    """
+    Handle a signed batch of access events recorded by the device
+    
+    Expected payload:
+    {
+        "batch_id": "optional id echoed in the ack",
+        "timestamp": 1234567890,
+        "events": "base64(gzip(JSON array of events))",
+        "signature": "HMAC-SHA256(device_secret, device_uuid:timestamp:events)"
+    }
+    
+    Replies on device/{device_id}/events/ack with the ingest counts so the
+    device can drop the uploaded events from its buffer.
+    """
+    from apps.access.ingest import decode_event_batch, ingest_event_batch, EventBatchError
+    from apps.access.verification import authenticate_device_request, throttle_device_request, DeviceAuthError
+    from mqtt.client import mqtt_publish
+    from mqtt.topics import MQTTTopics
+
+    try:
+        device = Device.objects.only(*Device.VERIFY_FIELDS).get(device_id=device_id)
+        
+        encoded_events = payload.get('events')
+        authenticate_device_request(
+            str(device.id),
+            payload.get('timestamp'),
+            payload.get('signature'),
+            encoded_events,
+            device=device
+        )
+        throttle_device_request(device, scope='device_upload')
+        
+        result = ingest_event_batch(device, decode_event_batch(encoded_events))
+        
+        mqtt_publish(MQTTTopics.get_events_ack_topic(device_id), {
+            'batch_id': payload.get('batch_id'),
+            'success': True,
+            **result
+        })
+        
+    except Device.DoesNotExist:
+        logger.error(f"Device not found: {device_id}")
+    except (DeviceAuthError, EventBatchError) as e:
+        logger.warning(f"Event batch rejected for {device_id}: {str(e)}")
+    except Exception as e:
+        logger.error(f"Error handling event batch: {str(e)}")
+
+
+def handle_credentials_ack(device_id, payload):
+    """
+    Handle a lock acknowledging the credential bundle version it applied
+    
+    Expected payload:
+    {
+        "version": 12,              # 0 when the lock holds no bundle
+        "timestamp": 1234567890,
+        "signature": "HMAC-SHA256(device_secret, device_uuid:timestamp:version)"
+    }
+    
+    Newer versions are sent back on device/{device_id}/credentials.
+    """
+    from apps.access.credential_sync import acknowledge_credential_bundle
+    from apps.access.verification import authenticate_device_request, DeviceAuthError
+
+    try:
+        device = Device.objects.only(*Device.VERIFY_FIELDS).get(device_id=device_id)
+        
+        version = payload.get('version')
+        authenticate_device_request(
+            str(device.id),
+            payload.get('timestamp'),
+            payload.get('signature'),
+            str(version),
+            device=device
+        )
+        
+        acknowledge_credential_bundle(device, int(version))
+        
+    except Device.DoesNotExist:
+        logger.error(f"Device not found: {device_id}")
+    except (DeviceAuthError, TypeError, ValueError) as e:
+        logger.warning(f"Credential ack rejected for {device_id}: {str(e)}")
+    except Exception as e:
+        logger.error(f"Error handling credential ack: {str(e)}")
+
+
+def _get_verify_executor():
+    global _verify_executor
+    if _verify_executor is None:
+        with _verify_executor_lock:
+            if _verify_executor is None:
+                _verify_executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'MQTT_VERIFY_THREADS', 8),
+                    thread_name_prefix='mqtt-verify'
+                )
+    return _verify_executor
+
+
+def _answer_verify_request(device_id, payload, received_at):
+    from rest_framework import status
+    from apps.access.verification import verify_credential, DeviceAuthError
+    from mqtt.client import mqtt_publish
+    from mqtt.topics import MQTTTopics
+
+    reply = {'id': payload.get('id')}
+
+    # The lock has given up on the request by now; opening late is worse than not at all
+    max_wait = getattr(settings, 'MQTT_VERIFY_MAX_WAIT_SECONDS', 5)
+    if time.monotonic() - received_at > max_wait:
+        logger.warning(f"Verify request from {device_id} dropped after waiting over {max_wait}s")
+        return
+
+    method = payload.get('method')
+    presented = payload.get('credential')
+
+    try:
+        if method not in ('pin', 'nfc') or not presented or not payload.get('device_uuid'):
+            raise DeviceAuthError('Method, credential and device UUID are required', status.HTTP_400_BAD_REQUEST)
+
+        decision = verify_credential(
+            method,
+            payload['device_uuid'],
+            presented,
+            payload.get('timestamp'),
+            payload.get('signature'),
+            battery_level=payload.get('battery_level'),
+            expected_device_id=device_id
+        )
+        reply.update({
+            'access_granted': decision['access_granted'],
+            'command': 'UNLOCK' if decision['access_granted'] else 'DENY',
+            'message': decision['message'],
+            'status_code': decision['status_code'],
+        })
+        if decision['info'] is not None:
+            reply['info'] = decision['info']
+        if decision['degraded']:
+            reply['degraded'] = True
+
+    except DeviceAuthError as e:
+        reply.update({
+            'access_granted': False,
+            'command': 'DENY',
+            'message': e.message,
+            'status_code': e.status_code,
+        })
+        if e.retry_after is not None:
+            reply['retry_after'] = e.retry_after
+
+    mqtt_publish(
+        MQTTTopics.get_verify_reply_topic(device_id),
+        json.dumps(reply, default=str)
+    )
+
+
+def _run_verify_request(device_id, payload, received_at):
+    try:
+        _answer_verify_request(device_id, payload, received_at)
+    except Exception as e:
+        logger.error(f"Error handling verify request: {str(e)}")
+
+
+def handle_verify_request(device_id, payload):
+    """
+    Handle a PIN / NFC verification request sent over MQTT
+    
+    Expected payload:
+    {
+        "id": "correlation id echoed in the reply",
+        "device_uuid": "<device UUID>",
+        "method": "pin/nfc",
+        "credential": "123456 or 04:A3:2F:B2",
+        "timestamp": 1234567890,
+        "signature": "HMAC-SHA256(device_secret, device_uuid:timestamp:credential)",
+        "battery_level": 85            # optional
+    }
+    
+    Decided like the HTTP verify endpoints; the reply is published on
+    device/{device_id}/verify/reply:
+    {"id": "...", "access_granted": true, "command": "UNLOCK", "message": "..."}
+    """
+    _get_verify_executor().submit(_run_verify_request, device_id, payload, time.monotonic())
+
+
 # Message router
 MESSAGE_HANDLERS = {
     'status': handle_device_status,
@@ -195,6 +462,9 @@ MESSAGE_HANDLERS = {
     'lock_response': handle_lock_response,
     'battery_low': handle_battery_low,
     'tamper_detected': handle_tamper_detected,
+    'event_batch': handle_event_batch,
+    'credentials_ack': handle_credentials_ack,
+    'verify': handle_verify_request,
 }
 
 
@@ -0,0 +1,182 @@
+"""
+DeviceLog partitions
+On PostgreSQL device_logs is range-partitioned by created_at, one
+partition per month (device_logs_pYYYYMM, bounds in UTC), plus
+device_logs_default for rows outside every monthly range.
+
+Partitions are created ahead of time and retention removes whole
+partitions (DROP, or DETACH to keep the table for archiving) instead of
+running DELETEs. Queries filtering on created_at only scan the partitions
+of that range.
+"""
+
+import logging
+import re
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import DeviceLog
+
+logger = logging.getLogger(__name__)
+
+PARTITION_PREFIX = 'device_logs_p'
+DEFAULT_PARTITION = 'device_logs_default'
+PARTITION_NAME_RE = re.compile(r'^device_logs_p(\d{4})(\d{2})$')
+
+
+def get_partition_config():
+    """
+    Partition settings with defaults
+    """
+    config = {
+        'MONTHS_AHEAD': 3,          # future monthly partitions kept ready
+        'RETENTION_MONTHS': 12,     # whole months of logs kept
+        'DETACH': False,            # detach expired partitions instead of dropping them
+    }
+    config.update(getattr(settings, 'DEVICE_LOG_PARTITIONS', {}))
+    return config
+
+
+def is_partitioned():
+    """True if device_logs is a partitioned table (PostgreSQL)"""
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relkind FROM pg_class c WHERE c.oid = to_regclass(%s)",
+            [DeviceLog._meta.db_table]
+        )
+        row = cursor.fetchone()
+    return row is not None and row[0] == 'p'
+
+
+def add_months(month, count):
+    """First day of the month count months after month (a date or datetime)"""
+    index = month.year * 12 + month.month - 1 + count
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=dt_timezone.utc)
+
+
+def current_month():
+    now = datetime.now(dt_timezone.utc)
+    return datetime(now.year, now.month, 1, tzinfo=dt_timezone.utc)
+
+
+def partition_name(month):
+    return f'{PARTITION_PREFIX}{month.year:04d}{month.month:02d}'
+
+
+def list_log_partitions():
+    """
+    Monthly partitions currently attached
+
+    Returns:
+        list: (name, first day of month) sorted by month
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = to_regclass(%s)",
+            [DeviceLog._meta.db_table]
+        )
+        names = [row[0] for row in cursor.fetchall()]
+
+    partitions = []
+    for name in names:
+        match = PARTITION_NAME_RE.match(name)
+        if match:
+            month = datetime(int(match.group(1)), int(match.group(2)), 1, tzinfo=dt_timezone.utc)
+            partitions.append((name, month))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+def create_log_partition(month):
+    """
+    Create and attach the partition of a month
+
+    Rows of that month already stored in the default partition are moved
+    into it first (attaching fails otherwise).
+    """
+    quote = connection.ops.quote_name
+    table = quote(DeviceLog._meta.db_table)
+    name = quote(partition_name(month))
+    start, end = month.isoformat(), add_months(month, 1).isoformat()
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS)')
+        cursor.execute(
+            f'WITH moved AS (DELETE FROM {quote(DEFAULT_PARTITION)} '
+            f'WHERE created_at >= %s AND created_at < %s RETURNING *) '
+            f'INSERT INTO {name} SELECT * FROM moved',
+            [start, end]
+        )
+        moved = cursor.rowcount
+        cursor.execute(
+            f'ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)',
+            [start, end]
+        )
+
+    logger.info(f"Created log partition {partition_name(month)}" + (f" ({moved} rows moved)" if moved else ''))
+
+
+def create_future_partitions(months_ahead=None):
+    """
+    Make sure partitions exist from the current month to months_ahead
+
+    Returns:
+        list: Names of the partitions created
+    """
+    if months_ahead is None:
+        months_ahead = get_partition_config()['MONTHS_AHEAD']
+
+    existing = {month for _, month in list_log_partitions()}
+    start = current_month()
+    created = []
+    for offset in range(months_ahead + 1):
+        month = add_months(start, offset)
+        if month not in existing:
+            create_log_partition(month)
+            created.append(partition_name(month))
+    return created
+
+
+def remove_expired_partitions(retention_months=None, detach=None, dry_run=False):
+    """
+    Drop (or detach) monthly partitions entirely older than the retention,
+    and delete expired rows left in the default partition
+
+    Args:
+        retention_months: Whole months kept besides the current one
+        detach: Detach instead of dropping (the table is kept)
+        dry_run: Only list the partitions
+
+    Returns:
+        list: Names of the expired partitions
+    """
+    config = get_partition_config()
+    if retention_months is None:
+        retention_months = config['RETENTION_MONTHS']
+    if detach is None:
+        detach = config['DETACH']
+
+    cutoff = add_months(current_month(), -retention_months)
+    expired = [name for name, month in list_log_partitions() if add_months(month, 1) <= cutoff]
+    if dry_run:
+        return expired
+
+    quote = connection.ops.quote_name
+    table = quote(DeviceLog._meta.db_table)
+    with connection.cursor() as cursor:
+        for name in expired:
+            with transaction.atomic():
+                if detach:
+                    cursor.execute(f'ALTER TABLE {table} DETACH PARTITION {quote(name)}')
+                else:
+                    cursor.execute(f'DROP TABLE {quote(name)}')
+            logger.info(f"{'Detached' if detach else 'Dropped'} log partition {name}")
+
+        # Only rows outside every monthly range end up here, so this stays small
+        cursor.execute(f'DELETE FROM {quote(DEFAULT_PARTITION)} WHERE created_at < %s', [cutoff.isoformat()])
+
+    return expired
@@ -2,6 +2,8 @@
 Device permissions
 """
 
+from django.db.models import Q
+from django.utils import timezone
 from rest_framework import permissions
 from .models import DeviceSharing
 
@@ -61,4 +63,22 @@ class CanUnlockDevice(permissions.BasePermission):
             )
             return sharing.can_unlock
         except DeviceSharing.DoesNotExist:
-            return False
\ No newline at end of file
+            return False
+
+
+class CanViewDeviceLogs(permissions.BasePermission):
+    """
+    Permission to check if user can read device logs
+    """
+    def has_object_permission(self, request, view, obj):
+        # Owner can always read logs
+        if obj.owner == request.user:
+            return True
+
+        # Active, unexpired sharing with log access
+        return DeviceSharing.objects.filter(
+            device=obj,
+            shared_with=request.user,
+            is_active=True,
+            can_view_logs=True
+        ).filter(Q(expires_at__isnull=True) | Q(expires_at__gt=timezone.now())).exists()
@@ -0,0 +1,201 @@
+"""
+Recent device events
+The last DEVICE_RECENT_EVENTS events of each device are kept in a capped
+Redis sorted set (score: event time), updated in the same pipeline as
+the log emission, so "last activity" blocks never query device_logs.
+
+A sorted set rather than a list keeps the newest events by event time
+even when offline batch uploads arrive out of order, and makes refills
+from the database idempotent. Reads for many devices are one pipelined
+batch; devices without a ring (Redis flushed, first read) are loaded
+from the database in one query and written back. Devices with no events
+at all get a short-lived empty marker instead, so they are not queried
+again on every read; a ring, once written, takes precedence over it.
+"""
+
+import json
+import logging
+
+from django.conf import settings
+from django.db import connection
+from django.utils.dateparse import parse_datetime
+
+from apps.core.utils.redis_client import get_redis, redis_key
+from .models import DeviceLog
+
+logger = logging.getLogger(__name__)
+
+# Encoded event: [id, created_at, event_type, success, description, user_id,
+# message, message_params] (description is empty for templated messages)
+FIELDS = ('id', 'created_at', 'event_type', 'success', 'description', 'user_id', 'message', 'message_params')
+DESCRIPTION_LENGTH = 200
+RING_TTL = 30 * 86400
+# Seconds a device found to have no events is not looked up again
+EMPTY_TTL = 600
+
+
+def get_ring_size():
+    return getattr(settings, 'DEVICE_RECENT_EVENTS', 20)
+
+
+def ring_key(device_pk):
+    return redis_key('device_recent', device_pk)
+
+
+def empty_key(device_pk):
+    return redis_key('device_recent_empty', device_pk)
+
+
+def _value(log, name):
+    return log[name] if isinstance(log, dict) else getattr(log, name)
+
+
+def encode_event(log):
+    """
+    Compact encoding of a log row
+
+    Args:
+        log: DeviceLog instance, or dict with FIELDS (datetime or ISO
+            created_at, as emitted by the log writer)
+
+    Returns:
+        tuple: (score, member)
+    """
+    created_at = _value(log, 'created_at')
+    if isinstance(created_at, str):
+        created_at = parse_datetime(created_at)
+    user_id = _value(log, 'user_id')
+    message = _value(log, 'message')
+    member = json.dumps([
+        str(_value(log, 'id')),
+        created_at.isoformat(),
+        _value(log, 'event_type'),
+        bool(_value(log, 'success')),
+        '' if message else (_value(log, 'description') or '')[:DESCRIPTION_LENGTH],
+        str(user_id) if user_id else None,
+        message,
+        _value(log, 'message_params') if message else None,
+    ], separators=(',', ':'), ensure_ascii=False)
+    return created_at.timestamp(), member
+
+
+def decode_event(member):
+    values = json.loads(member)
+    event = dict(zip(FIELDS, values))
+    event['created_at'] = parse_datetime(event['created_at'])
+    return event
+
+
+def queue_recent_events(pipe, logs):
+    """
+    Add log rows to their device rings on a Redis pipeline (the caller
+    executes it)
+    """
+    size = get_ring_size()
+    rings = {}
+    for log in logs:
+        score, member = encode_event(log)
+        rings.setdefault(ring_key(_value(log, 'device_id')), {})[member] = score
+
+    for key, members in rings.items():
+        pipe.zadd(key, members)
+        # Keep the newest `size` events
+        pipe.zremrangebyrank(key, 0, -size - 1)
+        pipe.expire(key, RING_TTL)
+
+
+def push_recent_events(logs):
+    """
+    Add stored log rows to the rings (best effort, the database stays the
+    source of truth)
+    """
+    client = get_redis()
+    if client is None or not logs:
+        return
+    try:
+        pipe = client.pipeline(transaction=False)
+        queue_recent_events(pipe, logs)
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"Failed to update recent device events: {str(e)}")
+
+
+def _mark_empty(client, device_pks):
+    """
+    Remember for EMPTY_TTL that devices have no events (best effort)
+    """
+    if not device_pks:
+        return
+    try:
+        pipe = client.pipeline(transaction=False)
+        for pk in device_pks:
+            pipe.set(empty_key(pk), 1, ex=EMPTY_TTL)
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"Failed to mark devices without recent events: {str(e)}")
+
+
+def _load_from_db(device_pks, limit):
+    """
+    Newest `limit` events per device: one LIMITed index scan per device,
+    sent as a single UNION ALL query where the backend allows it
+    """
+    queryset = DeviceLog.objects.order_by('-created_at', '-id').values('device_id', *FIELDS)
+    parts = [queryset.filter(device_id=pk)[:limit] for pk in device_pks]
+    if len(parts) > 1 and connection.features.supports_slicing_ordering_in_compound:
+        rows = parts[0].union(*parts[1:], all=True)
+    else:
+        rows = (row for part in parts for row in part)
+
+    events = {pk: [] for pk in device_pks}
+    for row in rows:
+        events[row['device_id']].append(row)
+    for device_events in events.values():
+        device_events.sort(key=lambda event: (event['created_at'], event['id']), reverse=True)
+    return events
+
+
+def get_recent_events(device_pks, limit=None):
+    """
+    Newest events of several devices
+
+    Args:
+        device_pks: Device pks
+        limit: Events per device (at most the ring size)
+
+    Returns:
+        dict: device pk -> list of event dicts (FIELDS), newest first
+    """
+    size = get_ring_size()
+    limit = min(limit or size, size)
+    device_pks = list(device_pks)
+    if not device_pks:
+        return {}
+
+    client = get_redis()
+    if client is None:
+        return _load_from_db(device_pks, limit)
+
+    try:
+        pipe = client.pipeline(transaction=False)
+        for pk in device_pks:
+            pipe.zrevrange(ring_key(pk), 0, limit - 1)
+            pipe.exists(empty_key(pk))
+        results = pipe.execute()
+    except Exception as e:
+        logger.warning(f"Recent device events unavailable, reading the database: {str(e)}")
+        return _load_from_db(device_pks, limit)
+
+    events = {}
+    missing = []
+    for pk, members, empty in zip(device_pks, results[::2], results[1::2]):
+        events[pk] = [decode_event(member) for member in members]
+        if not members and not empty:
+            missing.append(pk)
+    if missing:
+        loaded = _load_from_db(missing, size)
+        push_recent_events([row for rows in loaded.values() for row in rows])
+        _mark_empty(client, [pk for pk in missing if not loaded[pk]])
+        for pk in missing:
+            events[pk] = loaded[pk][:limit]
+    return events
@@ -0,0 +1,164 @@
+"""
+Daily access rollups
+Every path that stores DeviceLog rows (log writer, offline batch ingest,
+failure summaries) passes the stored rows here, and the counters of each
+(device, day) are incremented with one UPDATE. backfill_access_rollups
+rebuilds them from the logs.
+"""
+
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.db import IntegrityError, models, transaction
+from django.db.models import Case, Count, F, Max, Q, Sum, Value, When
+from django.db.models.functions import Coalesce, Greatest, TruncDate
+from django.utils import timezone
+
+from .messages import describe
+from .models import DeviceAccessRollup, DeviceLog
+
+# Successful event type -> counter
+UNLOCK_COUNTERS = {
+    'UNLOCK_APP': 'app_unlocks',
+    'UNLOCK_PIN': 'pin_unlocks',
+    'UNLOCK_NFC': 'nfc_unlocks',
+    'UNLOCK_PHYSICAL': 'physical_unlocks',
+}
+COUNTERS = (*UNLOCK_COUNTERS.values(), 'failed_attempts')
+
+
+def _value(log, name):
+    return log[name] if isinstance(log, dict) else getattr(log, name)
+
+
+def aggregate_logs(logs):
+    """
+    Counter increments per (device pk, date)
+
+    Args:
+        logs: DeviceLog instances or dicts with device_id, event_type,
+            success, attempt_count, created_at, message, message_params,
+            description
+
+    Returns:
+        dict: (device pk, date) -> counters plus the day's latest row
+    """
+    days = defaultdict(lambda: {counter: 0 for counter in COUNTERS})
+    for log in logs:
+        created_at = _value(log, 'created_at')
+        day = days[(str(_value(log, 'device_id')), timezone.localdate(created_at))]
+
+        if not _value(log, 'success'):
+            day['failed_attempts'] += _value(log, 'attempt_count') or 1
+        elif _value(log, 'event_type') in UNLOCK_COUNTERS:
+            day[UNLOCK_COUNTERS[_value(log, 'event_type')]] += 1
+
+        if day.get('last_activity_at') is None or created_at > day['last_activity_at']:
+            day['last_activity_at'] = created_at
+            day['last_event_type'] = _value(log, 'event_type')
+            day['last_description'] = describe(log)
+    return days
+
+
+def record_access_rollups(logs):
+    """
+    Add stored log rows to the daily rollups (one UPDATE per device and day)
+    """
+    now = timezone.now()
+    for (device_pk, date), day in aggregate_logs(logs).items():
+        newer = Q(last_activity_at__isnull=True) | Q(last_activity_at__lt=day['last_activity_at'])
+        updates = {counter: F(counter) + day[counter] for counter in COUNTERS if day[counter]}
+        # All SET expressions see the row as it was before the UPDATE
+        updates.update({
+            'last_event_type': Case(
+                When(newer, then=Value(day['last_event_type'])),
+                default=F('last_event_type'),
+                output_field=models.CharField()
+            ),
+            'last_description': Case(
+                When(newer, then=Value(day['last_description'])),
+                default=F('last_description'),
+                output_field=models.TextField()
+            ),
+            'last_activity_at': Greatest(
+                Coalesce(F('last_activity_at'), Value(day['last_activity_at'])),
+                Value(day['last_activity_at'])
+            ),
+            'updated_at': now,
+        })
+
+        rollups = DeviceAccessRollup.objects.filter(device_id=device_pk, date=date)
+        if rollups.update(**updates):
+            continue
+
+        try:
+            with transaction.atomic():
+                DeviceAccessRollup.objects.create(device_id=device_pk, date=date, **day)
+        except IntegrityError:
+            # Created concurrently for the same day
+            rollups.update(**updates)
+
+
+def get_access_summary(device, days=30):
+    """
+    Access stats of the last `days` days (today included) from rollups
+
+    Returns:
+        dict: counters summed over the period, plus the latest activity
+    """
+    since = timezone.localdate() - timedelta(days=days - 1)
+    rows = DeviceAccessRollup.objects.filter(device=device, date__gte=since).values(
+        *COUNTERS, 'last_activity_at', 'last_event_type', 'last_description'
+    )
+
+    summary = {counter: 0 for counter in COUNTERS}
+    last = None
+    for row in rows:
+        for counter in COUNTERS:
+            summary[counter] += row[counter]
+        if row['last_activity_at'] and (last is None or row['last_activity_at'] > last['last_activity_at']):
+            last = row
+    summary['last_activity'] = last
+    return summary
+
+
+def rebuild_access_rollups(device_pk, start, end):
+    """
+    Recompute the rollups of a device for local dates [start, end) from
+    DeviceLog, replacing the existing rows
+
+    Returns:
+        int: Number of days with activity
+    """
+    tz = timezone.get_current_timezone()
+    range_start = timezone.make_aware(datetime.combine(start, time.min), tz)
+    range_end = timezone.make_aware(datetime.combine(end, time.min), tz)
+    logs = DeviceLog.objects.filter(device_id=device_pk, created_at__gte=range_start, created_at__lt=range_end)
+
+    counters = {
+        counter: Count('id', filter=Q(success=True, event_type=event_type))
+        for event_type, counter in UNLOCK_COUNTERS.items()
+    }
+    counters['failed_attempts'] = Coalesce(Sum('attempt_count', filter=Q(success=False)), 0)
+
+    days = logs.order_by().annotate(day=TruncDate('created_at', tzinfo=tz)).values('day').annotate(
+        last_activity_at=Max('created_at'), **counters
+    )
+
+    rollups = []
+    for day in days:
+        last = logs.filter(created_at=day['last_activity_at']).values(
+            'event_type', 'message', 'message_params', 'description'
+        ).first()
+        rollups.append(DeviceAccessRollup(
+            device_id=device_pk,
+            date=day['day'],
+            last_event_type=last['event_type'] if last else '',
+            last_description=describe(last) if last else '',
+            **{name: day[name] for name in (*COUNTERS, 'last_activity_at')}
+        ))
+
+    with transaction.atomic():
+        DeviceAccessRollup.objects.filter(device_id=device_pk, date__gte=start, date__lt=end).delete()
+        DeviceAccessRollup.objects.bulk_create(rollups)
+    return len(rollups)
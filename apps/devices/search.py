@@ -0,0 +1,113 @@
+"""
+Device log search
+On PostgreSQL every row carries a tsvector of its description, error
+message and event type (set by a trigger, GIN-indexed per partition), so
+a text search is an index lookup in the partitions of the date range
+instead of an ILIKE scan. Other backends fall back to icontains.
+
+Facets (event type, success, device, user) are counted from the most
+recent FACET_SAMPLE matching rows, read with the same index lookup.
+"""
+
+from collections import Counter
+
+from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchQuery
+from django.db import connection
+from django.db.models import Q
+
+from .models import Device, DeviceLog
+
+SEARCH_CONFIG = 'simple'
+FACET_SAMPLE = 10000
+FACET_SIZE = 10
+
+
+def text_filter(text):
+    """
+    Filter matching a web-style search query ("quoted phrase", -exclude, or)
+
+    Returns:
+        Q: Condition on DeviceLog
+    """
+    if connection.vendor == 'postgresql':
+        return Q(search_vector=SearchQuery(text, config=SEARCH_CONFIG, search_type='websearch'))
+    return Q(description__icontains=text) | Q(message_params__icontains=text) | Q(error_message__icontains=text)
+
+
+def search_device_logs(device_pks, start, end, text='', event_types=None, success=None, user=None):
+    """
+    Logs matching a search
+
+    Args:
+        device_pks: Devices searched
+        start, end: created_at range (selects the partitions scanned)
+        text: Search query, matched against description / message parameters /
+            error message / event type
+        event_types: Event types kept
+        success: Keep successful (True) or failed (False) events only
+        user: User pk
+
+    Returns:
+        QuerySet: DeviceLog rows
+    """
+    queryset = DeviceLog.objects.filter(
+        device_id__in=device_pks,
+        created_at__gte=start,
+        created_at__lt=end
+    )
+    if text:
+        queryset = queryset.filter(text_filter(text))
+    if event_types:
+        queryset = queryset.filter(event_type__in=event_types)
+    if success is not None:
+        queryset = queryset.filter(success=success)
+    if user is not None:
+        queryset = queryset.filter(user_id=user)
+    return queryset
+
+
+def _top(counter, labels=None):
+    facet = []
+    for value, count in counter.most_common(FACET_SIZE):
+        entry = {'value': str(value) if value is not None else None, 'count': count}
+        if labels is not None:
+            entry['label'] = labels.get(value)
+        facet.append(entry)
+    return facet
+
+
+def search_facets(queryset):
+    """
+    Facet counts of a search
+
+    Returns:
+        dict: Top values per facet, and whether the counts cover every
+        match (exact) or the FACET_SAMPLE most recent ones
+    """
+    rows = list(
+        queryset.order_by('-created_at').values_list('event_type', 'success', 'device_id', 'user_id')[:FACET_SAMPLE + 1]
+    )
+    exact = len(rows) <= FACET_SAMPLE
+    rows = rows[:FACET_SAMPLE]
+
+    event_types = Counter(row[0] for row in rows)
+    successes = Counter(row[1] for row in rows)
+    devices = Counter(row[2] for row in rows)
+    users = Counter(row[3] for row in rows)
+
+    device_names = dict(Device.objects.filter(
+        pk__in=[pk for pk, _ in devices.most_common(FACET_SIZE)]
+    ).values_list('pk', 'name'))
+    user_emails = dict(get_user_model().objects.filter(
+        pk__in=[pk for pk, _ in users.most_common(FACET_SIZE) if pk is not None]
+    ).values_list('pk', 'email'))
+
+    return {
+        'exact': exact,
+        'matched': len(rows),
+        'event_type': _top(event_types),
+        'success': [{'value': value, 'count': count} for value, count in successes.most_common()],
+        'device': _top(devices, device_names),
+        'user': _top(users, user_emails),
+    }
@@ -2,18 +2,35 @@
 Device serializers
 """
 
+import uuid
 from datetime import timedelta
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 from rest_framework import serializers
 
+from .messages import describe, render_message
 from .models import Device, DeviceLog, DeviceSharing
+from .permissions import CanViewDeviceLogs
+from .recent import get_recent_events
+from .rollups import get_access_summary
 from apps.access.models import PINCode, NFCCard, GuestAccess
 from apps.users.serializers import UserSerializer
 
 User = get_user_model()
 
 
+def recent_event_representation(event):
+    """Event of the recent events ring (apps.devices.recent)"""
+    return {
+        'id': str(event['id']),
+        'event_type': event['event_type'],
+        'description': describe(event),
+        'success': event['success'],
+        'user': str(event['user_id']) if event['user_id'] else None,
+        'created_at': event['created_at'],
+    }
+
+
 class DeviceListSerializer(serializers.ModelSerializer):
     """
     Lightweight serializer for device list (optimized for list view)
@@ -21,6 +38,7 @@ class DeviceListSerializer(serializers.ModelSerializer):
     """
     is_battery_low = serializers.BooleanField(read_only=True)
     is_shared = serializers.SerializerMethodField()
+    last_activity = serializers.SerializerMethodField()
 
     class Meta:
         model = Device
@@ -40,6 +58,7 @@ class DeviceListSerializer(serializers.ModelSerializer):
             'last_seen',
             'last_unlock',
             'is_shared',  # Indicates if this is a shared device
+            'last_activity',
         ]
 
     def get_is_shared(self, obj):
@@ -51,6 +70,17 @@ class DeviceListSerializer(serializers.ModelSerializer):
             return obj.owner != request.user
         return False
 
+    def get_last_activity(self, obj):
+        """
+        Latest event, from the recent events ring (the list view fetches
+        them for every device at once into context['recent_events'])
+        """
+        recent = self.context.get('recent_events')
+        if recent is None:
+            recent = get_recent_events([obj.pk], limit=1)
+        events = recent.get(obj.pk)
+        return recent_event_representation(events[0]) if events else None
+
 
 class DeviceSerializer(serializers.ModelSerializer):
     """
@@ -177,35 +207,26 @@ class DeviceSerializer(serializers.ModelSerializer):
 
     def get_access_stats(self, obj):
         """
-        Get access statistics for this device
+        Get access statistics for this device (last 30 days, from daily rollups)
         """
-        # Get logs from last 30 days
-        thirty_days_ago = timezone.now() - timedelta(days=30)
-        recent_logs = DeviceLog.objects.filter(
-            device=obj,
-            created_at__gte=thirty_days_ago
-        )
-
-        # Count successful unlocks
-        successful_unlocks = recent_logs.filter(
-            event_type__in=['UNLOCK_NFC', 'UNLOCK_PIN', 'UNLOCK_REMOTE'],
-            success=True
-        ).count()
-
-        # Count failed attempts
-        failed_attempts = recent_logs.filter(success=False).count()
-
-        # Get most recent activity
-        last_activity = recent_logs.order_by('-created_at').first()
+        summary = get_access_summary(obj, days=30)
+        request = self.context.get('request')
+        if request is None or CanViewDeviceLogs().has_object_permission(request, None, obj):
+            recent = get_recent_events([obj.pk])[obj.pk]
+        else:
+            recent = []
 
         return {
-            'total_unlocks_30d': successful_unlocks,
-            'failed_attempts_30d': failed_attempts,
-            'last_activity': {
-                'event_type': last_activity.event_type if last_activity else None,
-                'description': last_activity.description if last_activity else None,
-                'created_at': last_activity.created_at if last_activity else None,
-            } if last_activity else None,
+            'total_unlocks_30d': summary['pin_unlocks'] + summary['nfc_unlocks'],
+            'failed_attempts_30d': summary['failed_attempts'],
+            'unlocks_by_method_30d': {
+                'app': summary['app_unlocks'],
+                'pin': summary['pin_unlocks'],
+                'nfc': summary['nfc_unlocks'],
+                'physical': summary['physical_unlocks'],
+            },
+            'last_activity': recent_event_representation(recent[0]) if recent else None,
+            'recent_events': [recent_event_representation(event) for event in recent],
         }
 
 
@@ -247,12 +268,70 @@ class DeviceUnlockSerializer(serializers.Serializer):
     )
 
 
+class DeviceLogExportSerializer(serializers.Serializer):
+    """
+    Query parameters of a device log export
+    """
+    devices = serializers.CharField(
+        required=False,
+        help_text='Comma-separated device IDs (default: every device you can read)'
+    )
+    start = serializers.DateTimeField(required=False, help_text='From (inclusive, default: 30 days ago)')
+    end = serializers.DateTimeField(required=False, help_text='To (exclusive, default: now)')
+    type = serializers.ChoiceField(choices=['csv', 'ndjson'], default='csv')
+    gzip = serializers.BooleanField(default=False)
+
+    def validate_devices(self, value):
+        try:
+            return [uuid.UUID(part.strip()) for part in value.split(',') if part.strip()]
+        except ValueError:
+            raise serializers.ValidationError('Invalid device ID')
+
+    def validate(self, attrs):
+        attrs.setdefault('end', timezone.now())
+        attrs.setdefault('start', attrs['end'] - timedelta(days=30))
+        if attrs['start'] >= attrs['end']:
+            raise serializers.ValidationError('start must be before end')
+        return attrs
+
+
+class DeviceLogSearchSerializer(serializers.Serializer):
+    """
+    Query parameters of a device log search
+    """
+    MAX_DAYS = 366
+
+    q = serializers.CharField(required=False, allow_blank=True, max_length=200,
+                              help_text='Search text ("phrase", -exclude, or)')
+    devices = serializers.CharField(
+        required=False,
+        help_text='Comma-separated device IDs (default: every device you can read)'
+    )
+    event_type = serializers.MultipleChoiceField(choices=DeviceLog.EVENT_TYPE_CHOICES, required=False)
+    success = serializers.BooleanField(required=False, allow_null=True, default=None)
+    user = serializers.UUIDField(required=False)
+    start = serializers.DateTimeField(required=False, help_text='From (inclusive, default: 30 days ago)')
+    end = serializers.DateTimeField(required=False, help_text='To (exclusive, default: now)')
+
+    validate_devices = DeviceLogExportSerializer.validate_devices
+
+    def validate(self, attrs):
+        attrs.setdefault('end', timezone.now())
+        attrs.setdefault('start', attrs['end'] - timedelta(days=30))
+        if attrs['start'] >= attrs['end']:
+            raise serializers.ValidationError('start must be before end')
+        if attrs['end'] - attrs['start'] > timedelta(days=self.MAX_DAYS):
+            raise serializers.ValidationError(f'The range can span at most {self.MAX_DAYS} days')
+        return attrs
+
+
 class DeviceLogSerializer(serializers.ModelSerializer):
     """
     Device log serializer
     """
     user = UserSerializer(read_only=True)
     device_name = serializers.CharField(source='device.name', read_only=True)
+    description = serializers.CharField(source='get_description', read_only=True)
 
     class Meta:
         model = DeviceLog
@@ -266,11 +345,79 @@ class DeviceLogSerializer(serializers.ModelSerializer):
             'ip_address',
             'success',
             'error_message',
+            'attempt_count',
             'created_at',
         ]
         read_only_fields = ['id', 'created_at']
 
 
+class DeviceLogRowSerializer:
+    """
+    Read-only DeviceLog serializer for list pages
+    Renders rows fetched with values() (user and device name JOINed in the
+    same query) to the same JSON as DeviceLogSerializer, without per-row
+    field dispatch or related object queries.
+    """
+    USER_FIELDS = (
+        'email', 'phone', 'first_name', 'last_name', 'is_active',
+        'email_verified', 'phone_verified',
+    )
+    VALUES = (
+        'id', 'device_id', 'device__name', 'user_id', 'event_type',
+        'message', 'message_params', 'description',
+        'ip_address', 'success', 'error_message', 'attempt_count', 'created_at',
+        'user__created_at', 'user__updated_at',
+        *(f'user__{field}' for field in USER_FIELDS),
+    )
+
+    def __init__(self):
+        # Same date rendering as the model serializers (DATETIME_FORMAT, timezone)
+        self.format_datetime = serializers.DateTimeField().to_representation
+
+    @classmethod
+    def values(cls, queryset):
+        """Only the columns rendered, as dicts"""
+        return queryset.values(*cls.VALUES)
+
+    def user_representation(self, row):
+        if row['user_id'] is None:
+            return None
+        user = {field: row[f'user__{field}'] for field in self.USER_FIELDS}
+        full_name = f"{user['first_name']} {user['last_name']}".strip()
+        return {
+            'id': str(row['user_id']),
+            'email': user['email'],
+            'phone': user['phone'],
+            'first_name': user['first_name'],
+            'last_name': user['last_name'],
+            'full_name': full_name or user['email'],
+            'is_active': user['is_active'],
+            'email_verified': user['email_verified'],
+            'phone_verified': user['phone_verified'],
+            'created_at': self.format_datetime(row['user__created_at']),
+            'updated_at': self.format_datetime(row['user__updated_at']),
+        }
+
+    def to_representation(self, row):
+        return {
+            'id': str(row['id']),
+            'device': str(row['device_id']),
+            'device_name': row['device__name'],
+            'user': self.user_representation(row),
+            'event_type': row['event_type'],
+            # Archived rows written before message codes have none
+            'description': render_message(row.get('message'), row.get('message_params'), row['description']),
+            'ip_address': str(row['ip_address']) if row['ip_address'] is not None else None,
+            'success': row['success'],
+            'error_message': row['error_message'],
+            'attempt_count': row['attempt_count'],
+            'created_at': self.format_datetime(row['created_at']),
+        }
+
+    def many(self, rows):
+        return [self.to_representation(row) for row in rows]
+
+
 class DeviceSharingSerializer(serializers.ModelSerializer):
     """
     Device sharing serializer
@@ -5,10 +5,14 @@ Device signals
 from django.db.models.signals import post_save, pre_save
 from django.dispatch import receiver
 from .models import Device, DeviceLog
+from apps.core.utils.encryption import invalidate_hmac_context
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Fields whose changes are tracked in device_pre_save
+TRACKED_FIELDS = {'is_locked', 'is_online', 'device_secret'}
+
 
 @receiver(post_save, sender=Device)
 def device_post_save(sender, instance, created, **kwargs):
@@ -24,19 +28,32 @@ def device_pre_save(sender, instance, **kwargs):
     """
     Pre-save signal for Device
     """
+    update_fields = kwargs.get('update_fields')
+    tracked = TRACKED_FIELDS if update_fields is None else TRACKED_FIELDS.intersection(update_fields)
+    if not tracked:
+        # Partial save that cannot change tracked state (e.g. last_unlock on verify)
+        return
+
     if instance.pk:
         try:
-            old_instance = Device.objects.get(pk=instance.pk)
+            old_instance = Device.objects.only(*tracked, 'secret_version').get(pk=instance.pk)
             
             # Detect lock state change
-            if old_instance.is_locked != instance.is_locked:
+            if 'is_locked' in tracked and old_instance.is_locked != instance.is_locked:
                 event_type = 'LOCK' if instance.is_locked else 'UNLOCK'
                 logger.info(f"Device {instance.device_id} {event_type}")
             
             # Detect online/offline change
-            if old_instance.is_online != instance.is_online:
+            if 'is_online' in tracked and old_instance.is_online != instance.is_online:
                 status = 'ONLINE' if instance.is_online else 'OFFLINE'
                 logger.info(f"Device {instance.device_id} {status}")
+
+            # Detect secret rotation
+            if 'device_secret' in tracked and old_instance.device_secret != instance.device_secret:
+                if instance.secret_version == old_instance.secret_version:
+                    instance.secret_version = old_instance.secret_version + 1
+                invalidate_hmac_context(instance.pk)
+                logger.info(f"Device {instance.device_id} secret rotated (v{instance.secret_version})")
                 
         except Device.DoesNotExist:
             pass
\ No newline at end of file
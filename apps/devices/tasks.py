@@ -11,7 +11,9 @@ from celery import shared_task
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 
-from .models import Device, DeviceLog
+from .log_writer import emit_device_log
+from .messages import LogMessage
+from .models import Device
 from apps.core.utils.encryption import generate_hmac_signature
 from mqtt.client import mqtt_publish
 
@@ -20,7 +22,7 @@ User = get_user_model()
 
 
 @shared_task
-def send_unlock_command(device_id, user_id, duration=5, ip_address=None):
+def send_unlock_command(device_id, user_id, duration=5, ip_address=None, user_agent=''):
     """
     Send unlock command to device via MQTT
     """
@@ -40,7 +42,9 @@ def send_unlock_command(device_id, user_id, duration=5, ip_address=None):
             'signature': generate_hmac_signature(
                 device.device_id,
                 str(timestamp),
-                device.device_secret
+                device.device_secret,
+                device_pk=device.pk,
+                secret_version=device.secret_version
             )
         }
         
@@ -49,12 +53,14 @@ def send_unlock_command(device_id, user_id, duration=5, ip_address=None):
         mqtt_publish(topic, json.dumps(payload))
         
         # Log event
-        DeviceLog.objects.create(
+        emit_device_log(
             device=device,
             user=user,
             event_type='UNLOCK_APP',
-            description=f'Unlock command sent via app (duration: {duration}s)',
+            message=LogMessage.UNLOCK_COMMAND,
+            message_params={'duration': duration},
             ip_address=ip_address,
+            user_agent=user_agent,
             success=True
         )
         
@@ -67,7 +73,7 @@ def send_unlock_command(device_id, user_id, duration=5, ip_address=None):
 
 
 @shared_task
-def send_lock_command(device_id, user_id, ip_address=None):
+def send_lock_command(device_id, user_id, ip_address=None, user_agent=''):
     """
     Send lock command to device via MQTT
     """
@@ -85,19 +91,22 @@ def send_lock_command(device_id, user_id, ip_address=None):
             'signature': generate_hmac_signature(
                 device.device_id,
                 str(timestamp),
-                device.device_secret
+                device.device_secret,
+                device_pk=device.pk,
+                secret_version=device.secret_version
             )
         }
         
         topic = f"device/{device.device_id}/command"
         mqtt_publish(topic, json.dumps(payload))
         
-        DeviceLog.objects.create(
+        emit_device_log(
             device=device,
             user=user,
             event_type='LOCK',
-            description='Lock command sent via app',
+            message=LogMessage.LOCK_COMMAND,
             ip_address=ip_address,
+            user_agent=user_agent,
             success=True
         )
         
@@ -115,12 +124,10 @@ def log_device_event(device_id, event_type, description='', user_id=None, succes
     Log device event
     """
     try:
-        device = Device.objects.get(id=device_id)
-        user = User.objects.get(id=user_id) if user_id else None
-        
-        DeviceLog.objects.create(
-            device=device,
-            user=user,
+        # Rows of unknown devices are dropped by the writer
+        emit_device_log(
+            device_id=device_id,
+            user_id=user_id,
             event_type=event_type,
             description=description,
             success=success
@@ -210,4 +217,34 @@ def check_device_battery_status():
         return {'success': True, 'count': low_battery_devices.count()}
     except Exception as e:
         logger.error(f"Error checking battery status: {str(e)}")
-        return {'success': False, 'error': str(e)}
\ No newline at end of file
+        return {'success': False, 'error': str(e)}
+
+@shared_task
+def maintain_log_partitions():
+    """
+    Create upcoming DeviceLog partitions and remove expired ones (Periodic task)
+    """
+    from .partitions import create_future_partitions, is_partitioned, remove_expired_partitions
+
+    if not is_partitioned():
+        return {'success': False, 'error': 'device_logs is not partitioned'}
+
+    created = create_future_partitions()
+    expired = remove_expired_partitions()
+    return {'success': True, 'created': created, 'expired': expired}
+
+
+@shared_task
+def archive_old_device_logs():
+    """
+    Move whole months of DeviceLog rows past the archive age to the
+    compressed archive (Periodic task)
+    """
+    from .archive import archive_device_logs
+
+    months = archive_device_logs()
+    return {
+        'success': True,
+        'months': [f'{month:%Y-%m}' for month, _ in months],
+        'rows': sum(count for _, count in months),
+    }
@@ -0,0 +1,74 @@
+"""
+Tests for the device log stream writer
+"""
+
+import json
+import time
+from unittest import mock, skipIf
+
+from django.test import TransactionTestCase, override_settings
+
+from apps.devices import log_writer
+from apps.devices.models import Device, DeviceLog
+from apps.users.models import User
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+@skipIf(fakeredis is None, 'fakeredis is not installed')
+@override_settings(DEVICE_LOG_WRITER={'MAX_WAIT': 0.05, 'MAX_DELIVERIES': 2})
+class StreamWriterDeadLetterTests(TransactionTestCase):
+    """A row the database rejects must not block the rows behind it"""
+
+    def setUp(self):
+        self.client = fakeredis.FakeRedis()
+        user = User.objects.create_user(email='owner@example.com', password='testpass123')
+        with mock.patch('apps.access.tasks.sync_device_credentials.apply_async'):
+            self.device = Device.objects.create(owner=user, device_id='ESP32_WRITER', name='Writer')
+
+    def _add(self, row):
+        raw = json.dumps(row, cls=log_writer.RowEncoder)
+        self.client.xadd(log_writer.STREAM_KEY, {'row': raw})
+        return raw
+
+    def _row(self, description):
+        return log_writer._serialize(DeviceLog(device=self.device, event_type='LOCK', description=description))
+
+    def _run(self, seconds=5):
+        deadline = time.monotonic() + seconds
+
+        def should_stop():
+            return time.monotonic() >= deadline or not self.client.xlen(log_writer.STREAM_KEY)
+
+        with mock.patch.object(log_writer, 'get_redis', return_value=self.client), \
+                mock.patch.object(log_writer.time, 'sleep'):
+            log_writer.run_stream_writer(should_stop, consumer='test-writer')
+
+    def test_rejected_row_is_dead_lettered(self):
+        self._add(self._row('before'))
+        bad = self._add({**self._row('bad'), 'device_id': 'not-a-uuid'})
+        self._add(self._row('after'))
+
+        self._run()
+
+        self.assertEqual(
+            sorted(DeviceLog.objects.values_list('description', flat=True)),
+            ['after', 'before']
+        )
+        dead = self.client.xrange(log_writer.DEAD_LETTER_KEY)
+        self.assertEqual(len(dead), 1)
+        self.assertEqual(dead[0][1][b'row'].decode(), bad)
+        self.assertEqual(self.client.xlen(log_writer.STREAM_KEY), 0)
+        self.assertEqual(self.client.xpending(log_writer.STREAM_KEY, log_writer.CONSUMER_GROUP)['pending'], 0)
+
+    def test_database_unavailable_keeps_rows_pending(self):
+        self._add(self._row('kept'))
+
+        with mock.patch.object(log_writer, 'write_device_logs', side_effect=log_writer.OperationalError('db down')):
+            self._run(seconds=1)
+
+        self.assertEqual(self.client.xlen(log_writer.DEAD_LETTER_KEY), 0)
+        self.assertEqual(self.client.xpending(log_writer.STREAM_KEY, log_writer.CONSUMER_GROUP)['pending'], 1)
@@ -19,6 +19,9 @@ urlpatterns = [
     
     # Device Logs
     path('<uuid:pk>/logs/', views.DeviceLogsView.as_view(), name='device-logs'),
+    path('logs/export/', views.DeviceLogExportView.as_view(), name='device-logs-export'),
+    path('logs/search/', views.DeviceLogSearchView.as_view(), name='device-logs-search'),
+    path('activity/', views.ActivityFeedView.as_view(), name='device-activity-feed'),
     
     # Device Sharing
     path('<uuid:pk>/sharing/', views.DeviceSharingListView.as_view(), name='device-sharing-list'),
@@ -0,0 +1,57 @@
+"""
+Interned user agents
+Device logs reference a UserAgent row instead of repeating the string.
+The log writer resolves the strings of each batch in the same transaction
+as the insert; ids are cached per process once that transaction commits.
+"""
+
+import hashlib
+
+from django.db import transaction
+
+from .models import UserAgent
+
+CACHE_SIZE = 4096
+MAX_LENGTH = 1024
+
+_cache = {}
+
+
+def _digest(value):
+    return hashlib.sha256(value.encode()).hexdigest()
+
+
+def _remember(resolved):
+    if len(_cache) + len(resolved) > CACHE_SIZE:
+        _cache.clear()
+    _cache.update(resolved)
+
+
+def intern_user_agents(values):
+    """
+    UserAgent ids of user agent strings, creating the missing rows
+
+    Args:
+        values: User agent strings (empty ones are ignored)
+
+    Returns:
+        dict: string -> UserAgent id
+    """
+    values = {value[:MAX_LENGTH] for value in values if value}
+    resolved = {value: _cache[value] for value in values if value in _cache}
+    missing = {_digest(value): value for value in values if value not in resolved}
+    if not missing:
+        return resolved
+
+    UserAgent.objects.bulk_create(
+        [UserAgent(digest=digest, value=value) for digest, value in missing.items()],
+        ignore_conflicts=True
+    )
+    new = {
+        missing[digest]: pk
+        for digest, pk in UserAgent.objects.filter(digest__in=missing).values_list('digest', 'pk')
+    }
+    # Only cache ids that will exist for other transactions
+    transaction.on_commit(lambda: _remember(new))
+    resolved.update(new)
+    return resolved
@@ -6,12 +6,18 @@ from rest_framework import status, generics, permissions
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.decorators import action
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
-from drf_spectacular.utils import extend_schema, OpenApiResponse
+from datetime import timedelta
+from drf_spectacular.utils import extend_schema, OpenApiParameter, OpenApiResponse
 import logging
 
+from .archive import get_archive_watermark, read_archived_page
+from .export import FORMATS, export_rows, readable_devices, stream_device_logs
 from .models import Device, DeviceLog, DeviceSharing
+from .recent import get_recent_events
+from .search import search_device_logs, search_facets
 from .serializers import (
     DeviceSerializer,
     DeviceListSerializer,
@@ -19,10 +25,13 @@ from .serializers import (
     DeviceUpdateSerializer,
     DeviceUnlockSerializer,
     DeviceLogSerializer,
+    DeviceLogRowSerializer,
+    DeviceLogExportSerializer,
+    DeviceLogSearchSerializer,
     DeviceSharingSerializer,
     DeviceSharingCreateSerializer,
 )
-from .permissions import IsDeviceOwner, IsDeviceOwnerOrShared, CanUnlockDevice
+from .permissions import IsDeviceOwner, IsDeviceOwnerOrShared, CanUnlockDevice, CanViewDeviceLogs
 from .tasks import (
     send_unlock_command,
     send_lock_command,
@@ -30,7 +39,8 @@ from .tasks import (
     auto_unlock_if_no_response,
     auto_lock_if_no_response,
 )
-from apps.core.throttling import UnlockRateThrottle
+from apps.core.pagination import KeysetPagination, MergedKeysetPagination
+from apps.core.throttling import ExportRateThrottle, UnlockRateThrottle
 
 logger = logging.getLogger(__name__)
 
@@ -63,11 +73,19 @@ class DeviceListCreateView(generics.ListCreateAPIView):
         responses={200: DeviceListSerializer(many=True)}
     )
     def get(self, request, *args, **kwargs):
-        queryset = self.get_queryset()
-        serializer = DeviceListSerializer(queryset, many=True, context={'request': request})
+        devices = list(self.get_queryset())
+        # Latest event of every device whose logs the user can read, in
+        # one Redis round trip
+        readable = set(readable_devices(request.user).values_list('pk', flat=True))
+        recent_events = get_recent_events([device.pk for device in devices if device.pk in readable], limit=1)
+        serializer = DeviceListSerializer(
+            devices,
+            many=True,
+            context={'request': request, 'recent_events': recent_events}
+        )
         return Response({
             'success': True,
-            'count': queryset.count(),
+            'count': len(devices),
             'data': serializer.data
         })
 
@@ -116,7 +134,7 @@ class DeviceDetailView(generics.RetrieveUpdateDestroyAPIView):
         device = self.get_object()
         return Response({
             'success': True,
-            'data': DeviceSerializer(device).data
+            'data': DeviceSerializer(device, context={'request': request}).data
         })
 
     @extend_schema(
@@ -135,7 +153,7 @@ class DeviceDetailView(generics.RetrieveUpdateDestroyAPIView):
         return Response({
             'success': True,
             'message': 'Device updated successfully',
-            'data': DeviceSerializer(device).data
+            'data': DeviceSerializer(device, context={'request': request}).data
         })
 
     @extend_schema(
@@ -200,6 +218,7 @@ class DeviceUnlockView(APIView):
             user_id=str(request.user.id),
             duration=duration,
             ip_address=request.META.get('REMOTE_ADDR'),
+            user_agent=request.META.get('HTTP_USER_AGENT', ''),
         )
 
         # Schedule auto-unlock after 3 seconds if no MQTT response (for testing/fallback)
@@ -246,6 +265,7 @@ class DeviceLockView(APIView):
             device_id=str(device.id),
             user_id=str(request.user.id),
             ip_address=request.META.get('REMOTE_ADDR'),
+            user_agent=request.META.get('HTTP_USER_AGENT', ''),
         )
 
         # Schedule auto-lock after 3 seconds if no MQTT response (for testing/fallback)
@@ -293,33 +313,192 @@ class DeviceStatusView(APIView):
 
 class DeviceLogsView(generics.ListAPIView):
     """
-    Get device activity logs
+    Get device activity logs, newest first (cursor pagination)
     """
     serializer_class = DeviceLogSerializer
-    permission_classes = [permissions.IsAuthenticated, IsDeviceOwnerOrShared]
+    permission_classes = [permissions.IsAuthenticated, CanViewDeviceLogs]
+    pagination_class = KeysetPagination
+
+    # Default / max history returned (keeps scans to the recent partitions)
+    DEFAULT_DAYS = 30
+    MAX_DAYS = 366
+
+    def get_since(self):
+        # Filter by date range
+        try:
+            days = int(self.request.query_params.get('days', self.DEFAULT_DAYS))
+        except ValueError:
+            days = self.DEFAULT_DAYS
+        days = min(max(days, 1), self.MAX_DAYS)
+        return timezone.now() - timedelta(days=days)
 
     def get_queryset(self):
-        device_id = self.kwargs.get('pk')
-        return DeviceLog.objects.filter(device_id=device_id)
+        since = self.get_since()
+        # Rows before the archive watermark are read from the archive
+        watermark = get_archive_watermark()
+        if watermark is not None:
+            since = max(since, watermark)
+
+        return DeviceLog.objects.filter(
+            device_id=self.kwargs.get('pk'),
+            created_at__gte=since
+        )
+
+    def get_archived_rows(self, boundary, reverse, limit):
+        """Archived rows of the page (KeysetPagination hook)"""
+        watermark = get_archive_watermark()
+        since = self.get_since()
+        if watermark is None or since >= watermark:
+            return []
+
+        rows = read_archived_page(self.device.pk, since, watermark, boundary, reverse, limit)
+        for row in rows:
+            row['device__name'] = self.device.name
+        return rows
 
     @extend_schema(
         tags=['Devices'],
         responses={200: DeviceLogSerializer(many=True)}
     )
     def get(self, request, *args, **kwargs):
-        queryset = self.get_queryset()
-        page = self.paginate_queryset(queryset)
-        
-        if page is not None:
-            serializer = self.get_serializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
-        
-        serializer = self.get_serializer(queryset, many=True)
-        return Response({
-            'success': True,
-            'count': queryset.count(),
-            'data': serializer.data
-        })
+        self.device = get_object_or_404(Device.objects.select_related('owner'), pk=self.kwargs.get('pk'))
+        self.check_object_permissions(request, self.device)
+
+        # One query per page: needed columns only, user / device JOINed
+        rows = DeviceLogRowSerializer.values(self.get_queryset())
+        page = self.paginate_queryset(rows)
+        return self.get_paginated_response(DeviceLogRowSerializer().many(page))
+
+
+class ActivityFeedView(generics.GenericAPIView):
+    """
+    Activity of every device the user can read (owned, or shared with log
+    access), merged newest first (cursor pagination)
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = MergedKeysetPagination
+
+    DEFAULT_DAYS = 7
+    MAX_DAYS = 31
+
+    def get_merge_ranges(self):
+        """One index range per device (MergedKeysetPagination)"""
+        return 'device_id', self.device_pks
+
+    @extend_schema(
+        tags=['Devices'],
+        parameters=[OpenApiParameter('days', int, description=f'History in days (default {DEFAULT_DAYS}, max {MAX_DAYS})')],
+        responses={200: DeviceLogSerializer(many=True)}
+    )
+    def get(self, request):
+        try:
+            days = int(request.query_params.get('days', self.DEFAULT_DAYS))
+        except ValueError:
+            days = self.DEFAULT_DAYS
+        days = min(max(days, 1), self.MAX_DAYS)
+
+        self.device_pks = list(readable_devices(request.user).values_list('pk', flat=True))
+        logs = DeviceLog.objects.filter(
+            device_id__in=self.device_pks,
+            created_at__gte=timezone.now() - timedelta(days=days)
+        )
+        page = self.paginate_queryset(DeviceLogRowSerializer.values(logs))
+        return self.get_paginated_response(DeviceLogRowSerializer().many(page))
+
+
+class DeviceLogSearchView(generics.GenericAPIView):
+    """
+    Full-text search over the logs of the devices a user can read, newest
+    first (cursor pagination), with facet counts on the first page
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
+
+    @extend_schema(
+        tags=['Devices'],
+        parameters=[DeviceLogSearchSerializer],
+        responses={
+            200: DeviceLogSerializer(many=True),
+            403: OpenApiResponse(description='No access to a requested device'),
+        }
+    )
+    def get(self, request):
+        serializer = DeviceLogSearchSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+
+        readable = set(readable_devices(request.user).values_list('pk', flat=True))
+        device_pks = params.get('devices') or list(readable)
+        if not set(device_pks) <= readable:
+            return Response({
+                'success': False,
+                'message': 'You do not have access to one or more devices'
+            }, status=status.HTTP_403_FORBIDDEN)
+
+        logs = search_device_logs(
+            device_pks,
+            params['start'],
+            params['end'],
+            text=params.get('q', '').strip(),
+            event_types=params.get('event_type'),
+            success=params['success'],
+            user=params.get('user'),
+        )
+        page = self.paginate_queryset(DeviceLogRowSerializer.values(logs))
+        response = self.get_paginated_response(DeviceLogRowSerializer().many(page))
+        if not request.query_params.get(self.paginator.cursor_query_param):
+            response.data['facets'] = search_facets(logs)
+        return response
+
+
+class DeviceLogExportView(APIView):
+    """
+    Export device logs as a CSV / NDJSON download, streamed from a
+    server-side cursor (constant memory whatever the size)
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    throttle_classes = [ExportRateThrottle]
+
+    @extend_schema(
+        tags=['Devices'],
+        parameters=[DeviceLogExportSerializer],
+        responses={
+            200: OpenApiResponse(description='CSV or NDJSON file (gzip when requested)'),
+            403: OpenApiResponse(description='No access to a requested device'),
+        }
+    )
+    def get(self, request):
+        serializer = DeviceLogExportSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+
+        readable = set(readable_devices(request.user).values_list('pk', flat=True))
+        device_pks = params.get('devices') or list(readable)
+        if not set(device_pks) <= readable:
+            return Response({
+                'success': False,
+                'message': 'You do not have access to one or more devices'
+            }, status=status.HTTP_403_FORBIDDEN)
+
+        content_type, extension = FORMATS[params['type']]
+        filename = f"device-logs-{params['start']:%Y%m%d}-{params['end']:%Y%m%d}.{extension}"
+        if params['gzip']:
+            content_type, filename = 'application/gzip', filename + '.gz'
+
+        response = StreamingHttpResponse(
+            stream_device_logs(
+                export_rows(device_pks, params['start'], params['end']),
+                params['type'],
+                compress=params['gzip']
+            ),
+            content_type=content_type
+        )
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        # Let nginx pass chunks through instead of buffering the whole file
+        response['X-Accel-Buffering'] = 'no'
+
+        logger.info(f"Log export ({params['type']}) of {len(device_pks)} device(s) by {request.user.email}")
+        return response
 
 
 class DeviceSharingListView(generics.ListCreateAPIView):
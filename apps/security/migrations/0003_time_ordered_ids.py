@@ -0,0 +1,24 @@
+# Generated by Django 4.2.16 on 2026-10-19 01:44
+
+import apps.core.utils.uuid7
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('security', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='auditlog',
+            name='id',
+            field=models.UUIDField(default=apps.core.utils.uuid7.uuid7, editable=False, primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name='securityevent',
+            name='id',
+            field=models.UUIDField(default=apps.core.utils.uuid7.uuid7, editable=False, primary_key=True, serialize=False),
+        ),
+    ]
@@ -4,12 +4,12 @@ Security models - Audit logs and security events
 
 from django.db import models
 from django.contrib.auth import get_user_model
-from apps.core.models import TimeStampedModel, UUIDModel
+from apps.core.models import TimeOrderedUUIDModel, TimeStampedModel
 
 User = get_user_model()
 
 
-class SecurityEvent(TimeStampedModel, UUIDModel):
+class SecurityEvent(TimeStampedModel, TimeOrderedUUIDModel):
     """
     Security events and audit logs
     """
@@ -93,7 +93,7 @@ class SecurityEvent(TimeStampedModel, UUIDModel):
         return f"{self.event_type} - {self.severity} - {self.created_at}"
 
 
-class AuditLog(TimeStampedModel, UUIDModel):
+class AuditLog(TimeStampedModel, TimeOrderedUUIDModel):
     """
     Immutable audit logs (append-only)
     """
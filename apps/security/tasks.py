@@ -61,27 +61,23 @@ def generate_daily_report():
 @shared_task
 def cleanup_old_logs():
     """
-    Cleanup old logs (90 days retention)
+    Cleanup old security events (retention policy of SecurityEvent, see
+    apps.core.retention: resolved events past 90 days, archived first)
     """
-    from .models import SecurityEvent, AuditLog
+    from apps.core.retention import apply_retention
     
     try:
-        retention_days = 90
-        cutoff_date = timezone.now() - timedelta(days=retention_days)
+        result = apply_retention(labels=['security.SecurityEvent']).get('security.SecurityEvent', {})
+        if 'error' in result:
+            return {'success': False, 'error': result['error']}
         
-        # Delete old security events
-        deleted_events = SecurityEvent.objects.filter(
-            created_at__lt=cutoff_date,
-            resolved=True
-        ).delete()
-        
-        logger.info(f"Cleaned up {deleted_events[0]} old security events")
+        logger.info(f"Cleaned up {result.get('deleted', 0)} old security events")
         
         # Note: AuditLog is kept forever (compliance)
         
         return {
             'success': True,
-            'deleted_events': deleted_events[0],
+            'deleted_events': result.get('deleted', 0),
         }
         
     except Exception as e:
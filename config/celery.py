@@ -41,11 +41,31 @@ app.conf.beat_schedule = {
         'task': 'apps.access.tasks.clean_expired_guest_codes',
         'schedule': 3600.0,  # Every hour
     },
+    # Delete expired digital keys daily
+    'purge-expired-digital-keys': {
+        'task': 'apps.access.tasks.purge_expired_digital_keys',
+        'schedule': 86400.0,  # Every day
+    },
     # Check device battery status every 6 hours
     'check-device-battery': {
         'task': 'apps.devices.tasks.check_device_battery_status',
         'schedule': 21600.0,  # Every 6 hours
     },
+    # Create upcoming DeviceLog partitions, drop expired ones
+    'maintain-log-partitions': {
+        'task': 'apps.devices.tasks.maintain_log_partitions',
+        'schedule': 86400.0,  # Every day
+    },
+    # Move DeviceLog months past the archive age to compressed files
+    'archive-old-device-logs': {
+        'task': 'apps.devices.tasks.archive_old_device_logs',
+        'schedule': 86400.0,  # Every day
+    },
+    # Delete rows past their retention policy (apps.core.retention)
+    'apply-retention-policies': {
+        'task': 'apps.core.tasks.apply_retention_policies',
+        'schedule': 86400.0,  # Every day
+    },
     # Generate daily security report
     'daily-security-report': {
         'task': 'apps.security.tasks.generate_daily_report',
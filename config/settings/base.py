@@ -75,6 +75,7 @@ MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'corsheaders.middleware.CorsMiddleware',
+    'apps.core.middleware.admission.AdmissionControlMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -239,6 +240,18 @@ CACHES = {
         },
         'KEY_PREFIX': 'smartlock',
         'TIMEOUT': 300,  # 5 minutes default
+    },
+    # Same Redis with short timeouts, used on the device verify path
+    # (credential snapshots, token buckets, replay guard)
+    'snapshots': {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': REDIS_URL,
+        'OPTIONS': {
+            'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+            'SOCKET_CONNECT_TIMEOUT': 0.25,
+            'SOCKET_TIMEOUT': 0.25,
+        },
+        'KEY_PREFIX': 'smartlock',
     }
 }
 
@@ -259,6 +272,9 @@ else:
     CELERY_BROKER_URL = f'redis://{REDIS_HOST}:{REDIS_PORT}/{CELERY_BROKER_DB}'
 
 CELERY_RESULT_BACKEND = 'django-db'
+# Task results are pruned in chunks by the retention policies instead of
+# Celery's single-DELETE backend_cleanup
+CELERY_RESULT_EXPIRES = None
 CELERY_CACHE_BACKEND = 'default'
 
 CELERY_ACCEPT_CONTENT = ['application/json']
@@ -309,6 +325,13 @@ REST_FRAMEWORK = {
         'auth': '5/minute',
         'unlock': '20/hour',
         'verify': '100/hour',
+        'export': '30/hour',
+        # Public device endpoints: coarse per-IP guard (many locks per NAT),
+        # then token buckets keyed on the signed device identity
+        'verify_ip': '50000/day',
+        'verify_device': '120/minute',
+        'verify_credential': '20/minute',
+        'device_upload': '30/minute',
     },
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
     'EXCEPTION_HANDLER': 'apps.core.exceptions.custom_exception_handler',
@@ -389,6 +412,118 @@ MQTT_PASSWORD = env('MQTT_PASSWORD', default='')
 MQTT_KEEPALIVE = env.int('MQTT_KEEPALIVE', default=60)
 MQTT_CLIENT_ID = 'smartlock_backend'
 
+# Verify RPC over MQTT (device/{id}/verify): worker threads in the bridge,
+# and how long a request may wait for one before the lock has given up
+MQTT_VERIFY_THREADS = env.int('MQTT_VERIFY_THREADS', default=8)
+MQTT_VERIFY_MAX_WAIT_SECONDS = 5
+
+# ==============================================================================
+# DEVICE SECURITY
+# ==============================================================================
+
+# Max prepared HMAC contexts kept per process (one per device secret version)
+DEVICE_HMAC_CACHE_SIZE = env.int('DEVICE_HMAC_CACHE_SIZE', default=4096)
+
+# Max clock skew (seconds) accepted on signed device requests
+DEVICE_SIGNATURE_MAX_SKEW = 300
+
+# Expected signed requests per skew window per process (replay bloom filter size)
+DEVICE_REPLAY_BLOOM_CAPACITY = env.int('DEVICE_REPLAY_BLOOM_CAPACITY', default=200000)
+
+# Offline event batch uploads
+DEVICE_EVENT_BATCH_MAX = env.int('DEVICE_EVENT_BATCH_MAX', default=1000)
+DEVICE_EVENT_MAX_AGE_DAYS = 30
+
+# Degraded-mode verification when Postgres stalls
+VERIFY_DEGRADED_MODE = {
+    'FAILURE_THRESHOLD': 3,     # consecutive DB failures that open the circuit
+    'RECOVERY_TIMEOUT': 10,     # seconds before probing the DB again
+    'DB_DEADLINE': env.float('VERIFY_DB_DEADLINE', default=1.5),  # seconds
+    'DB_THREADS': 4,
+    'SPOOL_DIR': env('VERIFY_SPOOL_DIR', default=str(BASE_DIR / 'spool')),
+}
+
+# Failed verifications: one DeviceLog row per (device, type, reason) and
+# window; BRUTE_FORCE security event past the threshold
+VERIFY_FAILURE_AGGREGATION = {
+    'WINDOW': 60,
+    'SAMPLES': 5,
+    'BRUTE_FORCE_THRESHOLD': 20,
+    'BRUTE_FORCE_WINDOW': 300,
+}
+
+# Write-behind DeviceLog writer (manage.py run_device_log_writer)
+DEVICE_LOG_WRITER = {
+    'BATCH_SIZE': env.int('DEVICE_LOG_BATCH_SIZE', default=1000),
+    'MAX_WAIT': 1.0,
+    'STREAM_MAXLEN': 1000000,
+}
+
+# Latest events kept per device in Redis ("last activity" blocks)
+DEVICE_RECENT_EVENTS = 20
+
+# DeviceLog monthly partitions (PostgreSQL): pre-created ahead, whole
+# partitions past the retention are dropped (manage.py manage_log_partitions)
+DEVICE_LOG_PARTITIONS = {
+    'MONTHS_AHEAD': 3,
+    'RETENTION_MONTHS': env.int('DEVICE_LOG_RETENTION_MONTHS', default=12),
+    'DETACH': False,
+}
+
+# Cold archive: whole months of DeviceLog rows older than AFTER_MONTHS are
+# moved to gzip NDJSON files per device and month (manage.py archive_device_logs)
+DEVICE_LOG_ARCHIVE = {
+    'DIR': env('DEVICE_LOG_ARCHIVE_DIR', default=str(BASE_DIR / 'archive')),
+    'AFTER_MONTHS': env.int('DEVICE_LOG_ARCHIVE_AFTER_MONTHS', default=6),
+}
+
+# Retention of logs and bookkeeping tables (manage.py apply_retention):
+# expired rows are deleted in primary-key chunks, per-model policies in
+# apps.core.retention.DEFAULT_POLICIES (override or disable with None)
+DATA_RETENTION = {
+    'CHUNK_SIZE': env.int('RETENTION_CHUNK_SIZE', default=1000),
+    'SLEEP': env.float('RETENTION_SLEEP', default=0.1),
+    'LOCK_TIMEOUT': 2000,
+    'ARCHIVE_DIR': env('RETENTION_ARCHIVE_DIR', default=str(BASE_DIR / 'archive')),
+    'POLICIES': {},
+}
+
+# Cache alias of the Redis calls made before a verify request reaches the
+# breaker and its deadline (token buckets, replay guard)
+VERIFY_CACHE = 'snapshots'
+
+# Last-known credential snapshots (encrypted in Redis + per-process copy)
+CREDENTIAL_SNAPSHOT_CACHE = 'snapshots'
+CREDENTIAL_SNAPSHOT_TTL = 30 * 86400
+CREDENTIAL_SNAPSHOT_LOCAL_SIZE = env.int('CREDENTIAL_SNAPSHOT_LOCAL_SIZE', default=4096)
+
+# Offline digital keys (Ed25519-signed, verified by the lock)
+DIGITAL_KEY_DEFAULT_LIFETIME_MINUTES = env.int('DIGITAL_KEY_DEFAULT_LIFETIME_MINUTES', default=60)
+DIGITAL_KEY_MAX_LIFETIME_MINUTES = env.int('DIGITAL_KEY_MAX_LIFETIME_MINUTES', default=24 * 60)
+DIGITAL_KEY_REVOCATION_BATCH_SECONDS = 5
+
+# Credential sync to locks (seconds of changes batched into one version)
+CREDENTIAL_SYNC_BATCH_SECONDS = 5
+
+# Revocations of one device coalesced before the bridge pushes them (seconds)
+CREDENTIAL_REVOCATION_PUSH_WINDOW = 0.1
+
+# ==============================================================================
+# ADMISSION CONTROL
+# ==============================================================================
+
+# Per-process concurrency limits. Door-critical requests (verify, unlock,
+# lock, batch upload) are never limited; keep NON_CRITICAL_LIMIT below the
+# gunicorn --threads count so they always find a free thread.
+ADMISSION_CONTROL = {
+    'NON_CRITICAL_LIMIT': env.int('ADMISSION_NON_CRITICAL_LIMIT', default=3),
+    'BULK_LIMIT': env.int('ADMISSION_BULK_LIMIT', default=1),
+    'QUEUE_TIMEOUT': {
+        'interactive': 0.25,
+        'bulk': 0.0,
+    },
+}
+
 # ==============================================================================
 # LOGGING
 # ==============================================================================
@@ -15,14 +15,19 @@ from drf_spectacular.views import (
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
-from rest_framework.permissions import AllowAny
+from rest_framework.permissions import AllowAny, IsAdminUser
+
+from apps.core.middleware.admission import get_admission_stats
+from apps.access.degraded import get_verify_stats
+from apps.access.revocation import get_revocation_stats
+from apps.devices.log_writer import get_log_writer_stats
 
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def health_check(request):
     """
-    Health check endpoint for monitoring
+    Health check endpoint for monitoring (public, no internal state)
     """
     return Response({
         'status': 'healthy',
@@ -31,6 +36,20 @@ def health_check(request):
     }, status=status.HTTP_200_OK)
 
 
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def health_stats(request):
+    """
+    Operational counters of this worker process (staff only)
+    """
+    return Response({
+        'admission': get_admission_stats(),
+        'verify': get_verify_stats(),
+        'revocation': get_revocation_stats(),
+        'device_logs': get_log_writer_stats(),
+    }, status=status.HTTP_200_OK)
+
+
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def api_root(request):
@@ -56,6 +75,7 @@ urlpatterns = [
     
     # Health check
     path('health/', health_check, name='health-check'),
+    path('health/stats/', health_stats, name='health-stats'),
     
     # API Root
     path('api/', api_root, name='api-root'),
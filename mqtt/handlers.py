@@ -41,6 +41,15 @@ def handle_mqtt_message(topic, payload):
         elif topic.endswith('/alert'):
             handle_alert_message(device_id, payload)
         
+        elif topic.endswith('/events'):
+            handle_events_message(device_id, payload)
+        
+        elif topic.endswith('/verify'):
+            handle_verify_message(device_id, payload)
+        
+        elif topic.endswith('/credentials/ack'):
+            handle_credentials_ack_message(device_id, payload)
+        
         else:
             logger.warning(f"Unknown topic pattern: {topic}")
             
@@ -104,4 +113,37 @@ def handle_alert_message(device_id, payload):
         handle_tamper_detected(device_id, payload)
     
     else:
-        logger.warning(f"Unknown alert type: {alert_type}")
\ No newline at end of file
+        logger.warning(f"Unknown alert type: {alert_type}")
+
+
+def handle_events_message(device_id, payload):
+    """
+    Handle signed access event batches uploaded by devices
+    Topic: device/{device_id}/events
+    """
+    from apps.devices.mqtt_handlers import handle_event_batch
+    
+    logger.info(f"Event batch from {device_id}")
+    handle_event_batch(device_id, payload)
+
+
+def handle_credentials_ack_message(device_id, payload):
+    """
+    Handle credential bundle acks (and sync requests on boot)
+    Topic: device/{device_id}/credentials/ack
+    """
+    from apps.devices.mqtt_handlers import handle_credentials_ack
+    
+    logger.info(f"Credential bundle ack from {device_id}")
+    handle_credentials_ack(device_id, payload)
+
+
+def handle_verify_message(device_id, payload):
+    """
+    Handle PIN / NFC verify requests (answered on device/{device_id}/verify/reply)
+    Topic: device/{device_id}/verify
+    """
+    from apps.devices.mqtt_handlers import handle_verify_request
+    
+    logger.info(f"Verify request from {device_id}")
+    handle_verify_request(device_id, payload)
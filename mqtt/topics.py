@@ -20,6 +20,21 @@ class MQTTTopics:
     # Alert topics (Device -> Backend)
     DEVICE_ALERT = "device/{device_id}/alert"
     
+    # Event batch upload topics (Device -> Backend, ack Backend -> Device)
+    DEVICE_EVENTS = "device/{device_id}/events"
+    DEVICE_EVENTS_ACK = "device/{device_id}/events/ack"
+    
+    # Offline digital key state (Backend -> Device, retained)
+    DEVICE_KEYS = "device/{device_id}/keys"
+    
+    # Verify RPC (request Device -> Backend, reply Backend -> Device)
+    DEVICE_VERIFY = "device/{device_id}/verify"
+    DEVICE_VERIFY_REPLY = "device/{device_id}/verify/reply"
+    
+    # Credential sync (bundle Backend -> Device, ack Device -> Backend)
+    DEVICE_CREDENTIALS = "device/{device_id}/credentials"
+    DEVICE_CREDENTIALS_ACK = "device/{device_id}/credentials/ack"
+    
     @classmethod
     def get_command_topic(cls, device_id):
         """Get command topic for device"""
@@ -40,6 +55,36 @@ class MQTTTopics:
         """Get alert topic for device"""
         return cls.DEVICE_ALERT.format(device_id=device_id)
     
+    @classmethod
+    def get_events_topic(cls, device_id):
+        """Get event batch upload topic for device"""
+        return cls.DEVICE_EVENTS.format(device_id=device_id)
+    
+    @classmethod
+    def get_events_ack_topic(cls, device_id):
+        """Get event batch ack topic for device"""
+        return cls.DEVICE_EVENTS_ACK.format(device_id=device_id)
+    
+    @classmethod
+    def get_keys_topic(cls, device_id):
+        """Get digital key state topic for device"""
+        return cls.DEVICE_KEYS.format(device_id=device_id)
+    
+    @classmethod
+    def get_verify_reply_topic(cls, device_id):
+        """Get verify RPC reply topic for device"""
+        return cls.DEVICE_VERIFY_REPLY.format(device_id=device_id)
+    
+    @classmethod
+    def get_credentials_topic(cls, device_id):
+        """Get credential sync topic for device"""
+        return cls.DEVICE_CREDENTIALS.format(device_id=device_id)
+    
+    @classmethod
+    def get_credentials_ack_topic(cls, device_id):
+        """Get credential sync ack topic for device"""
+        return cls.DEVICE_CREDENTIALS_ACK.format(device_id=device_id)
+    
     @classmethod
     def get_all_device_topics(cls):
         """Get all device subscription topics (with wildcards)"""
@@ -47,4 +92,7 @@ class MQTTTopics:
             "device/+/status",
             "device/+/response",
             "device/+/alert",
+            "device/+/events",
+            "device/+/credentials/ack",
+            "device/+/verify",
         ]
\ No newline at end of file